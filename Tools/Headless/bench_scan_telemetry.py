@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import headlessctl  # noqa: E402
+
+
+METRIC_KEYS = [
+    "ai.task_latency_ticks.p95",
+    "ai.idle_with_work_ratio",
+    "move.stuck_ticks",
+    "space4x.hull.vessels",
+    "resource.stock.ore",
+    "power.battery_min_soc"
+]
+
+
+def write_sample_telemetry(path, lines, event_ratio, seed):
+    rng = random.Random(seed)
+    tick = 0
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(json.dumps({"type": "header", "tick": 0, "seed": seed, "scenario": "bench"}) + "\n")
+        for index in range(lines - 1):
+            if index % len(METRIC_KEYS) == 0:
+                tick += 1
+            if rng.random() < event_ratio:
+                record = {
+                    "type": "event",
+                    "tick": tick,
+                    "name": "intent_changed",
+                    "entity": rng.randint(1, 5000),
+                    "data": {"from": "idle", "to": "mine", "pos": [rng.random(), rng.random(), rng.random()]}
+                }
+            else:
+                key = METRIC_KEYS[index % len(METRIC_KEYS)]
+                record = {"type": "metric", "tick": tick, "key": key, "value": rng.random() * 100.0, "unit": "ticks", "loop": "main"}
+            handle.write(json.dumps(record) + "\n")
+
+
+class LegacyTelemetryScanner(headlessctl.TelemetryScanner):
+    # Per-line work of scan_telemetry before the decoder backends: stdlib
+    # json.loads followed by a recursive non-finite walk of every record.
+    def decode(self, raw_line):
+        record = json.loads(raw_line)
+        return record, headlessctl.contains_non_finite(record)
+
+    def is_resource_key(self, key):
+        return headlessctl.looks_like_resource_key(key)
+
+
+def legacy_format_metric_line(tick, key, value, unit, loop):
+    return json.dumps({
+        "tick": tick,
+        "key": key,
+        "value": value,
+        "unit": unit,
+        "loop": loop
+    }, sort_keys=True) + "\n"
+
+
+def legacy_scan(telemetry_path, run_dir):
+    format_metric_line = headlessctl.format_metric_line
+    headlessctl.format_metric_line = legacy_format_metric_line
+    try:
+        scanner = LegacyTelemetryScanner(run_dir, {})
+        with open(telemetry_path, "r", encoding="utf-8-sig", errors="replace") as handle:
+            for raw in handle:
+                scanner.feed(raw.rstrip("\n"))
+        return scanner.finish(telemetry_path)
+    finally:
+        headlessctl.format_metric_line = format_metric_line
+
+
+def time_case(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scan_telemetry decode throughput.")
+    parser.add_argument("--lines", type=int, default=200000, help="Telemetry lines to generate.")
+    parser.add_argument("--event-ratio", type=float, default=0.2, help="Fraction of non-metric records.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the best is reported.")
+    parser.add_argument("--telemetry", default="", help="Benchmark an existing telemetry.ndjson instead.")
+    parser.add_argument("--shards", type=int, default=0, help="Also time a sharded scan with this many processes.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_scan_telemetry_")
+    try:
+        telemetry_path = args.telemetry
+        if not telemetry_path:
+            telemetry_path = os.path.join(work_dir, "telemetry.ndjson")
+            write_sample_telemetry(telemetry_path, args.lines, args.event_ratio, 1337)
+        with open(telemetry_path, "rb") as handle:
+            line_count = sum(1 for _ in handle)
+
+        cases = [("legacy", lambda run_dir: legacy_scan(telemetry_path, run_dir))]
+        for decoder in headlessctl.JSON_DECODERS:
+            name, _ = headlessctl.resolve_json_decoder(decoder)
+            if name != decoder:
+                continue
+            cases.append((decoder, lambda run_dir, decoder=decoder: headlessctl.scan_telemetry(telemetry_path, run_dir, {}, decoder=decoder)))
+            cases.append((f"{decoder}+no_events", lambda run_dir, decoder=decoder: headlessctl.scan_telemetry(telemetry_path, run_dir, {}, keep_events=False, decoder=decoder)))
+        if args.shards > 1:
+            cases.append((f"sharded_{args.shards}", lambda run_dir: headlessctl.scan_telemetry(telemetry_path, run_dir, {}, shards=args.shards)))
+
+        results = {}
+        for label, fn in cases:
+            run_dir = os.path.join(work_dir, label)
+            os.makedirs(run_dir, exist_ok=True)
+            elapsed = time_case(lambda: fn(run_dir), args.repeat)
+            results[label] = {
+                "seconds": round(elapsed, 4),
+                "lines_per_sec": int(line_count / elapsed) if elapsed > 0 else None
+            }
+        baseline = results["legacy"]["seconds"]
+        for entry in results.values():
+            entry["speedup"] = round(baseline / entry["seconds"], 2) if entry["seconds"] else None
+
+        print(json.dumps({
+            "telemetry": telemetry_path if args.telemetry else None,
+            "lines": line_count,
+            "bytes": os.path.getsize(telemetry_path),
+            "results": results
+        }, indent=2, sort_keys=True))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,162 @@
 #!/usr/bin/env python3
+import array
+import ast
+import csv
 import datetime
+import functools
 import gzip
+import hashlib
+import heapq
+import io
 import json
 import math
+import multiprocessing
 import os
+import random
 import re
 import selectors
 import shutil
 import socket
+import socketserver
+import sqlite3
+import struct
 import subprocess
 import sys
 import tarfile
+import threading
 import time
 import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 TOOL_VERSION = "0.1.0"
 SCHEMA_VERSION = 1
 DEFAULT_TIMEOUT_S = 600
 DEFAULT_SESSION_LOCK_TTL_SEC = 90 * 60
+RUN_IN_FLIGHT_GRACE_SEC = DEFAULT_SESSION_LOCK_TTL_SEC
+DEFAULT_SLOT_MEMORY_MB = 2048
+STDOUT_READ_BYTES = 64 * 1024
+LOG_BUFFER_BYTES = 64 * 1024
+LOG_FLUSH_INTERVAL_S = 0.5
+ABORTABLE_INVARIANTS = (
+    "telemetry.no_nan_inf",
+    "telemetry.monotonic_tick",
+    "telemetry.no_negative_counts",
+    "telemetry.no_negative_resources"
+)
+CAP_ACTIONS = ("kill", "truncate")
+EVENT_CAP_ACTIONS = ("warn", "kill", "truncate")
+EVENT_CAP_SKIPPED_TYPES = ("metric", "invariant")
+STDOUT_MARKER_RE = re.compile(rb"^[ \t]*(BANK|TELEMETRY_OUT):[^\n]*", re.MULTILINE)
+FLOAT_OVERFLOW_RE = re.compile(r"\d[eE]\+?\d{3}")
+JSON_DECODERS = ("orjson", "msgspec", "stdlib")
+METRIC_STORE_DIRNAME = "metric_store"
+METRIC_SKETCHES_NAME = "sketches.json"
+METRIC_STORE_COLUMNS = (("tick", "q", "<i8"), ("key", "i", "<i4"), ("value", "d", "<f8"), ("loop", "i", "<i4"))
+METRIC_COLUMN_FLUSH_SAMPLES = 1 << 16
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+PROCESS_STARTED = time.monotonic()
+SERVE_SOCKET_NAME = "headlessctl.sock"
+SERVE_CONTEXT_IGNORED_ENV = ("HEADLESSCTL_USE_SERVER", "HEADLESSCTL_SOCKET", "HEADLESSCTL_NO_SERVER")
+COMMAND_CONTEXT = threading.local()
+STREAM_LOCK = threading.Lock()
+HISTORY_RUN_LIMIT = 20
+DIFF_RUNS_ALPHA = 0.05
+DIFF_RUNS_RESAMPLES = 2000
+MANN_WHITNEY_EXACT_MAX = 400
+JSON_CACHE = {}
+PACKAGE_CACHE_LISTING = {}
+REGISTRY_CACHE_NAME = "registry_cache.json"
+REGISTRY_CACHE_VERSION = 1
+COMPILED_REGISTRY = {}
+RUN_INDEX_NAME = "run_index.sqlite3"
+RUN_INDEX_SCHEMA_VERSION = 6
+RUN_INDEX_POOL = {}
+RUN_INDEX_POOL_LOCK = threading.Lock()
+RUN_INDEX_POOL_SIZE = 4
+RUN_INDEX_POOLING = threading.Event()
+METRIC_STAT_FIELDS = ("count", "min", "max", "mean", "stdev", "p50", "p90", "p95", "p99")
+RUN_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    task_id TEXT,
+    pack TEXT,
+    seeds TEXT,
+    multi INTEGER NOT NULL DEFAULT 0,
+    started_utc TEXT,
+    ended_utc TEXT,
+    ok INTEGER,
+    error_code TEXT,
+    exit_code INTEGER,
+    bank_status TEXT,
+    size_bytes INTEGER,
+    duration_ms REAL,
+    input_fingerprint TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_task_ended ON runs (task_id, ended_utc);
+CREATE INDEX IF NOT EXISTS runs_ended ON runs (ended_utc);
+CREATE INDEX IF NOT EXISTS runs_age ON runs (COALESCE(ended_utc, started_utc, '9999'), run_id);
+CREATE INDEX IF NOT EXISTS runs_fingerprint ON runs (input_fingerprint);
+CREATE TABLE IF NOT EXISTS size_ledger (id INTEGER PRIMARY KEY CHECK (id = 1), total_bytes INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS run_metrics (
+    run_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value REAL,
+    count REAL,
+    min REAL,
+    max REAL,
+    mean REAL,
+    stdev REAL,
+    p50 REAL,
+    p90 REAL,
+    p95 REAL,
+    p99 REAL,
+    PRIMARY KEY (run_id, key)
+);
+CREATE INDEX IF NOT EXISTS run_metrics_key ON run_metrics (key, run_id);
+"""
+UTF8_BOM = b"\xef\xbb\xbf"
+BLOB_STORE_DIRNAME = "blobs"
+BLOB_MANIFEST_NAME = "blobs.json"
+BLOB_HASH_CACHE = {}
+CODEC_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+INPUT_FINGERPRINT_VERSION = 2
+LAUNCH_ENV_PREFIXES = ("PUREDOTS_", "SPACE4X_", "GODGAME_", "TRI_")
+LAUNCH_ENV_IGNORED = ("TRI_ROOT", "TRI_STATE_DIR", "TRI_WIN", "TRI_WSL", "TRI_BUILDS_DIR", "PUREDOTS_TELEMETRY_PATH")
+INPUT_HASH_CACHE_NAME = "input_hash_cache.json"
+INPUT_HASH_CACHE = {}
+INPUT_HASH_LOCK = threading.Lock()
+DEFAULT_CODEC_LEVELS = {"gzip": 6, "zstd": 3}
+BUNDLE_MANIFEST_NAME = "bundle_manifest.json"
+SCAN_SHARD_MIN_BYTES = 64 * 1024 * 1024
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_MAX_BINS = 2048
+SKETCH_MIN_MAGNITUDE = 1e-9
+SKETCH_QUANTILES = (("p50", 0.50), ("p90", 0.90), ("p95", 0.95), ("p99", 0.99))
 
 
 def eprint(msg):
+    log = getattr(COMMAND_CONTEXT, "log", None)
+    if log is not None:
+        log.append(str(msg))
     sys.stderr.write(str(msg) + "\n")
     sys.stderr.flush()
 
 
-def emit_result(result, exit_code):
+class CommandResult(dict):
+    # A command's result: the dict the CLI prints, plus the exit code the CLI
+    # would exit with.
+    def __init__(self, result, exit_code):
+        super().__init__(result)
+        self.exit_code = exit_code
+
+    @property
+    def ok(self):
+        return self.get("ok") is True
+
+
+def finish_result(result, exit_code, started=None):
     result.setdefault("tool_version", TOOL_VERSION)
     result.setdefault("schema_version", SCHEMA_VERSION)
     if "ok" not in result:
@@ -36,11 +167,81 @@ def emit_result(result, exit_code):
         result["error"] = None if result["ok"] else "error"
     if "run_id" not in result:
         result["run_id"] = None
+    result.setdefault("elapsed_ms", elapsed_ms(started or getattr(COMMAND_CONTEXT, "started", None) or PROCESS_STARTED))
+    return CommandResult(result, exit_code)
+
+
+def api_command(fn):
+    # Library entry point: the wrapped function returns (result, exit_code)
+    # and callers get a CommandResult. Nothing is printed and SystemExit is
+    # never raised; the CLI prints it with emit_command.
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        result, exit_code = fn(*args, **kwargs)
+        return finish_result(result, exit_code, started)
+    return wrapper
+
+
+def emit_command(result):
+    # CLI elapsed_ms covers the whole command, as it did before the library API.
+    result["elapsed_ms"] = elapsed_ms(getattr(COMMAND_CONTEXT, "started", None) or PROCESS_STARTED)
+    emit_result(result, result.exit_code)
+
+
+def emit_result(result, exit_code):
+    result = finish_result(result, exit_code)
+    sink = getattr(COMMAND_CONTEXT, "sink", None)
+    if sink is not None:
+        sink.append((result, exit_code))
+        raise SystemExit(exit_code)
     sys.stdout.write(json.dumps(result, sort_keys=True) + "\n")
     sys.stdout.flush()
     raise SystemExit(exit_code)
 
 
+def emit_stream_record(record):
+    # Intermediate NDJSON line ahead of the command's final emit_result. Under
+    # serve there is one reply per request, so only the final result is sent.
+    if getattr(COMMAND_CONTEXT, "sink", None) is not None:
+        return
+    record.setdefault("tool_version", TOOL_VERSION)
+    record.setdefault("schema_version", SCHEMA_VERSION)
+    with STREAM_LOCK:
+        sys.stdout.write(json.dumps(record, sort_keys=True) + "\n")
+        sys.stdout.flush()
+
+
+def elapsed_ms(since, until=None):
+    if since is None:
+        return None
+    until = time.monotonic() if until is None else until
+    return round((until - since) * 1000.0, 3)
+
+
+class PhaseTimer:
+    # Monotonic per-phase wall time. mark(name) closes the phase that began at
+    # the previous mark; repeated names accumulate.
+    def __init__(self):
+        self.started = time.monotonic()
+        self.last_mark = self.started
+        self.phases = {}
+        self.points = {}
+
+    def mark(self, phase):
+        now = time.monotonic()
+        self.phases[phase] = round(self.phases.get(phase, 0.0) + (now - self.last_mark) * 1000.0, 3)
+        self.last_mark = now
+
+    def point(self, name, value_ms):
+        self.points[name] = value_ms
+
+    def to_dict(self):
+        timings = {"total_ms": elapsed_ms(self.started), "phases_ms": dict(self.phases)}
+        timings.update(self.points)
+        return timings
+
+
 def utc_now():
     return datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
 
@@ -151,24 +352,93 @@ def load_json(path):
         return json.load(handle)
 
 
+def write_json_atomic(path, data):
+    temp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        json.dump(data, handle, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def load_json_cached(path):
+    # Registry documents parsed once per (mtime, size); a long-lived serve
+    # process re-reads them only after an edit. Callers must not mutate them.
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = JSON_CACHE.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    doc = load_json(path)
+    JSON_CACHE[path] = (stamp, doc)
+    return doc
+
+
 def get_tasks_registry_paths(tool_root):
     base_path = os.path.join(tool_root, "Tools", "Headless", "headless_tasks.json")
     override_path = os.path.join(tool_root, "Tools", "Headless", "task_overrides.json")
     return base_path, override_path
 
 
-def load_tasks_document(tool_root, required=True, log_overrides=True):
-    tasks_path, overrides_path = get_tasks_registry_paths(tool_root)
-    if not os.path.exists(tasks_path):
-        if required:
-            raise FileNotFoundError(tasks_path)
-        return {"tasks": {}}, tasks_path
+def get_packs_registry_path(tool_root):
+    return os.path.join(tool_root, "Tools", "Headless", "headless_packs.json")
+
+
+def registry_source_stamp(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return {"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def registry_sources_match(stored, current):
+    # mtime+size decide cheaply; a changed mtime with the same bytes (a touch
+    # or checkout) is confirmed by hash so the compiled registry still holds.
+    for name, stamp in current.items():
+        prior = stored.get(name)
+        if stamp is None or prior is None:
+            if stamp is not prior:
+                return False
+            continue
+        if prior.get("path") != stamp["path"] or prior.get("size") != stamp["size"]:
+            return False
+        if prior.get("mtime_ns") != stamp["mtime_ns"]:
+            if prior.get("blake2b") != hash_file(stamp["path"]):
+                return False
+            prior["mtime_ns"] = stamp["mtime_ns"]
+    return True
+
+
+def normalize_task_settings(task):
+    allow_exit_codes = task.get("allow_exit_codes")
+    if allow_exit_codes is None:
+        allow_exit_codes = [0]
+    elif isinstance(allow_exit_codes, (int, float)):
+        allow_exit_codes = [int(allow_exit_codes)]
+    else:
+        allow_exit_codes = [int(code) for code in allow_exit_codes]
+    if 0 not in allow_exit_codes:
+        allow_exit_codes.append(0)
+    timeout_s = task.get("timeout_s")
+    if not isinstance(timeout_s, (int, float)) or timeout_s <= 0:
+        timeout_s = DEFAULT_TIMEOUT_S
+    metric_keys = task.get("metric_keys")
+    if not isinstance(metric_keys, list):
+        metric_keys = []
+    return {
+        "allow_exit_codes": allow_exit_codes,
+        "timeout_s": int(timeout_s),
+        "metric_keys": list(dict.fromkeys(key for key in metric_keys if isinstance(key, str)))
+    }
+
 
-    tasks_doc = load_json(tasks_path)
+def compile_registry(tool_root):
+    tasks_path, overrides_path = get_tasks_registry_paths(tool_root)
+    packs_path = get_packs_registry_path(tool_root)
+    tasks_doc = load_json(tasks_path) if os.path.exists(tasks_path) else {"tasks": {}}
     base_tasks = tasks_doc.get("tasks", {})
     if not isinstance(base_tasks, dict):
         base_tasks = {}
 
+    override_ids = []
     if os.path.exists(overrides_path):
         overrides_doc = load_json(overrides_path)
         override_tasks = overrides_doc.get("tasks", {})
@@ -178,11 +448,90 @@ def load_tasks_document(tool_root, required=True, log_overrides=True):
         merged_tasks.update(override_tasks)
         tasks_doc = dict(tasks_doc)
         tasks_doc["tasks"] = merged_tasks
-        if log_overrides and override_tasks:
-            override_ids = ",".join(sorted(override_tasks.keys()))
-            eprint(f"HEADLESSCTL: task_overrides active={overrides_path} tasks={override_ids}")
+        override_ids = sorted(override_tasks.keys())
+
+    packs_doc = load_json(packs_path) if os.path.exists(packs_path) else {}
+    tasks = tasks_doc.get("tasks", {})
+    packs = packs_doc.get("packs", {})
+    errors, warnings = check_registry_contract(tasks, packs)
+    normalized = {}
+    for task_id, task in tasks.items():
+        try:
+            normalized[task_id] = normalize_task_settings(task)
+        except (AttributeError, TypeError, ValueError):
+            # Left for run_task to fail on, as it did before compilation.
+            continue
+    return {
+        "tasks_doc": tasks_doc,
+        "packs": packs if isinstance(packs, dict) else {},
+        "override_ids": override_ids,
+        "normalized": normalized,
+        "contract": {"errors": errors, "warnings": warnings}
+    }
+
+
+def registry_cache_path():
+    try:
+        return os.path.join(resolve_state_dir(resolve_tri_root()), REGISTRY_CACHE_NAME)
+    except Exception:
+        return None
+
+
+def load_registry(tool_root):
+    # Merged, contract-checked tasks and packs, compiled once per registry
+    # change into state_dir and memoized in-process (serve mode) on top. This
+    # file is a source too, so a changed compiler never reuses a stale cache.
+    tasks_path, overrides_path = get_tasks_registry_paths(tool_root)
+    current = {
+        "tasks": registry_source_stamp(tasks_path),
+        "overrides": registry_source_stamp(overrides_path),
+        "packs": registry_source_stamp(get_packs_registry_path(tool_root)),
+        "tool": registry_source_stamp(os.path.abspath(__file__))
+    }
+    memo = COMPILED_REGISTRY.get(tool_root)
+    if memo is not None and registry_sources_match(memo["sources"], current):
+        return dict(memo, cache="memo")
+
+    cache_path = registry_cache_path()
+    if cache_path and os.path.exists(cache_path):
+        try:
+            cached = load_json(cache_path)
+            if cached.get("version") == REGISTRY_CACHE_VERSION and registry_sources_match(cached["sources"], current):
+                cached["cache"] = "hit"
+                COMPILED_REGISTRY[tool_root] = cached
+                return cached
+        except Exception as exc:
+            eprint(f"HEADLESSCTL: registry cache unreadable {cache_path}: {exc}")
+
+    compiled = compile_registry(tool_root)
+    for stamp in current.values():
+        if stamp is not None:
+            stamp["blake2b"] = hash_file(stamp["path"])
+    compiled["version"] = REGISTRY_CACHE_VERSION
+    compiled["sources"] = current
+    if cache_path:
+        try:
+            ensure_dir(os.path.dirname(cache_path))
+            write_json_atomic(cache_path, compiled)
+        except OSError as exc:
+            eprint(f"HEADLESSCTL: registry cache write failed {cache_path}: {exc}")
+    compiled["cache"] = "miss"
+    COMPILED_REGISTRY[tool_root] = compiled
+    return compiled
+
+
+def load_tasks_document(tool_root, required=True, log_overrides=True):
+    tasks_path, overrides_path = get_tasks_registry_paths(tool_root)
+    if not os.path.exists(tasks_path):
+        if required:
+            raise FileNotFoundError(tasks_path)
+        return {"tasks": {}}, tasks_path
 
-    return tasks_doc, tasks_path
+    registry = load_registry(tool_root)
+    override_ids = registry["override_ids"]
+    if log_overrides and override_ids:
+        eprint(f"HEADLESSCTL: task_overrides active={overrides_path} tasks={','.join(override_ids)}")
+    return registry["tasks_doc"], tasks_path
 
 
 def parse_utc(value):
@@ -434,7 +783,8 @@ def parse_cleanup_runs_args(args):
     return days, keep_per_task, max_bytes
 
 
-def iter_runs(state_dir):
+def scan_runs_dir(state_dir):
+    # Directory listing used to (re)build the run index; reads every result.json.
     runs_dir = os.path.join(state_dir, "runs")
     if not os.path.isdir(runs_dir):
         return []
@@ -475,9 +825,633 @@ def run_dir_size(path):
     return total
 
 
+def run_index_path(state_dir):
+    return os.path.join(state_dir, RUN_INDEX_NAME)
+
+
+class RunIndexConnection(sqlite3.Connection):
+    # While serve keeps the run index warm (RUN_INDEX_POOLING), close() hands
+    # the connection back to RUN_INDEX_POOL instead of closing it.
+    pool_key = None
+    pool_file = None
+
+    def close(self):
+        if self.pool_key is not None and RUN_INDEX_POOLING.is_set():
+            try:
+                if self.in_transaction:
+                    self.rollback()
+                with RUN_INDEX_POOL_LOCK:
+                    idle = RUN_INDEX_POOL.setdefault(self.pool_key, [])
+                    if len(idle) < RUN_INDEX_POOL_SIZE:
+                        idle.append(self)
+                        return
+            except sqlite3.Error:
+                pass
+        super().close()
+
+
+def run_index_file_id(path):
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+def take_pooled_run_index(path):
+    # An idle pooled connection to path, unless the file was replaced since
+    # it was opened (e.g. deleted to force a rebuild).
+    while True:
+        with RUN_INDEX_POOL_LOCK:
+            idle = RUN_INDEX_POOL.get(path)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            return None
+        try:
+            if run_index_file_id(path) == conn.pool_file:
+                return conn
+        except OSError:
+            pass
+        sqlite3.Connection.close(conn)
+
+
+def close_run_index_pool():
+    RUN_INDEX_POOLING.clear()
+    with RUN_INDEX_POOL_LOCK:
+        idle = [conn for conns in RUN_INDEX_POOL.values() for conn in conns]
+        RUN_INDEX_POOL.clear()
+    for conn in idle:
+        sqlite3.Connection.close(conn)
+
+
+def open_run_index(state_dir):
+    # Opens (creating and backfilling from disk on first use) the SQLite index
+    # of finished runs. Raises sqlite3.Error/OSError; callers fall back to
+    # scan_runs_dir so a broken index never fails a run. Under serve a pooled
+    # connection is reused and the schema check is skipped.
+    path = run_index_path(state_dir)
+    if RUN_INDEX_POOLING.is_set():
+        conn = take_pooled_run_index(path)
+        if conn is not None:
+            return conn
+    ensure_dir(state_dir)
+    conn = sqlite3.connect(path, timeout=30, factory=RunIndexConnection, check_same_thread=False)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is not None and row[0] != str(RUN_INDEX_SCHEMA_VERSION):
+            # Everything here is derived from runs/, so an older layout is
+            # dropped and rebuilt rather than migrated. Dropped before the
+            # schema script, whose indexes may name columns the old one lacks.
+            conn.executescript("DROP TABLE IF EXISTS runs; DROP TABLE IF EXISTS run_metrics; DROP TABLE IF EXISTS size_ledger;")
+        conn.executescript(RUN_INDEX_SCHEMA)
+        if row is None or row[0] != str(RUN_INDEX_SCHEMA_VERSION):
+            rebuild_run_index(conn, state_dir)
+        if RUN_INDEX_POOLING.is_set():
+            conn.pool_file = run_index_file_id(path)
+            conn.pool_key = path
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def select_index_metrics(result, metric_keys=None):
+    # (key, summary value, *METRIC_STAT_FIELDS) per indexed key.
+    summary = result.get("metrics_summary") or {}
+    stats = result.get("metrics_stats") or {}
+    keys = metric_keys if metric_keys else summary.keys()
+    rows = []
+    for key in keys:
+        if not isinstance(summary.get(key), (int, float)):
+            continue
+        key_stats = stats.get(key) if isinstance(stats.get(key), dict) else {}
+        rows.append((key, float(summary[key])) + tuple(
+            float(key_stats[field]) if isinstance(key_stats.get(field), (int, float)) else None
+            for field in METRIC_STAT_FIELDS
+        ))
+    return rows
+
+
+def ledger_add(conn, delta_bytes):
+    # Running total of indexed run sizes; always changed in the same
+    # transaction as the runs rows it sums.
+    if not delta_bytes:
+        return
+    cursor = conn.execute("UPDATE size_ledger SET total_bytes = total_bytes + ? WHERE id = 1", (delta_bytes,))
+    if cursor.rowcount == 0:
+        conn.execute("INSERT INTO size_ledger (id, total_bytes) VALUES (1, ?)", (delta_bytes,))
+
+
+def ledger_total(conn):
+    row = conn.execute("SELECT total_bytes FROM size_ledger WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def indexed_run_size(conn, run_id):
+    row = conn.execute("SELECT size_bytes FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    return (row[0] or 0) if row else 0
+
+
+def write_index_row(conn, run_id, result, size_bytes, metric_keys=None):
+    result = result or {}
+    ledger_add(conn, (size_bytes or 0) - indexed_run_size(conn, run_id))
+    seeds = result.get("seeds_requested")
+    if seeds is None and result.get("seed_requested") is not None:
+        seeds = [result.get("seed_requested")]
+    ok = result.get("ok")
+    duration_ms = (result.get("timings") or {}).get("total_ms")
+    if not isinstance(duration_ms, (int, float)):
+        started = parse_utc(result.get("started_utc"))
+        ended = parse_utc(result.get("ended_utc"))
+        duration_ms = (ended - started).total_seconds() * 1000.0 if started and ended else None
+    conn.execute(
+        "INSERT OR REPLACE INTO runs (run_id, task_id, pack, seeds, multi, started_utc, ended_utc, ok, error_code, exit_code, bank_status, size_bytes, duration_ms, input_fingerprint) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            run_id,
+            result.get("task_id"),
+            result.get("pack"),
+            json.dumps(seeds) if seeds is not None else None,
+            1 if "seed_runs" in result else 0,
+            result.get("started_utc"),
+            result.get("ended_utc") or result.get("started_utc"),
+            None if ok is None else int(bool(ok)),
+            result.get("error_code"),
+            result.get("exit_code") if isinstance(result.get("exit_code"), int) else None,
+            (result.get("bank_status") or {}).get("status"),
+            size_bytes,
+            duration_ms,
+            result.get("input_fingerprint")
+        )
+    )
+    conn.execute("DELETE FROM run_metrics WHERE run_id = ?", (run_id,))
+    conn.executemany(
+        f"INSERT INTO run_metrics (run_id, key, value, {', '.join(METRIC_STAT_FIELDS)}) VALUES (?, ?, ?{', ?' * len(METRIC_STAT_FIELDS)})",
+        [(run_id,) + row for row in select_index_metrics(result, metric_keys)]
+    )
+
+
+def write_started_row(conn, run_id, task_id, pack, multi, started_utc, size_bytes=0):
+    # A run that has no result yet: ended_utc stays NULL until write_run_result
+    # replaces the row. cleanup_runs leaves such rows alone while they are
+    # younger than RUN_IN_FLIGHT_GRACE_SEC.
+    ledger_add(conn, size_bytes - indexed_run_size(conn, run_id))
+    conn.execute(
+        "INSERT OR REPLACE INTO runs (run_id, task_id, pack, multi, started_utc, size_bytes) VALUES (?, ?, ?, ?, ?, ?)",
+        (run_id, task_id, pack, 1 if multi else 0, started_utc, size_bytes)
+    )
+
+
+def index_run_started(state_dir, run_id, task_id, pack, multi=False):
+    try:
+        conn = open_run_index(state_dir)
+        try:
+            with conn:
+                write_started_row(conn, run_id, task_id, pack, multi, utc_now())
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as exc:
+        eprint(f"HEADLESSCTL: run index update failed {exc}")
+
+
+def rebuild_run_index(conn, state_dir):
+    tool_root = resolve_tool_root()
+    try:
+        tasks = load_tasks_document(tool_root, required=False, log_overrides=False)[0].get("tasks", {})
+    except Exception:
+        tasks = {}
+    indexed = 0
+    without_result = 0
+    with conn:
+        conn.execute("DELETE FROM runs")
+        conn.execute("DELETE FROM run_metrics")
+        conn.execute("DELETE FROM size_ledger")
+        for entry in scan_runs_dir(state_dir):
+            result = entry["result"]
+            if result is None:
+                # Possibly still running; the dir mtime stands in for the start.
+                without_result += 1
+                started = datetime.datetime.fromtimestamp(os.stat(entry["path"]).st_mtime, datetime.timezone.utc)
+                started_utc = started.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+                write_started_row(conn, entry["run_id"], None, None, False, started_utc, run_dir_size(entry["path"]))
+                indexed += 1
+                continue
+            metric_keys = (tasks.get(entry["task_id"]) or {}).get("metric_keys")
+            write_index_row(conn, entry["run_id"], result, run_dir_size(entry["path"]), metric_keys)
+            indexed += 1
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (str(RUN_INDEX_SCHEMA_VERSION),))
+    return {"indexed": indexed, "without_result": without_result}
+
+
+def write_run_result(state_dir, run_dir, result, metric_keys=None):
+    result_path = os.path.join(run_dir, "result.json")
+    with open(result_path, "w", encoding="utf-8") as handle:
+        json.dump(result, handle, indent=2, sort_keys=True)
+    try:
+        conn = open_run_index(state_dir)
+        try:
+            with conn:
+                write_index_row(conn, result.get("run_id") or os.path.basename(run_dir), result, run_dir_size(run_dir), metric_keys)
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as exc:
+        eprint(f"HEADLESSCTL: run index update failed {exc}")
+    return result_path
+
+
+def find_latest_run(state_dir, task_id, exclude_run_id=None):
+    # Newest finished run of task_id (by ended_utc) as its result.json dict.
+    try:
+        conn = open_run_index(state_dir)
+    except (sqlite3.Error, OSError) as exc:
+        eprint(f"HEADLESSCTL: run index unavailable, scanning runs dir ({exc})")
+        candidates = [
+            entry for entry in scan_runs_dir(state_dir)
+            if entry["result"] and entry["task_id"] == task_id and entry["run_id"] != exclude_run_id and entry["result"].get("ended_utc")
+        ]
+        candidates.sort(key=lambda entry: entry["result"].get("ended_utc"))
+        return candidates[-1]["result"] if candidates else None
+    try:
+        rows = conn.execute(
+            "SELECT run_id FROM runs WHERE task_id = ? AND run_id != ? AND ended_utc IS NOT NULL ORDER BY ended_utc DESC, run_id DESC",
+            (task_id, exclude_run_id or "")
+        )
+        for row in rows:
+            result_path = os.path.join(state_dir, "runs", row["run_id"], "result.json")
+            try:
+                return load_json(result_path)
+            except Exception:
+                continue
+        return None
+    finally:
+        conn.close()
+
+
+def find_run_by_fingerprint(state_dir, fingerprint):
+    # Newest successful single run made from the same inputs, or None.
+    try:
+        conn = open_run_index(state_dir)
+    except (sqlite3.Error, OSError) as exc:
+        eprint(f"HEADLESSCTL: run index unavailable, not reusing runs ({exc})")
+        return None
+    try:
+        rows = conn.execute(
+            "SELECT run_id FROM runs WHERE input_fingerprint = ? AND ok = 1 AND multi = 0 ORDER BY ended_utc DESC, run_id DESC",
+            (fingerprint,)
+        ).fetchall()
+    finally:
+        conn.close()
+    for row in rows:
+        try:
+            result = load_json(os.path.join(state_dir, "runs", row["run_id"], "result.json"))
+        except Exception:
+            continue
+        if result.get("ok") is True and result.get("input_fingerprint") == fingerprint:
+            return result
+    return None
+
+
+def refresh_run_size(state_dir, run_id):
+    # Re-measures one run after files were added to it (e.g. a bundle).
+    run_dir = os.path.join(state_dir, "runs", run_id)
+    try:
+        conn = open_run_index(state_dir)
+        try:
+            with conn:
+                size_bytes = run_dir_size(run_dir)
+                ledger_add(conn, size_bytes - indexed_run_size(conn, run_id))
+                conn.execute("UPDATE runs SET size_bytes = ? WHERE run_id = ?", (size_bytes, run_id))
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as exc:
+        eprint(f"HEADLESSCTL: run index size update failed {exc}")
+
+
+def resolve_blob_dir(state_dir, pack=None):
+    # Opt-in: HEADLESSCTL_BLOB_STORE wins over the pack's blob_store flag.
+    enabled = os.environ.get("HEADLESSCTL_BLOB_STORE")
+    if enabled is None and pack:
+        enabled = pack.get("blob_store")
+    if str(enabled).strip().lower() in ("1", "true", "yes", "on"):
+        return os.path.join(state_dir, BLOB_STORE_DIRNAME)
+    return None
+
+
+def hash_file(path, cached=False):
+    stat = os.stat(path)
+    key = (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if cached and key in BLOB_HASH_CACHE:
+        return BLOB_HASH_CACHE[key]
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    if cached:
+        BLOB_HASH_CACHE[key] = value
+    return value
+
+
+def load_input_hash_cache(state_dir):
+    cache_path = os.path.join(state_dir, INPUT_HASH_CACHE_NAME)
+    cache = INPUT_HASH_CACHE.get(cache_path)
+    if cache is None:
+        try:
+            cache = load_json(cache_path)
+        except Exception:
+            cache = {}
+        if not isinstance(cache, dict):
+            cache = {}
+        INPUT_HASH_CACHE[cache_path] = cache
+    return cache_path, cache
+
+
+def hash_input_files(state_dir, paths):
+    # BLAKE2b per file, remembered in the state dir by (path, size, mtime) so
+    # an unchanged multi-GB build is only stat()ed on later runs.
+    with INPUT_HASH_LOCK:
+        cache_path, cache = load_input_hash_cache(state_dir)
+        digests = {}
+        changed = False
+        for path in paths:
+            stat = os.stat(path)
+            key = os.path.abspath(path)
+            entry = cache.get(key)
+            if not entry or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+                entry = [stat.st_size, stat.st_mtime_ns, hash_file(path)]
+                cache[key] = entry
+                changed = True
+            digests[path] = entry[2]
+        if changed:
+            try:
+                write_json_atomic(cache_path, cache)
+            except OSError as exc:
+                eprint(f"HEADLESSCTL: input hash cache write failed {exc}")
+    return digests
+
+
+def build_input_files(binary):
+    # The executable alone is the generic Unity player; the game is in the
+    # sibling <name>_Data/ tree and the shared libraries next to it.
+    build_dir = os.path.dirname(os.path.abspath(binary))
+    files = [binary]
+    data_dir = os.path.join(build_dir, os.path.splitext(os.path.basename(binary))[0] + "_Data")
+    for name in sorted(os.listdir(build_dir)):
+        if name.endswith(".so"):
+            files.append(os.path.join(build_dir, name))
+    for root, dirs, names in os.walk(data_dir):
+        dirs.sort()
+        for name in sorted(names):
+            files.append(os.path.join(root, name))
+    return build_dir, files
+
+
+def launch_ambient_env():
+    # Inherited variables the player reads (telemetry, proof and feature
+    # switches). Tool paths and the per-run telemetry path are left out.
+    return {
+        key: value for key, value in os.environ.items()
+        if key.startswith(LAUNCH_ENV_PREFIXES) and key not in LAUNCH_ENV_IGNORED
+    }
+
+
+def run_input_fingerprint(state_dir, task_id, task, pack_name, pack, binary, scenario, seed):
+    # Everything that decides what a single run simulates: build, scenario
+    # (with the Templates/ copied next to it), seed, the task and pack
+    # definitions (env included) and the inherited launch env. Returns None
+    # when an input can't be read.
+    try:
+        build_dir, build_files = build_input_files(binary)
+        scenario_files = []
+        if scenario and os.path.isfile(scenario):
+            scenario_files.append(scenario)
+            templates_dir = os.path.join(os.path.dirname(scenario), "Templates")
+            if os.path.isdir(templates_dir):
+                scenario_files.extend(
+                    os.path.join(templates_dir, name)
+                    for name in sorted(os.listdir(templates_dir))
+                    if name.lower().endswith(".json")
+                )
+        digests = hash_input_files(state_dir, build_files + scenario_files)
+    except OSError as exc:
+        eprint(f"HEADLESSCTL: input fingerprint unavailable {exc}")
+        return None
+    inputs = {
+        "version": INPUT_FINGERPRINT_VERSION,
+        "tool_version": TOOL_VERSION,
+        "task_id": task_id,
+        "task": task,
+        "pack_name": pack_name,
+        "pack": pack,
+        "build": {os.path.relpath(path, build_dir): digests[path] for path in build_files},
+        "scenario": [digests[path] for path in scenario_files] if scenario_files else scenario,
+        "seed": seed,
+        "env": launch_ambient_env()
+    }
+    digest = hashlib.blake2b(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8"), digest_size=32)
+    return digest.hexdigest()
+
+
+def blob_path(blob_dir, digest):
+    return os.path.join(blob_dir, digest[:2], digest)
+
+
+def link_into_blob_store(blob_dir, path):
+    # Replaces path with a hardlink to its blob, adding the blob when it is
+    # new. The blob's link count is its refcount: 1 means only the store.
+    # Returns (digest, reused), or (None, False) when linking is unsupported.
+    digest = hash_file(path)
+    target = blob_path(blob_dir, digest)
+    try:
+        ensure_dir(os.path.dirname(target))
+        for _ in range(3):
+            try:
+                os.link(path, target)
+                os.chmod(target, 0o444)
+                return digest, False
+            except FileExistsError:
+                pass
+            temp_path = f"{path}.blob-{uuid.uuid4().hex}"
+            try:
+                os.link(target, temp_path)
+            except FileNotFoundError:
+                # Collected by a concurrent cleanup between the two links.
+                continue
+            os.replace(temp_path, path)
+            return digest, True
+    except OSError as exc:
+        eprint(f"HEADLESSCTL: blob store link failed {path}: {exc}")
+    return None, False
+
+
+def record_blob_links(run_dir, links):
+    # Merges {rel_path: digest} into the run's blobs.json.
+    manifest_path = os.path.join(run_dir, BLOB_MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        try:
+            manifest = load_json(manifest_path)
+        except Exception:
+            manifest = {}
+    manifest.update(links)
+    write_json_atomic(manifest_path, manifest)
+
+
+def copy_via_blob_store(blob_dir, src_path, dest_path, run_dir=None):
+    # Like shutil.copy2 for files outside the state dir (scenario templates):
+    # the source is copied into the store once and hardlinked from there.
+    # With run_dir, the link goes into its blobs.json before it is made, so
+    # removing a run that never reached ingest_run_dir still releases it.
+    digest = hash_file(src_path, cached=True)
+    target = blob_path(blob_dir, digest)
+    ensure_dir(os.path.dirname(target))
+    if run_dir:
+        record_blob_links(run_dir, {os.path.relpath(dest_path, run_dir).replace(os.sep, "/"): digest})
+    for _ in range(3):
+        if not os.path.exists(target):
+            temp_path = f"{target}.tmp-{uuid.uuid4().hex}"
+            shutil.copy2(src_path, temp_path)
+            os.chmod(temp_path, 0o444)
+            try:
+                os.link(temp_path, target)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(temp_path)
+        try:
+            os.link(target, dest_path)
+            return digest
+        except FileNotFoundError:
+            continue
+    raise OSError(f"blob vanished while linking {target}")
+
+
+def ingest_run_dir(blob_dir, run_dir):
+    manifest = {}
+    reused = 0
+    for root, _, files in os.walk(run_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, run_dir).replace(os.sep, "/")
+            if rel_path in ("result.json", BLOB_MANIFEST_NAME) or os.path.islink(path):
+                continue
+            try:
+                if os.path.getsize(path) == 0:
+                    continue
+            except OSError:
+                continue
+            digest, was_reused = link_into_blob_store(blob_dir, path)
+            if digest:
+                manifest[rel_path] = digest
+                reused += 1 if was_reused else 0
+    record_blob_links(run_dir, manifest)
+    return {"files": len(manifest), "reused": reused}
+
+
+def release_blobs(blob_dir, digests):
+    released = 0
+    for digest in set(digests):
+        path = blob_path(blob_dir, digest)
+        try:
+            if os.stat(path).st_nlink <= 1:
+                os.remove(path)
+                released += 1
+        except OSError:
+            pass
+    return released
+
+
+def remove_run_dir(state_dir, run_dir):
+    # Drops the run's links first, then any blob no other run still links.
+    digests = []
+    manifest_path = os.path.join(run_dir, BLOB_MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        try:
+            digests = list(load_json(manifest_path).values())
+        except Exception:
+            digests = []
+    shutil.rmtree(run_dir, ignore_errors=True)
+    if digests:
+        release_blobs(os.path.join(state_dir, BLOB_STORE_DIRNAME), digests)
+
+
+def remove_runs(state_dir, conn, run_ids):
+    runs_dir = os.path.join(state_dir, "runs")
+    for run_id in run_ids:
+        remove_run_dir(state_dir, os.path.join(runs_dir, run_id))
+    with conn:
+        ledger_add(conn, -sum(indexed_run_size(conn, run_id) for run_id in run_ids))
+        conn.executemany("DELETE FROM runs WHERE run_id = ?", [(run_id,) for run_id in run_ids])
+        conn.executemany("DELETE FROM run_metrics WHERE run_id = ?", [(run_id,) for run_id in run_ids])
+
+
 def cleanup_runs(state_dir, days, keep_per_task, max_bytes):
-    entries = iter_runs(state_dir)
+    try:
+        conn = open_run_index(state_dir)
+    except (sqlite3.Error, OSError) as exc:
+        eprint(f"HEADLESSCTL: run index unavailable, scanning runs dir ({exc})")
+        return cleanup_runs_scan(state_dir, days, keep_per_task, max_bytes)
+    removed = []
+    # Rows without ended_utc are runs that never wrote a result. While younger
+    # than RUN_IN_FLIGHT_GRACE_SEC they may still be running and are skipped;
+    # after that they age by started_utc.
+    now = datetime.datetime.now(datetime.timezone.utc)
+    grace_utc = (now - datetime.timedelta(seconds=RUN_IN_FLIGHT_GRACE_SEC)).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    settled = "(ended_utc IS NOT NULL OR started_utc IS NULL OR started_utc < :grace)"
+    try:
+        if days is not None:
+            cutoff = now - datetime.timedelta(days=days)
+            cutoff_utc = cutoff.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+            rows = conn.execute(
+                f"SELECT run_id FROM runs WHERE COALESCE(ended_utc, started_utc) < :cutoff AND {settled}",
+                {"cutoff": cutoff_utc, "grace": grace_utc}
+            ).fetchall()
+            expired = [row["run_id"] for row in rows]
+            remove_runs(state_dir, conn, expired)
+            removed.extend(expired)
+
+        if keep_per_task is not None:
+            rows = conn.execute(
+                "SELECT run_id FROM (SELECT run_id, ROW_NUMBER() OVER (PARTITION BY COALESCE(task_id, 'unknown') "
+                f"ORDER BY COALESCE(ended_utc, started_utc, '9999') DESC, run_id DESC) AS task_rank FROM runs WHERE {settled}) "
+                "WHERE task_rank > :keep",
+                {"keep": keep_per_task, "grace": grace_utc}
+            ).fetchall()
+            surplus = [row["run_id"] for row in rows]
+            remove_runs(state_dir, conn, surplus)
+            removed.extend(surplus)
+
+        if max_bytes is not None:
+            # The ledger total makes an under-budget check O(1); otherwise
+            # only the oldest runs that actually get deleted are read.
+            total_bytes = ledger_total(conn)
+            over_budget = []
+            if total_bytes > max_bytes:
+                cursor = conn.execute(
+                    f"SELECT run_id, size_bytes FROM runs WHERE {settled} ORDER BY COALESCE(ended_utc, started_utc, '9999'), run_id",
+                    {"grace": grace_utc}
+                )
+                for row in cursor:
+                    if total_bytes <= max_bytes:
+                        break
+                    over_budget.append(row["run_id"])
+                    total_bytes -= row["size_bytes"] or 0
+                cursor.close()
+            remove_runs(state_dir, conn, over_budget)
+            removed.extend(over_budget)
+    finally:
+        conn.close()
+    return removed
+
+
+def cleanup_runs_scan(state_dir, days, keep_per_task, max_bytes):
     now = datetime.datetime.now(datetime.timezone.utc)
+    grace_ts = (now - datetime.timedelta(seconds=RUN_IN_FLIGHT_GRACE_SEC)).timestamp()
+    # A dir without result.json touched within the grace period may be running.
+    entries = [
+        entry for entry in scan_runs_dir(state_dir)
+        if entry["result"] is not None or os.stat(entry["path"]).st_mtime < grace_ts
+    ]
     removed = []
 
     if days is not None:
@@ -487,7 +1461,7 @@ def cleanup_runs(state_dir, days, keep_per_task, max_bytes):
             ended = parse_utc(entry.get("ended_utc"))
             if ended and ended < cutoff:
                 removed.append(entry["run_id"])
-                shutil.rmtree(entry["path"], ignore_errors=True)
+                remove_run_dir(state_dir, entry["path"])
             else:
                 kept.append(entry)
         entries = kept
@@ -503,7 +1477,7 @@ def cleanup_runs(state_dir, days, keep_per_task, max_bytes):
             kept.extend(runs[:keep_per_task])
             for entry in runs[keep_per_task:]:
                 removed.append(entry["run_id"])
-                shutil.rmtree(entry["path"], ignore_errors=True)
+                remove_run_dir(state_dir, entry["path"])
         entries = kept
 
     if max_bytes is not None:
@@ -524,7 +1498,7 @@ def cleanup_runs(state_dir, days, keep_per_task, max_bytes):
                 size = sizes.get(run_id, 0)
                 removed.append(run_id)
                 total_bytes -= size
-                shutil.rmtree(entry["path"], ignore_errors=True)
+                remove_run_dir(state_dir, entry["path"])
 
     return removed
 
@@ -548,35 +1522,48 @@ def parse_args(argv):
 
 def parse_run_task_args(args):
     if not args:
-        return None, None, None, None, "missing_task_id"
+        return None, None, None, None, None, False, "missing_task_id"
     task_id = args[0]
     seed = None
     seeds = None
     pack = None
+    slots = None
+    no_cache = False
     idx = 1
     while idx < len(args):
         token = args[idx]
         if token == "--seed" and idx + 1 < len(args):
             raw_seed = args[idx + 1]
             if not str(raw_seed).isdigit():
-                return task_id, None, None, None, "invalid_seed"
+                return task_id, None, None, None, None, False, "invalid_seed"
             seed = int(raw_seed)
             idx += 2
             continue
         if token == "--seeds" and idx + 1 < len(args):
             seeds, err = parse_seed_list(args[idx + 1])
             if err:
-                return task_id, None, None, None, err
+                return task_id, None, None, None, None, False, err
             idx += 2
             continue
         if token == "--pack" and idx + 1 < len(args):
             pack = args[idx + 1]
             idx += 2
             continue
-        return task_id, seed, seeds, pack, "invalid_arg"
+        if token == "--no-cache":
+            no_cache = True
+            idx += 1
+            continue
+        if token == "--slots" and idx + 1 < len(args):
+            raw_slots = args[idx + 1]
+            if not str(raw_slots).isdigit() or int(raw_slots) < 1:
+                return task_id, None, None, None, None, False, "invalid_slots"
+            slots = int(raw_slots)
+            idx += 2
+            continue
+        return task_id, seed, seeds, pack, slots, no_cache, "invalid_arg"
     if seed is not None and seeds is not None:
-        return task_id, seed, seeds, pack, "conflicting_seed_args"
-    return task_id, seed, seeds, pack, None
+        return task_id, seed, seeds, pack, slots, no_cache, "conflicting_seed_args"
+    return task_id, seed, seeds, pack, slots, no_cache, None
 
 
 def parse_seed_list(raw_value):
@@ -623,6 +1610,33 @@ def check_seed_policy(task, seeds):
     return True, None, None
 
 
+def read_mem_available_mb():
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as handle:
+            for line in handle:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except Exception:
+        pass
+    return None
+
+
+def resolve_seed_slots(requested, seed_count):
+    slots = requested
+    if slots is None:
+        raw_slots = os.environ.get("HEADLESSCTL_SEED_SLOTS", "")
+        if raw_slots.isdigit() and int(raw_slots) > 0:
+            slots = int(raw_slots)
+    if slots is None:
+        slots = os.cpu_count() or 1
+        mem_available_mb = read_mem_available_mb()
+        raw_slot_mb = os.environ.get("HEADLESSCTL_SLOT_MEMORY_MB", "")
+        slot_mb = int(raw_slot_mb) if raw_slot_mb.isdigit() else DEFAULT_SLOT_MEMORY_MB
+        if mem_available_mb is not None and slot_mb > 0:
+            slots = min(slots, max(1, mem_available_mb // slot_mb))
+    return max(1, min(slots, seed_count))
+
+
 def compute_percentile(values, percentile):
     if not values:
         return None
@@ -642,6 +1656,165 @@ def compute_percentile(values, percentile):
     return sorted_values[lower] * (1.0 - weight) + sorted_values[upper] * weight
 
 
+class MetricSketch:
+    # Welford mean/variance plus a DDSketch (log-spaced buckets with relative
+    # error alpha) for quantiles. Both merge exactly, so per-seed sketches can
+    # be combined without the raw samples. Non-finite samples only reach the
+    # mean/variance, matching the old sum-based stats.
+    def __init__(self, alpha=SKETCH_RELATIVE_ACCURACY, max_bins=SKETCH_MAX_BINS):
+        self.alpha = alpha
+        self.max_bins = max_bins
+        self.gamma = (1.0 + alpha) / (1.0 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.zero = 0
+        self.positive = {}
+        self.negative = {}
+
+    def add(self, value):
+        # One sample; what the scanner calls per metric line.
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value - value != 0.0:
+            return
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if value > SKETCH_MIN_MAGNITUDE:
+            bins = self.positive
+            index = math.ceil(math.log(value) / self.log_gamma)
+        elif value < -SKETCH_MIN_MAGNITUDE:
+            bins = self.negative
+            index = math.ceil(math.log(-value) / self.log_gamma)
+        else:
+            self.zero += 1
+            return
+        bucket_count = bins.get(index)
+        if bucket_count is not None:
+            bins[index] = bucket_count + 1
+            return
+        bins[index] = 1
+        if len(bins) > self.max_bins:
+            self.collapse()
+
+    def collapse(self):
+        # Folds the smallest-magnitude buckets together once a store exceeds
+        # max_bins, which keeps the upper quantiles at full accuracy.
+        for bins in (self.positive, self.negative):
+            excess = len(bins) - self.max_bins
+            if excess <= 0:
+                continue
+            indices = sorted(bins)
+            folded = sum(bins.pop(index) for index in indices[:excess])
+            bins[indices[excess]] += folded
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("cannot merge sketches with different relative accuracy")
+        if other.count:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.count = count
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        self.zero += other.zero
+        for bins, other_bins in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, bucket_count in other_bins.items():
+                bins[index] = bins.get(index, 0) + bucket_count
+        self.collapse()
+
+    def stdev(self):
+        if self.count == 0:
+            return None
+        return math.sqrt(max(0.0, self.m2 / self.count)) if self.m2 == self.m2 else self.m2
+
+    def bucket_value(self, index):
+        return 2.0 * self.gamma ** index / (self.gamma + 1.0)
+
+    def quantile(self, q):
+        total = self.zero + sum(self.positive.values()) + sum(self.negative.values())
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        value = None
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                value = -self.bucket_value(index)
+                break
+        if value is None:
+            seen += self.zero
+            if seen > rank:
+                value = 0.0
+        if value is None:
+            for index in sorted(self.positive):
+                seen += self.positive[index]
+                if seen > rank:
+                    value = self.bucket_value(index)
+                    break
+        if value is None:
+            value = self.max
+        return min(max(value, self.min), self.max)
+
+    def quantiles(self):
+        return {name: self.quantile(q) for name, q in SKETCH_QUANTILES}
+
+    def to_dict(self):
+        return {
+            "alpha": self.alpha,
+            "max_bins": self.max_bins,
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.min,
+            "max": self.max,
+            "zero": self.zero,
+            "positive": sorted([index, bucket_count] for index, bucket_count in self.positive.items()),
+            "negative": sorted([index, bucket_count] for index, bucket_count in self.negative.items())
+        }
+
+    @classmethod
+    def from_dict(cls, payload):
+        sketch = cls(payload.get("alpha", SKETCH_RELATIVE_ACCURACY), payload.get("max_bins", SKETCH_MAX_BINS))
+        sketch.count = payload.get("count", 0)
+        sketch.mean = payload.get("mean", 0.0)
+        sketch.m2 = payload.get("m2", 0.0)
+        sketch.min = payload.get("min")
+        sketch.max = payload.get("max")
+        sketch.zero = payload.get("zero", 0)
+        sketch.positive = {int(index): bucket_count for index, bucket_count in payload.get("positive", [])}
+        sketch.negative = {int(index): bucket_count for index, bucket_count in payload.get("negative", [])}
+        return sketch
+
+
+def merge_metric_sketches(payloads):
+    merged = None
+    for payload in payloads:
+        if not isinstance(payload, dict):
+            continue
+        sketch = MetricSketch.from_dict(payload)
+        if merged is None:
+            merged = sketch
+            continue
+        try:
+            merged.merge(sketch)
+        except ValueError:
+            continue
+    return merged
+
+
 def compute_seed_stats(values):
     if not values:
         return None
@@ -659,18 +1832,25 @@ def compute_seed_stats(values):
     }
 
 
-def collect_seed_metrics(seed_results, metric_keys, variance_band):
+def collect_seed_metrics(state_dir, seed_results, metric_keys, variance_band):
     values_by_key = {key: [] for key in metric_keys}
+    sketches_by_key = {key: [] for key in metric_keys}
     seed_runs = []
 
     for run in seed_results:
         summary = run.get("metrics_summary", {})
+        # From the run dir, not the artifacts map: the sidecar is written
+        # whatever the pack exports.
+        run_sketches = load_metric_sketches(os.path.join(state_dir, "runs", run["run_id"], METRIC_STORE_DIRNAME)) if run.get("run_id") else {}
         selected = {}
         for key in metric_keys:
             value = summary.get(key)
             if isinstance(value, (int, float)):
                 selected[key] = value
                 values_by_key[key].append(float(value))
+            sketch = run_sketches.get(key)
+            if sketch:
+                sketches_by_key[key].append(sketch)
         seed_runs.append({
             "run_id": run.get("run_id"),
             "seed_requested": run.get("seed_requested"),
@@ -679,12 +1859,14 @@ def collect_seed_metrics(seed_results, metric_keys, variance_band):
             "ok": run.get("ok"),
             "error_code": run.get("error_code"),
             "error": run.get("error"),
+            "cached_from": run.get("cached_from"),
             "metrics_summary": selected,
             "artifacts": run.get("artifacts", {})
         })
 
     aggregate_summary = {}
     aggregate_stats = {}
+    aggregate_sketches = {}
     variance_grades = {}
     variance_pass = True
     variance_failed_count = 0
@@ -694,6 +1876,12 @@ def collect_seed_metrics(seed_results, metric_keys, variance_band):
         if stats:
             aggregate_summary[key] = stats.get("mean")
             aggregate_stats[key] = stats
+        merged = merge_metric_sketches(sketches_by_key[key])
+        if merged is not None:
+            aggregate_sketches[key] = merged.to_dict()
+            samples = {"count": merged.count, "mean": merged.mean if merged.count else None, "stdev": merged.stdev()}
+            samples.update(merged.quantiles())
+            aggregate_stats.setdefault(key, {})["samples"] = samples
         band = variance_band.get(key)
         if isinstance(band, (int, float)) and stats:
             spread = stats["max"] - stats["min"]
@@ -708,7 +1896,7 @@ def collect_seed_metrics(seed_results, metric_keys, variance_band):
                 variance_pass = False
                 variance_failed_count += 1
 
-    return seed_runs, aggregate_summary, aggregate_stats, variance_grades, variance_pass, variance_failed_count
+    return seed_runs, aggregate_summary, aggregate_stats, aggregate_sketches, variance_grades, variance_pass, variance_failed_count
 
 
 def resolve_scenario_path(tri_root, scenario_path):
@@ -726,14 +1914,25 @@ def resolve_scenario_path(tri_root, scenario_path):
         return candidate
 
     package_cache_root = os.path.join(tri_root, "Library", "PackageCache")
+    try:
+        stamp = os.stat(package_cache_root).st_mtime_ns
+    except OSError:
+        return candidate
     if not os.path.isdir(package_cache_root):
         return candidate
 
-    package_dirs = sorted(
-        name for name in os.listdir(package_cache_root)
-        if name.startswith("com.moni.puredots@")
-        and os.path.isdir(os.path.join(package_cache_root, name))
-    )
+    # The listing only changes when entries are added or removed, which bumps
+    # the directory mtime; multi-seed runs resolve the same path many times.
+    cached = PACKAGE_CACHE_LISTING.get(package_cache_root)
+    if cached is not None and cached[0] == stamp:
+        package_dirs = cached[1]
+    else:
+        package_dirs = sorted(
+            name for name in os.listdir(package_cache_root)
+            if name.startswith("com.moni.puredots@")
+            and os.path.isdir(os.path.join(package_cache_root, name))
+        )
+        PACKAGE_CACHE_LISTING[package_cache_root] = (stamp, package_dirs)
     if not package_dirs:
         return candidate
 
@@ -747,7 +1946,7 @@ def resolve_scenario_path(tri_root, scenario_path):
 
     return candidate
 
-def copy_scenario_templates(src_path, run_dir):
+def copy_scenario_templates(src_path, run_dir, blob_dir=None):
     if not src_path:
         return
     scenario_dir = os.path.dirname(src_path)
@@ -764,12 +1963,15 @@ def copy_scenario_templates(src_path, run_dir):
         src_file = os.path.join(templates_dir, name)
         dest_file = os.path.join(dest_dir, name)
         try:
-            shutil.copy2(src_file, dest_file)
+            if blob_dir:
+                copy_via_blob_store(blob_dir, src_file, dest_file, run_dir)
+            else:
+                shutil.copy2(src_file, dest_file)
         except Exception as exc:
             eprint(f"HEADLESSCTL: failed to copy template {src_file} -> {dest_file}: {exc}")
 
 
-def override_seed_if_supported(src_path, run_dir, seed_value, runner_kind):
+def override_seed_if_supported(src_path, run_dir, seed_value, runner_kind, blob_dir=None):
     if seed_value is None:
         return src_path, None
     if not src_path:
@@ -777,15 +1979,19 @@ def override_seed_if_supported(src_path, run_dir, seed_value, runner_kind):
     if runner_kind not in ("scenario_runner", "space4x_loader"):
         return src_path, None
     try:
-        with open(src_path, "r", encoding="utf-8") as handle:
-            data = json.load(handle)
+        # Parsed once per (mtime, size); the shallow copy keeps the cached
+        # document untouched.
+        data = load_json_cached(src_path)
     except Exception:
         return src_path, None
+    if not isinstance(data, dict):
+        return src_path, None
+    data = dict(data)
     data["seed"] = seed_value
     dest_path = os.path.join(run_dir, "scenario_seed_override.json")
     with open(dest_path, "w", encoding="utf-8") as handle:
         json.dump(data, handle, indent=2, sort_keys=True)
-    copy_scenario_templates(src_path, run_dir)
+    copy_scenario_templates(src_path, run_dir, blob_dir)
     return dest_path, seed_value
 
 
@@ -806,189 +2012,978 @@ def parse_bank_line(line):
     return {"id": test_id, "status": status, "reason": reason, "raw": line.strip()}
 
 
-def scan_telemetry(telemetry_path, run_dir, pack_caps):
-    metrics_path = os.path.join(run_dir, "metrics.jsonl")
-    events_path = os.path.join(run_dir, "events.jsonl")
-    metrics_handle = open(metrics_path, "w", encoding="utf-8")
-    events_handle = open(events_path, "w", encoding="utf-8")
-
-    stats = {}
-    first_tick = None
-    last_tick = None
-    monotonic_ok = True
-    parse_errors = 0
-    nan_inf_found = 0
-    negative_counts = 0
-    negative_resources = 0
-    seed_used = None
-    scenario_id = None
-
-    def update_stats(key, value, tick):
-        entry = stats.get(key)
-        if entry is None:
-            entry = {"count": 0, "sum": 0.0, "sum_sq": 0.0, "min": None, "max": None, "last": None, "last_tick": None}
-            stats[key] = entry
-        entry["count"] += 1
-        entry["sum"] += float(value)
-        entry["sum_sq"] += float(value) * float(value)
-        entry["min"] = value if entry["min"] is None else min(entry["min"], value)
-        entry["max"] = value if entry["max"] is None else max(entry["max"], value)
-        entry["last"] = value
-        entry["last_tick"] = tick
+def looks_like_resource_key(key):
+    low = key.lower()
+    if "delta" in low or "change" in low or "diff" in low:
+        return False
+    tokens = ["resource", "inventory", "storehouse", "buffer", "stock", "pile"]
+    return any(token in low for token in tokens)
 
-    def looks_like_resource_key(key):
-        low = key.lower()
-        if "delta" in low or "change" in low or "diff" in low:
-            return False
-        tokens = ["resource", "inventory", "storehouse", "buffer", "stock", "pile"]
-        return any(token in low for token in tokens)
 
-    def contains_non_finite(value):
-        if isinstance(value, float):
-            return not math.isfinite(value)
-        if isinstance(value, (int, str, type(None))):
-            return False
-        if isinstance(value, dict):
-            return any(contains_non_finite(v) for v in value.values())
-        if isinstance(value, list):
-            return any(contains_non_finite(v) for v in value)
+def contains_non_finite(value):
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, (int, str, type(None))):
         return False
+    if isinstance(value, dict):
+        return any(contains_non_finite(v) for v in value.values())
+    if isinstance(value, list):
+        return any(contains_non_finite(v) for v in value)
+    return False
 
-    with open(telemetry_path, "r", encoding="utf-8-sig", errors="replace") as handle:
-        for raw in handle:
-            raw_line = raw.rstrip("\n")
-            if not raw_line:
-                continue
-            try:
-                record = json.loads(raw_line)
-            except Exception:
-                parse_errors += 1
-                continue
-            if contains_non_finite(record):
-                nan_inf_found += 1
-            tick = record.get("tick")
-            if isinstance(tick, int):
-                if first_tick is None:
-                    first_tick = tick
-                if last_tick is not None and tick < last_tick:
-                    monotonic_ok = False
-                last_tick = tick
-            record_type = record.get("type")
-            if seed_used is None and isinstance(record.get("seed"), int):
-                seed_used = record.get("seed")
-            if scenario_id is None and record.get("scenario"):
-                scenario_id = record.get("scenario")
-            if record_type == "metric":
-                key = record.get("key")
-                value = record.get("value")
-                unit = record.get("unit")
-                loop = record.get("loop")
-                metrics_handle.write(json.dumps({
-                    "tick": tick,
-                    "key": key,
-                    "value": value,
-                    "unit": unit,
-                    "loop": loop
-                }, sort_keys=True) + "\n")
-                if isinstance(value, (int, float)):
-                    update_stats(key, value, tick)
-                    if unit == "count" and value < 0:
-                        negative_counts += 1
-                    if key and looks_like_resource_key(key) and value < 0:
-                        negative_resources += 1
-            else:
-                events_handle.write(json.dumps(record, sort_keys=True) + "\n")
-
-    metrics_handle.close()
-    events_handle.close()
-
-    metrics_summary = {}
-    metrics_stats = {}
-    for key, entry in stats.items():
-        count = entry["count"]
-        mean = entry["sum"] / count if count > 0 else None
-        variance = None
-        stdev = None
-        if count > 0 and mean is not None:
-            variance = max(0.0, (entry["sum_sq"] / count) - (mean * mean))
-            stdev = math.sqrt(variance) if variance >= 0.0 else None
-        metrics_stats[key] = {
-            "count": count,
-            "min": entry["min"],
-            "max": entry["max"],
-            "mean": mean,
-            "stdev": stdev,
-            "last": entry["last"],
-            "last_tick": entry["last_tick"]
-        }
-        metrics_summary[key] = entry["last"]
-
-    size_bytes = os.path.getsize(telemetry_path) if os.path.exists(telemetry_path) else 0
-    cap_bytes = pack_caps.get("max_bytes") if pack_caps else None
-    under_cap = True
-    if isinstance(cap_bytes, int) and cap_bytes > 0:
-        under_cap = size_bytes <= cap_bytes
-
-    telemetry_truncated = 0 if under_cap else 1
-    last_tick_value = last_tick if isinstance(last_tick, int) else None
-    metrics_summary["telemetry.bytes_written"] = size_bytes
-    metrics_summary["telemetry.truncated"] = telemetry_truncated
-    metrics_stats["telemetry.bytes_written"] = {
-        "count": 1,
-        "min": size_bytes,
-        "max": size_bytes,
-        "mean": float(size_bytes),
-        "stdev": 0.0,
-        "last": size_bytes,
-        "last_tick": last_tick_value
-    }
-    metrics_stats["telemetry.truncated"] = {
-        "count": 1,
-        "min": telemetry_truncated,
-        "max": telemetry_truncated,
-        "mean": float(telemetry_truncated),
-        "stdev": 0.0,
-        "last": telemetry_truncated,
-        "last_tick": last_tick_value
-    }
 
-    invariants = [
-        {"name": "telemetry.parse_errors", "ok": parse_errors == 0, "value": parse_errors},
-        {"name": "telemetry.monotonic_tick", "ok": monotonic_ok, "first_tick": first_tick, "last_tick": last_tick},
-        {"name": "telemetry.no_nan_inf", "ok": nan_inf_found == 0, "value": nan_inf_found},
-        {"name": "telemetry.no_negative_counts", "ok": negative_counts == 0, "value": negative_counts},
-        {"name": "telemetry.no_negative_resources", "ok": negative_resources == 0, "value": negative_resources},
-        {"name": "telemetry.output_under_cap", "ok": under_cap, "size_bytes": size_bytes, "cap_bytes": cap_bytes}
-    ]
+def replace_non_finite(value):
+    # JSON-safe copy of a decoded record: NaN/Infinity become None.
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: replace_non_finite(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [replace_non_finite(v) for v in value]
+    return value
 
-    invariants_path = os.path.join(run_dir, "invariants.jsonl")
-    with open(invariants_path, "w", encoding="utf-8") as handle:
-        for inv in invariants:
-            handle.write(json.dumps(inv, sort_keys=True) + "\n")
 
-    return {
-        "metrics_path": metrics_path,
-        "events_path": events_path,
-        "invariants_path": invariants_path,
-        "metrics_summary": metrics_summary,
-        "metrics_stats": metrics_stats,
-        "invariants": invariants,
-        "first_tick": first_tick,
-        "last_tick": last_tick,
-        "telemetry_size_bytes": size_bytes,
-        "seed_used": seed_used,
-        "scenario_id": scenario_id
-    }
+def resolve_abort_invariants(task, pack):
+    value = task.get("abort_on_invariant")
+    if value is None:
+        value = pack.get("abort_on_invariant")
+    if value is True:
+        return set(ABORTABLE_INVARIANTS)
+    if isinstance(value, list):
+        return {name for name in value if name in ABORTABLE_INVARIANTS}
+    return set()
+
+
+def lazy_import_orjson():
+    try:
+        import orjson
+
+        return orjson
+    except Exception:
+        return None
+
+
+def lazy_import_msgspec():
+    try:
+        import msgspec
+
+        return msgspec
+    except Exception:
+        return None
+
+
+def lazy_import_zstandard():
+    try:
+        import zstandard
+
+        return zstandard
+    except Exception:
+        return None
+
+
+def parse_codec_spec(spec):
+    # false/none, true (gzip), "gzip[:level]", "zstd[:level[:threads]]" or
+    # {"codec", "level", "threads"}. zstd threads default to -1 (all CPUs).
+    if spec is None or spec is False:
+        return None
+    if spec is True:
+        spec = "gzip"
+    if isinstance(spec, dict):
+        name = str(spec.get("codec") or "gzip").lower()
+        level = spec.get("level")
+        threads = spec.get("threads")
+    else:
+        parts = str(spec).strip().lower().split(":")
+        name = parts[0]
+        level = parts[1] if len(parts) > 1 and parts[1] else None
+        threads = parts[2] if len(parts) > 2 and parts[2] else None
+    if name in ("", "none", "false", "off", "0"):
+        return None
+    name = {"true": "gzip", "1": "gzip", "gz": "gzip", "zst": "zstd"}.get(name, name)
+    if name not in CODEC_SUFFIXES:
+        raise ValueError(f"unknown compression codec: {name}")
+    try:
+        level = DEFAULT_CODEC_LEVELS[name] if level is None else int(level)
+        threads = int(threads) if threads is not None else None
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid compression spec: {spec}")
+    if name == "zstd" and lazy_import_zstandard() is None:
+        eprint("HEADLESSCTL: zstandard not installed, compressing with gzip")
+        return {"codec": "gzip", "level": DEFAULT_CODEC_LEVELS["gzip"], "threads": None}
+    if name == "zstd":
+        return {"codec": "zstd", "level": level, "threads": -1 if threads is None else threads}
+    return {"codec": "gzip", "level": level, "threads": None}
+
+
+def open_compressed_writer(path, codec):
+    # Returns (text handle, final path); data is compressed as it is written.
+    if codec is None:
+        return open(path, "w", encoding="utf-8"), path
+    final_path = path + CODEC_SUFFIXES[codec["codec"]]
+    if codec["codec"] == "gzip":
+        return gzip.open(final_path, "wt", compresslevel=codec["level"], encoding="utf-8"), final_path
+    compressor = lazy_import_zstandard().ZstdCompressor(level=codec["level"], threads=codec["threads"])
+    writer = compressor.stream_writer(open(final_path, "wb"), closefd=True)
+    return io.TextIOWrapper(writer, encoding="utf-8"), final_path
+
+
+def open_artifact(path, mode="rt"):
+    # Opens a run artifact for reading whichever codec wrote it.
+    text = "b" not in mode
+    if path.endswith(CODEC_SUFFIXES["gzip"]):
+        return gzip.open(path, "rt" if text else "rb", encoding="utf-8" if text else None)
+    if path.endswith(CODEC_SUFFIXES["zstd"]):
+        zstandard = lazy_import_zstandard()
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8") if text else reader
+    return open(path, "r" if text else "rb", encoding="utf-8" if text else None)
+
+
+def artifact_base_path(path):
+    for suffix in CODEC_SUFFIXES.values():
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def resolve_json_decoder(preferred=None):
+    preferred = preferred or os.environ.get("HEADLESSCTL_JSON_DECODER") or "auto"
+    if preferred in ("auto", "orjson"):
+        orjson = lazy_import_orjson()
+        if orjson is not None:
+            return "orjson", orjson.loads
+    if preferred in ("auto", "msgspec"):
+        msgspec = lazy_import_msgspec()
+        if msgspec is not None:
+            return "msgspec", msgspec.json.decode
+    return "stdlib", None
+
+
+def format_metric_line(tick, key, value, unit, loop):
+    # Same text as json.dumps(..., sort_keys=True) for the scalar shape Unity
+    # emits, without building and sorting a dict per sample.
+    value_type = type(value)
+    if (type(tick) is int and type(key) is str and type(unit) is str and type(loop) is str
+            and (value_type is int or (value_type is float and math.isfinite(value)))):
+        encode = json.encoder.encode_basestring_ascii
+        return '{"key": %s, "loop": %s, "tick": %d, "unit": %s, "value": %r}\n' % (encode(key), encode(loop), tick, encode(unit), value)
+    return json.dumps({
+        "tick": tick,
+        "key": key,
+        "value": value,
+        "unit": unit,
+        "loop": loop
+    }, sort_keys=True) + "\n"
+
+
+def lazy_import_numpy():
+    try:
+        import numpy as np
+
+        return np
+    except Exception:
+        return None
+
+
+def write_npy_header(handle, descr, count):
+    # Minimal .npy (format 1.0) header for a 1-D little-endian column so the
+    # store can be produced without numpy installed.
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, count)
+    header_len = len(NPY_MAGIC) + 2 + len(header) + 1
+    header += " " * ((64 - header_len % 64) % 64) + "\n"
+    handle.write(NPY_MAGIC)
+    handle.write(struct.pack("<H", len(header)))
+    handle.write(header.encode("latin1"))
+
+
+def write_little_endian(handle, values):
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    values.tofile(handle)
+
+
+def write_npy(path, values, descr):
+    with open(path, "wb") as handle:
+        write_npy_header(handle, descr, len(values))
+        write_little_endian(handle, values)
+
+
+def read_npy(path, typecode, start=0, stop=None):
+    np = lazy_import_numpy()
+    if np is not None:
+        column = np.load(path, mmap_mode="r")
+        return np.array(column[start:stop])
+    with open(path, "rb") as handle:
+        if handle.read(len(NPY_MAGIC)) != NPY_MAGIC:
+            raise ValueError(f"not a v1 .npy file: {path}")
+        header_len = struct.unpack("<H", handle.read(2))[0]
+        header = ast.literal_eval(handle.read(header_len).decode("latin1"))
+        count = header["shape"][0]
+        values = array.array(typecode)
+        stop = count if stop is None else min(stop, count)
+        handle.seek(values.itemsize * start, os.SEEK_CUR)
+        values.fromfile(handle, max(0, stop - start))
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class MetricColumns:
+    # Per-key numeric samples gathered during the scan. Samples are buffered
+    # per key and spooled to one file per key and column whenever
+    # METRIC_COLUMN_FLUSH_SAMPLES are held, so memory stays flat however long
+    # the run; write() joins the spools so each key's series is one contiguous
+    # slice on disk.
+    def __init__(self, spool_dir):
+        self.spool_dir = spool_dir
+        self.key_ids = {}
+        self.loop_ids = {}
+        self.series = []
+        self.counts = []
+        self.buffered = 0
+        self.skipped = 0
+
+    def spool_path(self, key_id, name):
+        return os.path.join(self.spool_dir, f"{key_id}.{name}")
+
+    def key_id_for(self, key):
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            key_id = len(self.series)
+            self.key_ids[key] = key_id
+            self.series.append((array.array("q"), array.array("d"), array.array("i")))
+            self.counts.append(0)
+        return key_id
+
+    def loop_id_for(self, loop):
+        loop_id = self.loop_ids.get(loop)
+        if loop_id is None:
+            loop_id = len(self.loop_ids)
+            self.loop_ids[loop] = loop_id
+        return loop_id
+
+    def append(self, tick, key, value, loop):
+        if not isinstance(value, (int, float)):
+            self.skipped += 1
+            return
+        key_id = self.key_id_for(key)
+        ticks, values, loops = self.series[key_id]
+        ticks.append(tick if type(tick) is int else -1)
+        values.append(float(value))
+        loops.append(self.loop_id_for(loop))
+        self.counts[key_id] += 1
+        self.buffered += 1
+        if self.buffered >= METRIC_COLUMN_FLUSH_SAMPLES:
+            self.flush()
+
+    def flush(self):
+        if not self.buffered:
+            return
+        ensure_dir(self.spool_dir)
+        for key_id, columns in enumerate(self.series):
+            if not columns[0]:
+                continue
+            for name, values in zip(("tick", "value", "loop"), columns):
+                with open(self.spool_path(key_id, name), "ab") as handle:
+                    write_little_endian(handle, values)
+            self.series[key_id] = (array.array("q"), array.array("d"), array.array("i"))
+        self.buffered = 0
+
+    def extend(self, other):
+        # Appends another scan's columns as if its samples came after ours.
+        # Both sides are flushed, so this only appends spool files.
+        self.flush()
+        other.flush()
+        loop_map = [self.loop_id_for(loop) for loop in other.loop_ids]
+        identity = loop_map == list(range(len(loop_map)))
+        for key, other_id in other.key_ids.items():
+            key_id = self.key_id_for(key)
+            if not other.counts[other_id]:
+                continue
+            ensure_dir(self.spool_dir)
+            for name in ("tick", "value", "loop"):
+                with open(other.spool_path(other_id, name), "rb") as src, open(self.spool_path(key_id, name), "ab") as dst:
+                    if name != "loop" or identity:
+                        shutil.copyfileobj(src, dst)
+                        continue
+                    while True:
+                        chunk = array.array("i", src.read(METRIC_COLUMN_FLUSH_SAMPLES * 4))
+                        if not chunk:
+                            break
+                        if sys.byteorder != "little":
+                            chunk.byteswap()
+                        write_little_endian(dst, array.array("i", [loop_map[i] for i in chunk]))
+            self.counts[key_id] += other.counts[other_id]
+        self.skipped += other.skipped
+
+    def discard(self):
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def write(self, store_dir):
+        self.flush()
+        ensure_dir(store_dir)
+        ranges = []
+        total = 0
+        for count in self.counts:
+            ranges.append([total, total + count])
+            total += count
+        files = {}
+        for name, _, descr in METRIC_STORE_COLUMNS:
+            files[name] = f"{name}.npy"
+            with open(os.path.join(store_dir, files[name]), "wb") as handle:
+                write_npy_header(handle, descr, total)
+                for key_id, count in enumerate(self.counts):
+                    if not count:
+                        continue
+                    if name != "key":
+                        with open(self.spool_path(key_id, name), "rb") as src:
+                            shutil.copyfileobj(src, handle)
+                        continue
+                    block = array.array("i", [key_id]) * min(count, METRIC_COLUMN_FLUSH_SAMPLES)
+                    for start in range(0, count, len(block)):
+                        write_little_endian(handle, block[:count - start])
+        self.discard()
+        manifest = {
+            "schema_version": 1,
+            "count": total,
+            "keys": list(self.key_ids.keys()),
+            "ranges": ranges,
+            "loops": list(self.loop_ids.keys()),
+            "columns": files,
+            "missing_tick": -1,
+            "skipped_non_numeric": self.skipped
+        }
+        manifest_path = os.path.join(store_dir, "manifest.json")
+        with open(manifest_path, "w", encoding="utf-8") as handle:
+            json.dump(manifest, handle, indent=2, sort_keys=True)
+        return manifest_path
+
+
+def load_metric_store(run_dir):
+    manifest_path = os.path.join(run_dir, METRIC_STORE_DIRNAME, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    return load_json(manifest_path)
+
+
+def write_metric_sketches(store_dir, sketches):
+    # Serialized MetricSketch per key, kept next to the columns rather than in
+    # result.json; multi-seed runs merge these.
+    ensure_dir(store_dir)
+    sketches_path = os.path.join(store_dir, METRIC_SKETCHES_NAME)
+    with open(sketches_path, "w", encoding="utf-8") as handle:
+        json.dump(sketches, handle, sort_keys=True)
+    return sketches_path
+
 
+def load_metric_sketches(store_dir):
+    sketches_path = os.path.join(store_dir, METRIC_SKETCHES_NAME) if store_dir else None
+    if not sketches_path or not os.path.exists(sketches_path):
+        return {}
+    try:
+        return load_json(sketches_path)
+    except Exception:
+        return {}
+
+
+def load_metric_series(run_dir, key, manifest=None):
+    # Returns {"tick", "value", "loop"} for one metric key as NumPy arrays
+    # (array.array without numpy), or None when the key was never sampled.
+    manifest = manifest or load_metric_store(run_dir)
+    if not manifest or key not in manifest.get("keys", []):
+        return None
+    start, stop = manifest["ranges"][manifest["keys"].index(key)]
+    store_dir = os.path.join(run_dir, METRIC_STORE_DIRNAME)
+    series = {}
+    for name, typecode, _ in METRIC_STORE_COLUMNS:
+        if name == "key":
+            continue
+        series[name] = read_npy(os.path.join(store_dir, manifest["columns"][name]), typecode, start, stop)
+    return series
+
+
+class TelemetryScanner:
+    def __init__(self, run_dir, pack_caps=None, abort_invariants=None, keep_events=True, decoder=None, keep_metrics_jsonl=True, codec=None):
+        self.codec = codec
+        self.invariants_path = os.path.join(run_dir, "invariants.jsonl")
+        self.metric_store_dir = os.path.join(run_dir, METRIC_STORE_DIRNAME)
+        self.metric_columns = MetricColumns(os.path.join(self.metric_store_dir, ".spool"))
+        self.metrics_handle, self.metrics_path = open_compressed_writer(os.path.join(run_dir, "metrics.jsonl"), codec) if keep_metrics_jsonl else (None, None)
+        self.events_handle, self.events_path = open_compressed_writer(os.path.join(run_dir, "events.jsonl"), codec) if keep_events else (None, None)
+        self.decoder_name, self.fast_loads = resolve_json_decoder(decoder)
+        self.resource_keys = {}
+        self.constant_hits = 0
+        self.stdlib_decoder = json.JSONDecoder(parse_constant=self.on_constant, parse_float=self.on_float)
+        self.stats = {}
+        self.sketches = {}
+        self.first_tick = None
+        self.first_tick_at = None
+        self.last_tick = None
+        self.monotonic_ok = True
+        self.parse_errors = 0
+        self.nan_inf_found = 0
+        self.negative_counts = 0
+        self.negative_resources = 0
+        self.seed_used = None
+        self.scenario_id = None
+        self.abort_invariants = set(abort_invariants or ())
+        self.violation = None
+        self.violation_event = threading.Event()
+        caps = pack_caps or {}
+        self.cap_bytes = caps.get("max_bytes")
+        self.cap_events_per_tick = caps.get("max_events_per_tick")
+        self.cap_action = caps.get("on_exceed") or "truncate"
+        self.cap_events_action = caps.get("on_exceed_events") or "warn"
+        self.cap_exceeded = None
+        self.cap_warning = None
+        self.cap_kill_event = threading.Event()
+        self.events_tick = None
+        self.events_in_tick = 0
+        self.events_runs = 0
+        self.events_head = None
+        self.accepting = True
+
+    def note_cap(self, cap, value, limit, tick=None, action=None):
+        action = action or self.cap_action
+        if tick is None:
+            tick = self.last_tick
+        if action == "warn":
+            if self.cap_warning is None:
+                self.cap_warning = {"cap": cap, "value": value, "limit": limit, "tick": tick, "action": action}
+            return
+        if self.cap_exceeded is not None:
+            return
+        self.cap_exceeded = {"cap": cap, "value": value, "limit": limit, "tick": tick, "action": action}
+        if action == "kill":
+            self.cap_kill_event.set()
+        else:
+            self.accepting = False
+
+    def note_size(self, size_bytes):
+        if self.cap_action == "kill" and isinstance(self.cap_bytes, int) and 0 < self.cap_bytes < size_bytes:
+            self.note_cap("max_bytes", size_bytes, self.cap_bytes)
+
+    def note_violation(self, name, tick, record):
+        if self.violation is not None or name not in self.abort_invariants:
+            return
+        # Stored in result.json, which must stay strict JSON.
+        self.violation = {"name": name, "tick": tick, "record": replace_non_finite(record)}
+        self.violation_event.set()
+
+    def update_stats(self, key, value, tick):
+        # min/max skip NaN and finish() reports NaN only when the first sample
+        # was NaN, which is what a running min()/max() fold produces. Keeping
+        # the NaN-free extremes lets shard stats merge in any split.
+        entry = self.stats.get(key)
+        if entry is None:
+            finite = value if value == value else None
+            self.stats[key] = {"count": 1, "first": value, "min": finite, "max": finite, "last": value, "last_tick": tick}
+            sketch = self.sketches[key] = MetricSketch()
+            sketch.add(value)
+            return
+        self.sketches[key].add(value)
+        entry["count"] += 1
+        if value == value:
+            if entry["min"] is None or value < entry["min"]:
+                entry["min"] = value
+            if entry["max"] is None or value > entry["max"]:
+                entry["max"] = value
+        entry["last"] = value
+        entry["last_tick"] = tick
+
+    def is_resource_key(self, key):
+        cached = self.resource_keys.get(key)
+        if cached is None:
+            cached = looks_like_resource_key(key)
+            self.resource_keys[key] = cached
+        return cached
+
+    def on_constant(self, name):
+        self.constant_hits += 1
+        return float(name)
+
+    def on_float(self, text):
+        value = float(text)
+        if value - value != 0.0:
+            self.constant_hits += 1
+        return value
+
+    def decode_stdlib(self, raw_line):
+        hits = self.constant_hits
+        record = self.stdlib_decoder.decode(raw_line)
+        return record, self.constant_hits != hits
+
+    def decode(self, raw_line):
+        # Returns (record, has_non_finite) without walking the record: the
+        # stdlib hooks see every NaN/Infinity constant and overflowing float
+        # literal, and orjson rejects both so those lines land in the stdlib.
+        if self.fast_loads is None:
+            return self.decode_stdlib(raw_line)
+        try:
+            record = self.fast_loads(raw_line)
+        except Exception:
+            return self.decode_stdlib(raw_line)
+        if self.decoder_name == "msgspec" and FLOAT_OVERFLOW_RE.search(raw_line):
+            return record, contains_non_finite(record)
+        return record, False
+
+    def feed(self, raw_line, end_offset=None):
+        if not self.accepting:
+            return
+        if end_offset is not None and isinstance(self.cap_bytes, int) and 0 < self.cap_bytes < end_offset:
+            self.note_cap("max_bytes", end_offset, self.cap_bytes)
+            if not self.accepting:
+                return
+        if not raw_line:
+            return
+        try:
+            record, non_finite = self.decode(raw_line)
+        except Exception:
+            self.parse_errors += 1
+            return
+        tick = record.get("tick")
+        record_type = record.get("type")
+        if record_type not in EVENT_CAP_SKIPPED_TYPES and isinstance(tick, int) and isinstance(self.cap_events_per_tick, int) and self.cap_events_per_tick > 0:
+            if tick != self.events_tick:
+                if self.events_runs == 1:
+                    self.events_head = (self.events_tick, self.events_in_tick)
+                self.events_runs += 1
+                self.events_tick = tick
+                self.events_in_tick = 0
+            self.events_in_tick += 1
+            if self.events_in_tick > self.cap_events_per_tick:
+                self.note_cap("max_events_per_tick", self.events_in_tick, self.cap_events_per_tick, tick, self.cap_events_action)
+                if not self.accepting:
+                    return
+        if non_finite:
+            self.nan_inf_found += 1
+            self.note_violation("telemetry.no_nan_inf", tick, record)
+        if isinstance(tick, int):
+            if self.first_tick is None:
+                self.first_tick = tick
+                self.first_tick_at = time.monotonic()
+            if self.last_tick is not None and tick < self.last_tick:
+                self.monotonic_ok = False
+                self.note_violation("telemetry.monotonic_tick", tick, record)
+            self.last_tick = tick
+        if self.seed_used is None and isinstance(record.get("seed"), int):
+            self.seed_used = record.get("seed")
+        if self.scenario_id is None and record.get("scenario"):
+            self.scenario_id = record.get("scenario")
+        if record_type == "metric":
+            key = record.get("key")
+            value = record.get("value")
+            unit = record.get("unit")
+            loop = record.get("loop")
+            if self.metrics_handle is not None:
+                self.metrics_handle.write(format_metric_line(tick, key, value, unit, loop))
+            self.metric_columns.append(tick, key, value, loop)
+            if isinstance(value, (int, float)):
+                self.update_stats(key, value, tick)
+                if unit == "count" and value < 0:
+                    self.negative_counts += 1
+                    self.note_violation("telemetry.no_negative_counts", tick, record)
+                if value < 0 and key and self.is_resource_key(key):
+                    self.negative_resources += 1
+                    self.note_violation("telemetry.no_negative_resources", tick, record)
+        elif self.events_handle is not None:
+            self.events_handle.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def close_outputs(self):
+        if self.metrics_handle is not None:
+            self.metrics_handle.close()
+        if self.events_handle is not None:
+            self.events_handle.close()
+
+    def discard(self):
+        self.close_outputs()
+        self.metric_columns.discard()
+        for path in (self.metrics_path, self.events_path):
+            if not path:
+                continue
+            try:
+                os.remove(path)
+            except Exception:
+                pass
+
+    def snapshot(self):
+        # Mergeable state of a shard scan; see merge(). The metric columns go
+        # across as spool paths, which must outlive the shard process.
+        self.metric_columns.flush()
+        head = self.events_head
+        if head is None and self.events_runs == 1:
+            head = (self.events_tick, self.events_in_tick)
+        return {
+            "metrics_path": self.metrics_path,
+            "events_path": self.events_path,
+            "metric_columns": self.metric_columns,
+            "stats": self.stats,
+            "sketches": self.sketches,
+            "first_tick": self.first_tick,
+            "last_tick": self.last_tick,
+            "monotonic_ok": self.monotonic_ok,
+            "parse_errors": self.parse_errors,
+            "nan_inf_found": self.nan_inf_found,
+            "negative_counts": self.negative_counts,
+            "negative_resources": self.negative_resources,
+            "seed_used": self.seed_used,
+            "scenario_id": self.scenario_id,
+            "cap_exceeded": self.cap_exceeded,
+            "cap_warning": self.cap_warning,
+            "events_head": head,
+            "events_tail": (self.events_tick, self.events_in_tick),
+            "events_runs": self.events_runs
+        }
+
+    def merge(self, part):
+        # Folds a shard snapshot into this scanner as if its lines had been fed
+        # here. Shards must be merged in file order.
+        for path, handle in ((part["metrics_path"], self.metrics_handle), (part["events_path"], self.events_handle)):
+            if path and handle is not None:
+                with open(path, "r", encoding="utf-8") as src:
+                    shutil.copyfileobj(src, handle)
+        self.metric_columns.extend(part["metric_columns"])
+        for key, other in part["stats"].items():
+            entry = self.stats.get(key)
+            if entry is None:
+                self.stats[key] = dict(other)
+                continue
+            entry["count"] += other["count"]
+            if other["min"] is not None and (entry["min"] is None or other["min"] < entry["min"]):
+                entry["min"] = other["min"]
+            if other["max"] is not None and (entry["max"] is None or other["max"] > entry["max"]):
+                entry["max"] = other["max"]
+            entry["last"] = other["last"]
+            entry["last_tick"] = other["last_tick"]
+        for key, other in part["sketches"].items():
+            if key in self.sketches:
+                self.sketches[key].merge(other)
+            else:
+                self.sketches[key] = other
+
+        if part["first_tick"] is not None:
+            if self.first_tick is None:
+                self.first_tick = part["first_tick"]
+            elif part["first_tick"] < self.last_tick:
+                self.monotonic_ok = False
+            self.last_tick = part["last_tick"]
+        if not part["monotonic_ok"]:
+            self.monotonic_ok = False
+        self.parse_errors += part["parse_errors"]
+        self.nan_inf_found += part["nan_inf_found"]
+        self.negative_counts += part["negative_counts"]
+        self.negative_resources += part["negative_resources"]
+        if self.seed_used is None:
+            self.seed_used = part["seed_used"]
+        if self.scenario_id is None:
+            self.scenario_id = part["scenario_id"]
+
+        # A shard counts events per tick from zero, so a run that straddles the
+        # border is re-counted here with the carry from the previous shards.
+        if part["events_head"] is not None:
+            head_tick, head_count = part["events_head"]
+            carried = head_tick == self.events_tick
+            if carried and self.events_in_tick + head_count > self.cap_events_per_tick:
+                self.note_cap("max_events_per_tick", self.cap_events_per_tick + 1, self.cap_events_per_tick, head_tick, self.cap_events_action)
+            if carried and part["events_runs"] == 1:
+                self.events_in_tick += head_count
+            else:
+                self.events_tick, self.events_in_tick = part["events_tail"]
+        if part["cap_warning"] is not None and self.cap_warning is None:
+            self.cap_warning = dict(part["cap_warning"])
+        if part["cap_exceeded"] is not None and self.cap_exceeded is None:
+            self.cap_exceeded = dict(part["cap_exceeded"])
+            if self.cap_exceeded["action"] == "kill":
+                self.cap_kill_event.set()
+
+    def finish(self, telemetry_path):
+        self.close_outputs()
+        self.metric_columns.write(self.metric_store_dir)
+
+        metrics_summary = {}
+        metrics_stats = {}
+        metrics_sketches = {}
+        for key, entry in self.stats.items():
+            # Fed per sample during the scan; a sharded scan merges the shard
+            # sketches, so only the mean/stdev rounding can differ.
+            sketch = self.sketches[key]
+            first = entry["first"]
+            metrics_stats[key] = {
+                "count": entry["count"],
+                "min": first if first != first else entry["min"],
+                "max": first if first != first else entry["max"],
+                "mean": sketch.mean,
+                "stdev": sketch.stdev(),
+                "last": entry["last"],
+                "last_tick": entry["last_tick"]
+            }
+            metrics_stats[key].update(sketch.quantiles())
+            metrics_sketches[key] = sketch.to_dict()
+            metrics_summary[key] = entry["last"]
+        write_metric_sketches(self.metric_store_dir, metrics_sketches)
+
+        first_tick = self.first_tick
+        last_tick = self.last_tick
+        size_bytes = os.path.getsize(telemetry_path) if os.path.exists(telemetry_path) else 0
+        cap_bytes = self.cap_bytes
+        under_cap = True
+        if isinstance(cap_bytes, int) and cap_bytes > 0:
+            under_cap = size_bytes <= cap_bytes
+
+        telemetry_truncated = 0 if under_cap and self.cap_exceeded is None else 1
+        last_tick_value = last_tick if isinstance(last_tick, int) else None
+        metrics_summary["telemetry.bytes_written"] = size_bytes
+        metrics_summary["telemetry.truncated"] = telemetry_truncated
+        metrics_stats["telemetry.bytes_written"] = {
+            "count": 1,
+            "min": size_bytes,
+            "max": size_bytes,
+            "mean": float(size_bytes),
+            "stdev": 0.0,
+            "last": size_bytes,
+            "last_tick": last_tick_value
+        }
+        metrics_stats["telemetry.bytes_written"].update({name: size_bytes for name, _ in SKETCH_QUANTILES})
+        metrics_stats["telemetry.truncated"] = {
+            "count": 1,
+            "min": telemetry_truncated,
+            "max": telemetry_truncated,
+            "mean": float(telemetry_truncated),
+            "stdev": 0.0,
+            "last": telemetry_truncated,
+            "last_tick": last_tick_value
+        }
+        metrics_stats["telemetry.truncated"].update({name: telemetry_truncated for name, _ in SKETCH_QUANTILES})
+
+        invariants = [
+            {"name": "telemetry.parse_errors", "ok": self.parse_errors == 0, "value": self.parse_errors},
+            {"name": "telemetry.monotonic_tick", "ok": self.monotonic_ok, "first_tick": first_tick, "last_tick": last_tick},
+            {"name": "telemetry.no_nan_inf", "ok": self.nan_inf_found == 0, "value": self.nan_inf_found},
+            {"name": "telemetry.no_negative_counts", "ok": self.negative_counts == 0, "value": self.negative_counts},
+            {"name": "telemetry.no_negative_resources", "ok": self.negative_resources == 0, "value": self.negative_resources},
+            {"name": "telemetry.output_under_cap", "ok": under_cap, "size_bytes": size_bytes, "cap_bytes": cap_bytes}
+        ]
+
+        handle, self.invariants_path = open_compressed_writer(self.invariants_path, self.codec)
+        with handle:
+            for inv in invariants:
+                handle.write(json.dumps(inv, sort_keys=True) + "\n")
 
-def maybe_compress(path, compress):
-    if not compress:
-        return path
-    gz_path = path + ".gz"
-    with open(path, "rb") as src, gzip.open(gz_path, "wb") as dst:
-        shutil.copyfileobj(src, dst)
-    os.remove(path)
-    return gz_path
+        return {
+            "metrics_path": self.metrics_path,
+            "events_path": self.events_path,
+            "invariants_path": self.invariants_path,
+            "metric_store_path": self.metric_store_dir,
+            "metrics_summary": metrics_summary,
+            "metrics_stats": metrics_stats,
+            "invariants": invariants,
+            "first_tick": first_tick,
+            "last_tick": last_tick,
+            "telemetry_size_bytes": size_bytes,
+            "seed_used": self.seed_used,
+            "scenario_id": self.scenario_id,
+            "cap_exceeded": self.cap_exceeded or self.cap_warning
+        }
+
+
+def iter_telemetry_lines(telemetry_path, start=0, end=None, chunk_bytes=1 << 20):
+    # Decoded lines of the byte range [start, end), split the same way as the
+    # live tailer. Ranges from split_telemetry_ranges start on a line boundary.
+    with open(telemetry_path, "rb") as handle:
+        handle.seek(start)
+        remaining = end - start if end is not None else None
+        pending = b""
+        first = start == 0
+        while remaining is None or remaining > 0:
+            chunk = handle.read(chunk_bytes if remaining is None else min(chunk_bytes, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            if first:
+                first = False
+                if chunk.startswith(UTF8_BOM):
+                    chunk = chunk[len(UTF8_BOM):]
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line.rstrip(b"\r").decode("utf-8", errors="replace")
+        if pending:
+            yield pending.rstrip(b"\r").decode("utf-8", errors="replace")
+
+
+def split_telemetry_ranges(telemetry_path, shards):
+    size_bytes = os.path.getsize(telemetry_path)
+    bounds = [0]
+    with open(telemetry_path, "rb") as handle:
+        for index in range(1, shards):
+            target = size_bytes * index // shards
+            if target <= bounds[-1]:
+                continue
+            handle.seek(target - 1)
+            handle.readline()
+            boundary = handle.tell()
+            if bounds[-1] < boundary < size_bytes:
+                bounds.append(boundary)
+    bounds.append(size_bytes)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def resolve_scan_shards(telemetry_path, scanner, requested=None):
+    # Sharding needs every line scanned, so it is off when a cap truncates
+    # the scan. "auto" shards files over SCAN_SHARD_MIN_BYTES across CPUs.
+    raw = requested if requested is not None else os.environ.get("HEADLESSCTL_SCAN_SHARDS", "")
+    if isinstance(scanner.cap_events_per_tick, int) and scanner.cap_events_per_tick > 0 and scanner.cap_events_action == "truncate":
+        return 1
+    try:
+        size_bytes = os.path.getsize(telemetry_path)
+    except Exception:
+        return 1
+    if raw in ("", "auto"):
+        if size_bytes < SCAN_SHARD_MIN_BYTES:
+            return 1
+        return max(1, min(os.cpu_count() or 1, size_bytes // SCAN_SHARD_MIN_BYTES))
+    try:
+        count = int(raw)
+    except (TypeError, ValueError):
+        return 1
+    return max(1, count)
+
+
+def scan_telemetry_shard(telemetry_path, start, end, shard_dir, pack_caps, keep_events, decoder, keep_metrics_jsonl):
+    ensure_dir(shard_dir)
+    scanner = TelemetryScanner(shard_dir, pack_caps, keep_events=keep_events, decoder=decoder, keep_metrics_jsonl=keep_metrics_jsonl)
+    for line in iter_telemetry_lines(telemetry_path, start, end):
+        scanner.feed(line)
+    scanner.close_outputs()
+    return scanner.snapshot()
+
+
+def scan_telemetry_sharded(scanner, telemetry_path, run_dir, shards, pack_caps, keep_events, decoder, keep_metrics_jsonl):
+    # Scans newline-aligned byte ranges in worker processes and merges them in
+    # file order. Returns False (scanner untouched) when the pool fails.
+    ranges = split_telemetry_ranges(telemetry_path, shards)
+    shard_root = os.path.join(run_dir, ".scan_shards")
+    try:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=context) as pool:
+            futures = [
+                pool.submit(scan_telemetry_shard, telemetry_path, start, end, os.path.join(shard_root, str(index)), pack_caps, keep_events, decoder, keep_metrics_jsonl)
+                for index, (start, end) in enumerate(ranges)
+            ]
+            parts = [future.result() for future in futures]
+        for part in parts:
+            scanner.merge(part)
+        return True
+    except Exception as exc:
+        eprint(f"HEADLESSCTL: sharded telemetry scan failed {exc}")
+        return False
+    finally:
+        shutil.rmtree(shard_root, ignore_errors=True)
+
+
+def scan_telemetry(telemetry_path, run_dir, pack_caps, keep_events=True, decoder=None, keep_metrics_jsonl=True, shards=None, codec=None):
+    scanner = TelemetryScanner(run_dir, pack_caps, keep_events=keep_events, decoder=decoder, keep_metrics_jsonl=keep_metrics_jsonl, codec=codec)
+    shard_count = resolve_scan_shards(telemetry_path, scanner, shards)
+    if shard_count > 1 and scan_telemetry_sharded(scanner, telemetry_path, run_dir, shard_count, pack_caps, keep_events, decoder, keep_metrics_jsonl):
+        return scanner.finish(telemetry_path)
+    for line in iter_telemetry_lines(telemetry_path):
+        scanner.feed(line)
+        if not scanner.accepting:
+            break
+    return scanner.finish(telemetry_path)
+
+
+class TelemetryTailer(threading.Thread):
+    # Follows telemetry.ndjson while the headless process writes it so the scan
+    # is already done when the process exits. If the file is replaced or
+    # truncated underneath us the tail is marked invalid and the caller falls
+    # back to a full scan_telemetry pass.
+    def __init__(self, telemetry_path, scanner, poll_s=0.05, chunk_bytes=1 << 20):
+        super().__init__(name="telemetry-tailer", daemon=True)
+        self.telemetry_path = telemetry_path
+        self.scanner = scanner
+        self.poll_s = poll_s
+        self.chunk_bytes = chunk_bytes
+        self.handle = None
+        self.offset = 0
+        self.pending = b""
+        self.valid = True
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.poll()
+            self.stop_event.wait(self.poll_s)
+
+    def poll(self):
+        with self.lock:
+            if not self.valid:
+                return
+            try:
+                self.read_available()
+            except Exception as exc:
+                eprint(f"HEADLESSCTL: telemetry tail failed {exc}")
+                self.valid = False
+
+    def read_available(self):
+        if self.handle is None:
+            if not os.path.exists(self.telemetry_path):
+                return
+            self.handle = open(self.telemetry_path, "rb")
+        size_bytes = os.fstat(self.handle.fileno()).st_size
+        if size_bytes < self.offset:
+            self.valid = False
+            return
+        self.scanner.note_size(size_bytes)
+        while self.scanner.accepting:
+            chunk = self.handle.read(self.chunk_bytes)
+            if not chunk:
+                return
+            if self.offset == 0 and chunk.startswith(b"\xef\xbb\xbf"):
+                chunk = chunk[3:]
+                self.offset += 3
+            data = self.pending + chunk
+            line_offset = self.offset - len(self.pending)
+            self.offset += len(chunk)
+            lines = data.split(b"\n")
+            self.pending = lines.pop()
+            for line in lines:
+                line_offset += len(line) + 1
+                self.scanner.feed(line.rstrip(b"\r").decode("utf-8", errors="replace"), line_offset)
+
+    def finish(self):
+        # Stops the thread and drains the tail, including a final unterminated
+        # line. Returns True when the scanner saw the whole current file.
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.poll()
+        with self.lock:
+            if self.handle is None:
+                return False
+            try:
+                same_file = os.path.samestat(os.fstat(self.handle.fileno()), os.stat(self.telemetry_path))
+            except Exception:
+                same_file = False
+            self.handle.close()
+            if not same_file:
+                self.valid = False
+            if self.valid and self.pending:
+                self.scanner.feed(self.pending.rstrip(b"\r").decode("utf-8", errors="replace"), self.offset)
+                self.pending = b""
+            return self.valid
+
+
+def pack_includes_artifact(pack, name):
+    include = pack.get("artifacts_include")
+    if include is not None and name not in include:
+        return False
+    return name not in set(pack.get("artifacts_exclude", []))
 
 
 def build_error_result(error_code, error, run_id=None):
@@ -1000,14 +2995,15 @@ def build_error_result(error_code, error, run_id=None):
     }
 
 
-def run_task_internal(task_id, seed, pack_name):
+def run_task_internal(task_id, seed, pack_name, cancel_event=None, use_cache=True):
+    timer = PhaseTimer()
     tool_root = resolve_tool_root()
     tri_root = resolve_tri_root()
     if not is_tri_root(tri_root):
         return build_error_result("tri_root_invalid", f"TRI_ROOT invalid: {tri_root}"), 2
     state_dir = resolve_state_dir(tri_root)
     tasks_path, _ = get_tasks_registry_paths(tool_root)
-    packs_path = os.path.join(tool_root, "Tools", "Headless", "headless_packs.json")
+    packs_path = get_packs_registry_path(tool_root)
 
     try:
         tasks_doc, _ = load_tasks_document(tool_root, required=True)
@@ -1017,8 +3013,9 @@ def run_task_internal(task_id, seed, pack_name):
     if not os.path.exists(packs_path):
         return build_error_result("packs_missing", f"packs registry not found: {packs_path}"), 2
 
+    registry = load_registry(tool_root)
     tasks = tasks_doc.get("tasks", {})
-    packs = load_json(packs_path).get("packs", {})
+    packs = registry["packs"]
 
     if task_id not in tasks:
         return build_error_result("task_not_found", f"task not found: {task_id}"), 2
@@ -1031,34 +3028,29 @@ def run_task_internal(task_id, seed, pack_name):
         return build_error_result("pack_not_found", f"pack not found: {pack_name}"), 2
 
     pack = packs[pack_name]
+    try:
+        codec = parse_codec_spec(pack.get("compress_jsonl"))
+    except ValueError as exc:
+        return build_error_result("pack_invalid", f"pack {pack_name} compress_jsonl: {exc}"), 2
+    timer.mark("registry")
 
     project = task.get("project")
     runner = task.get("runner")
     scenario_path = task.get("scenario_path")
     required_bank = task.get("required_bank")
-    allow_exit_codes = task.get("allow_exit_codes")
-    if allow_exit_codes is None:
-        allow_exit_codes = [0]
-    elif isinstance(allow_exit_codes, (int, float)):
-        allow_exit_codes = [int(allow_exit_codes)]
-    else:
-        allow_exit_codes = [int(code) for code in allow_exit_codes]
-    if 0 not in allow_exit_codes:
-        allow_exit_codes.append(0)
-    timeout_s = task.get("timeout_s")
-    if not isinstance(timeout_s, (int, float)) or timeout_s <= 0:
-        timeout_s = DEFAULT_TIMEOUT_S
-    timeout_s = int(timeout_s)
+    settings = registry["normalized"].get(task_id) or normalize_task_settings(task)
+    allow_exit_codes = settings["allow_exit_codes"]
+    timeout_s = settings["timeout_s"]
 
     binary = find_binary(tri_root, state_dir, project)
     if not binary or not os.path.exists(binary):
         return build_error_result("binary_missing", f"binary not found for project {project}: {binary}"), 2
     ensure_executable(binary)
+    timer.mark("binary_resolve")
 
     run_id = uuid.uuid4().hex
     runs_dir = os.path.join(state_dir, "runs")
     run_dir = os.path.join(runs_dir, run_id)
-    ensure_dir(run_dir)
 
     scenario_abs = resolve_scenario_path(tri_root, scenario_path) if scenario_path else None
     scenario_existing = scenario_abs if scenario_abs and os.path.exists(scenario_abs) else None
@@ -1075,7 +3067,23 @@ def run_task_internal(task_id, seed, pack_name):
         default_seeds = task.get("default_seeds") or []
         if default_seeds:
             seed_requested = int(default_seeds[0])
-    scenario_used, seed_effective = override_seed_if_supported(scenario_existing, run_dir, seed_requested, runner)
+
+    input_fingerprint = run_input_fingerprint(state_dir, task_id, task, pack_name, pack, binary, scenario_launch, seed_requested)
+    timer.mark("input_fingerprint")
+    if use_cache and input_fingerprint:
+        cached = find_run_by_fingerprint(state_dir, input_fingerprint)
+        if cached:
+            timer.mark("cache_lookup")
+            result = dict(cached)
+            result["cached_from"] = cached.get("run_id")
+            result["timings"] = timer.to_dict()
+            eprint(f"HEADLESSCTL: run_task cached task={task_id} run_id={result['cached_from']} fingerprint={input_fingerprint[:12]}")
+            return result, 0
+
+    ensure_dir(run_dir)
+    index_run_started(state_dir, run_id, task_id, pack_name)
+    blob_dir = resolve_blob_dir(state_dir, pack)
+    scenario_used, seed_effective = override_seed_if_supported(scenario_existing, run_dir, seed_requested, runner, blob_dir)
     if scenario_used is None:
         scenario_used = scenario_launch
 
@@ -1096,6 +3104,7 @@ def run_task_internal(task_id, seed, pack_name):
             env["SPACE4X_SCENARIO_PATH"] = scenario_used
 
     cmd = [binary, "-batchmode", "-nographics", "-logFile", "-", "--scenario", scenario_used]
+    timer.mark("scenario_prepare")
 
     started_utc = utc_now()
     eprint(f"HEADLESSCTL: run_task start task={task_id} run_id={run_id} pack={pack_name}")
@@ -1104,57 +3113,115 @@ def run_task_internal(task_id, seed, pack_name):
     telemetry_out = None
     exit_code = None
     timed_out = False
-
-    with open(stdout_path, "w", encoding="utf-8") as log_handle:
+    cancelled = False
+    invariant_abort = None
+    cap_kill = None
+    keep_events = pack_includes_artifact(pack, "events")
+    keep_metrics_jsonl = pack.get("metrics_jsonl", True) is not False
+    live_scanner = TelemetryScanner(run_dir, pack.get("caps"), resolve_abort_invariants(task, pack), keep_events, keep_metrics_jsonl=keep_metrics_jsonl, codec=codec)
+    tailer = TelemetryTailer(telemetry_path, live_scanner)
+    tailer.start()
+    spawned_at = None
+    first_stdout_line_at = None
+
+    with open(stdout_path, "wb", buffering=LOG_BUFFER_BYTES) as log_handle:
         try:
-            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, text=True, encoding="utf-8", errors="replace")
+            timer.mark("launch_prepare")
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+            spawned_at = time.monotonic()
+            timer.mark("process_spawn")
+            stdout_fd = proc.stdout.fileno()
+            os.set_blocking(stdout_fd, False)
             selector = selectors.DefaultSelector()
-            selector.register(proc.stdout, selectors.EVENT_READ)
+            selector.register(stdout_fd, selectors.EVENT_READ)
             start_time = time.monotonic()
+            last_flush = start_time
+            pending = b""
+            stdout_eof = False
 
-            def handle_line(line):
+            def handle_lines(data):
                 nonlocal telemetry_out
-                log_handle.write(line)
-                log_handle.flush()
-                stripped = line.strip()
-                bank = parse_bank_line(stripped)
-                if bank:
-                    bank_results.append(bank)
-                if stripped.startswith("TELEMETRY_OUT:"):
-                    telemetry_out = stripped.split(":", 1)[1].strip()
+                for match in STDOUT_MARKER_RE.finditer(data):
+                    stripped = match.group(0).decode("utf-8", errors="replace").strip()
+                    if match.group(1) == b"BANK":
+                        bank = parse_bank_line(stripped)
+                        if bank:
+                            bank_results.append(bank)
+                    else:
+                        telemetry_out = stripped.split(":", 1)[1].strip()
+
+            def drain_stdout():
+                nonlocal pending, stdout_eof, first_stdout_line_at
+                while not stdout_eof:
+                    try:
+                        chunk = os.read(stdout_fd, STDOUT_READ_BYTES)
+                    except BlockingIOError:
+                        return
+                    if not chunk:
+                        stdout_eof = True
+                        selector.unregister(stdout_fd)
+                        return
+                    log_handle.write(chunk)
+                    if first_stdout_line_at is None and b"\n" in chunk:
+                        first_stdout_line_at = time.monotonic()
+                    data = pending + chunk
+                    split_at = data.rfind(b"\n") + 1
+                    pending = data[split_at:]
+                    if split_at:
+                        handle_lines(data[:split_at])
 
             while True:
-                if timeout_s and time.monotonic() - start_time > timeout_s:
+                now = time.monotonic()
+                if timeout_s and now - start_time > timeout_s:
                     timed_out = True
-                    log_handle.write(f"HEADLESSCTL: timeout after {timeout_s}s\n")
-                    log_handle.flush()
+                    log_handle.write(f"HEADLESSCTL: timeout after {timeout_s}s\n".encode("utf-8"))
+                    proc.kill()
+                    break
+
+                if cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                    log_handle.write(b"HEADLESSCTL: cancelled\n")
+                    proc.kill()
+                    break
+
+                if live_scanner.violation_event.is_set():
+                    invariant_abort = live_scanner.violation
+                    log_handle.write(f"HEADLESSCTL: aborting on {invariant_abort['name']} at tick {invariant_abort['tick']}\n".encode("utf-8"))
+                    proc.kill()
+                    break
+
+                if live_scanner.cap_kill_event.is_set():
+                    cap_kill = live_scanner.cap_exceeded
+                    log_handle.write(f"HEADLESSCTL: telemetry cap {cap_kill['cap']} exceeded ({cap_kill['value']} > {cap_kill['limit']})\n".encode("utf-8"))
                     proc.kill()
                     break
 
                 if proc.poll() is not None:
-                    while True:
-                        line = proc.stdout.readline()
-                        if not line:
-                            break
-                        handle_line(line)
+                    drain_stdout()
                     break
 
-                events = selector.select(timeout=0.2)
-                if not events:
-                    continue
-                for key, _ in events:
-                    line = key.fileobj.readline()
-                    if not line:
-                        continue
-                    handle_line(line)
+                if stdout_eof:
+                    time.sleep(0.2)
+                elif selector.select(timeout=0.2):
+                    drain_stdout()
+
+                if now - last_flush >= LOG_FLUSH_INTERVAL_S:
+                    log_handle.flush()
+                    last_flush = now
+            if pending:
+                handle_lines(pending)
+            selector.close()
             try:
                 exit_code = proc.wait(timeout=5)
             except subprocess.TimeoutExpired:
                 exit_code = 124
         except Exception as exc:
             exit_code = 1
-            log_handle.write(f"HEADLESSCTL: run failed {exc}\n")
+            log_handle.write(f"HEADLESSCTL: run failed {exc}\n".encode("utf-8"))
+    timer.mark("simulation")
 
+    live_ok = tailer.finish()
+    timer.mark("telemetry_tail_drain")
     eprint(f"HEADLESSCTL: run_task finished run_id={run_id} exit_code={exit_code}")
 
     if telemetry_out and telemetry_out != telemetry_path:
@@ -1163,24 +3230,29 @@ def run_task_internal(task_id, seed, pack_name):
 
     telemetry_ok = os.path.exists(telemetry_path)
     telemetry_scan = None
-    if telemetry_ok:
-        telemetry_scan = scan_telemetry(telemetry_path, run_dir, pack.get("caps"))
+    if telemetry_ok and live_ok:
+        telemetry_scan = live_scanner.finish(telemetry_path)
+    else:
+        live_scanner.discard()
+        if telemetry_ok:
+            eprint(f"HEADLESSCTL: live telemetry tail incomplete, rescanning {telemetry_path}")
+            telemetry_scan = scan_telemetry(telemetry_path, run_dir, pack.get("caps"), keep_events, keep_metrics_jsonl=keep_metrics_jsonl, shards=pack.get("scan_shards"), codec=codec)
+    timer.mark("telemetry_scan")
 
-    compress_jsonl = bool(pack.get("compress_jsonl"))
     metrics_path = telemetry_scan["metrics_path"] if telemetry_scan else None
     events_path = telemetry_scan["events_path"] if telemetry_scan else None
     invariants_path = telemetry_scan["invariants_path"] if telemetry_scan else None
+    metric_store_path = telemetry_scan["metric_store_path"] if telemetry_scan else None
 
-    if metrics_path and os.path.exists(metrics_path):
-        metrics_path = maybe_compress(metrics_path, compress_jsonl)
-    if events_path and os.path.exists(events_path):
-        events_path = maybe_compress(events_path, compress_jsonl)
-    if invariants_path and os.path.exists(invariants_path):
-        invariants_path = maybe_compress(invariants_path, compress_jsonl)
+    blob_store = None
+    if blob_dir:
+        blob_store = ingest_run_dir(blob_dir, run_dir)
+        timer.mark("blob_ingest")
 
     metrics_summary = telemetry_scan["metrics_summary"] if telemetry_scan else {}
     metrics_stats = telemetry_scan["metrics_stats"] if telemetry_scan else {}
     invariants = telemetry_scan["invariants"] if telemetry_scan else []
+    telemetry_cap = telemetry_scan["cap_exceeded"] if telemetry_scan else None
     seed_used = telemetry_scan["seed_used"] if telemetry_scan else None
     scenario_id = telemetry_scan["scenario_id"] if telemetry_scan else None
 
@@ -1207,6 +3279,10 @@ def run_task_internal(task_id, seed, pack_name):
         ok = False
         error_code = "timeout"
         error = f"timeout_s={timeout_s}"
+    elif cancelled:
+        ok = False
+        error_code = "cancelled"
+        error = "run cancelled"
     elif exit_code is not None and exit_code not in allow_exit_codes:
         ok = False
         error_code = "run_failed"
@@ -1226,11 +3302,20 @@ def run_task_internal(task_id, seed, pack_name):
         ok = False
         error_code = "invariant_failed"
         error = "invariant check failed"
+    if cap_kill:
+        ok = False
+        error_code = "telemetry_cap_exceeded"
+        error = f"{cap_kill['cap']}={cap_kill['limit']} exceeded ({cap_kill['value']})"
+    if invariant_abort:
+        ok = False
+        error_code = "invariant_aborted"
+        error = f"{invariant_abort['name']} violated at tick {invariant_abort['tick']}"
 
     artifacts_all = {
         "stdout": stdout_path,
         "telemetry": telemetry_path if telemetry_ok else None,
         "metrics": metrics_path,
+        "metric_store": metric_store_path,
         "events": events_path,
         "invariants": invariants_path
     }
@@ -1265,6 +3350,9 @@ def run_task_internal(task_id, seed, pack_name):
         "exit_code": exit_code,
         "timeout_s": timeout_s,
         "timed_out": timed_out,
+        "cancelled": cancelled,
+        "invariant_abort": invariant_abort,
+        "telemetry_cap": telemetry_cap,
         "bank_required": required_bank,
         "bank_results": bank_results,
         "bank_status": bank_status,
@@ -1273,19 +3361,26 @@ def run_task_internal(task_id, seed, pack_name):
         "metrics_summary": metrics_summary,
         "metrics_stats": metrics_stats,
         "invariants": invariants,
-        "artifacts": artifacts
+        "artifacts": artifacts,
+        "blob_store": blob_store,
+        "input_fingerprint": input_fingerprint
     }
+    timer.mark("result_build")
+    # Live first tick only: a rescan after the run has no wall-clock meaning.
+    first_tick_at = live_scanner.first_tick_at if live_ok else None
+    timer.point("first_stdout_line_ms", elapsed_ms(spawned_at, first_stdout_line_at) if first_stdout_line_at else None)
+    timer.point("first_telemetry_tick_ms", elapsed_ms(spawned_at, first_tick_at) if spawned_at and first_tick_at else None)
+    result["timings"] = timer.to_dict()
 
-    result_path = os.path.join(run_dir, "result.json")
-    with open(result_path, "w", encoding="utf-8") as handle:
-        json.dump(result, handle, indent=2, sort_keys=True)
+    write_run_result(state_dir, run_dir, result, task.get("metric_keys"))
 
     eprint(f"HEADLESSCTL: run_task summary run_id={run_id} ok={ok} bank={bank_status.get('status') if bank_status else 'none'}")
 
     return result, 0 if ok else 3
 
 
-def run_task_multi(task_id, seeds, pack_name, task):
+def run_task_multi(task_id, seeds, pack_name, task, slots=None, use_cache=True):
+    timer = PhaseTimer()
     tri_root = resolve_tri_root()
     state_dir = resolve_state_dir(tri_root)
     run_id = uuid.uuid4().hex
@@ -1293,24 +3388,52 @@ def run_task_multi(task_id, seeds, pack_name, task):
     ensure_dir(run_dir)
 
     pack_used = pack_name or task.get("default_pack") or "nightly-default"
+    index_run_started(state_dir, run_id, task_id, pack_used, multi=True)
     metric_keys = task.get("metric_keys") or []
     variance_band = task.get("variance_band") or {}
+    seed_slots = resolve_seed_slots(slots, len(seeds))
 
     started_utc = utc_now()
-    seed_results = []
-    for seed in seeds:
-        result, exit_code = run_task_internal(task_id, seed, pack_name)
-        seed_results.append(result)
-        if exit_code == 2:
-            return result, 2
-
-    seed_runs, aggregate_summary, aggregate_stats, variance_grades, variance_pass, variance_failed_count = collect_seed_metrics(
+    eprint(f"HEADLESSCTL: run_task multi run_id={run_id} seeds={len(seeds)} slots={seed_slots}")
+    seed_results = [None] * len(seeds)
+    cancel_event = threading.Event()
+    hard_error = None
+    # A repeated seed is a determinism check, so only its first occurrence
+    # may be answered from an earlier run.
+    seed_use_cache = [use_cache and seed not in seeds[:index] for index, seed in enumerate(seeds)]
+    with ThreadPoolExecutor(max_workers=seed_slots) as executor:
+        futures = {
+            executor.submit(run_task_internal, task_id, seed, pack_name, cancel_event, seed_use_cache[index]): index
+            for index, seed in enumerate(seeds)
+        }
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            try:
+                result, exit_code = future.result()
+            except Exception as exc:
+                # Same as a hard error: stop the other seeds instead of leaving
+                # them running while the exception unwinds the executor.
+                result, exit_code = build_error_result("exception", f"seed {seeds[futures[future]]}: {exc}"), 2
+            seed_results[futures[future]] = result
+            if exit_code == 2 and hard_error is None:
+                hard_error = result
+                cancel_event.set()
+                for pending in futures:
+                    pending.cancel()
+    timer.mark("seed_runs")
+    if hard_error is not None:
+        return hard_error, 2
+
+    seed_runs, aggregate_summary, aggregate_stats, aggregate_sketches, variance_grades, variance_pass, variance_failed_count = collect_seed_metrics(
+        state_dir,
         seed_results,
         metric_keys,
         variance_band
     )
 
     aggregate_summary["eval.variance_failed_count"] = variance_failed_count
+    timer.mark("aggregate")
 
     seed_ok = all(run.get("ok") for run in seed_results)
     ok = seed_ok and variance_pass
@@ -1339,6 +3462,7 @@ def run_task_multi(task_id, seeds, pack_name, task):
         "scenario_id": scenario_id,
         "tick_budget": task.get("tick_budget"),
         "seeds_requested": seeds,
+        "seed_slots": seed_slots,
         "pack": pack_used,
         "started_utc": started_utc,
         "ended_utc": utc_now(),
@@ -1354,17 +3478,21 @@ def run_task_multi(task_id, seeds, pack_name, task):
         "seed_run_ids": [run.get("run_id") for run in seed_runs],
         "artifacts": {}
     }
+    if aggregate_sketches:
+        write_metric_sketches(os.path.join(run_dir, METRIC_STORE_DIRNAME), aggregate_sketches)
+    timer.mark("result_build")
+    timer.point("seed_total_ms", [(run.get("timings") or {}).get("total_ms") for run in seed_results])
+    result["timings"] = timer.to_dict()
 
-    result_path = os.path.join(run_dir, "result.json")
-    with open(result_path, "w", encoding="utf-8") as handle:
-        json.dump(result, handle, indent=2, sort_keys=True)
+    write_run_result(state_dir, run_dir, result, metric_keys)
 
     eprint(f"HEADLESSCTL: run_task summary run_id={run_id} ok={ok} seeds={','.join(str(seed) for seed in seeds)}")
 
     return result, 0 if ok else 3
 
 
-def run_task(task_id, seed, seeds, pack_name):
+@api_command
+def run_task(task_id, seed=None, seeds=None, pack_name=None, slots=None, use_cache=True):
     tool_root = resolve_tool_root()
     tri_root = resolve_tri_root()
     state_dir = resolve_state_dir(tri_root)
@@ -1372,16 +3500,16 @@ def run_task(task_id, seed, seeds, pack_name):
     if lock_path:
         result = build_error_result("build_locked", f"build.lock present: {lock_path}")
         result["lock_path"] = lock_path
-        emit_result(result, 2)
+        return result, 2
     tasks_path, _ = get_tasks_registry_paths(tool_root)
     try:
         tasks_doc, _ = load_tasks_document(tool_root, required=True)
     except FileNotFoundError:
-        emit_result(build_error_result("tasks_missing", f"tasks registry not found: {tasks_path}"), 2)
+        return build_error_result("tasks_missing", f"tasks registry not found: {tasks_path}"), 2
 
     tasks = tasks_doc.get("tasks", {})
     if task_id not in tasks:
-        emit_result(build_error_result("task_not_found", f"task not found: {task_id}"), 2)
+        return build_error_result("task_not_found", f"task not found: {task_id}"), 2
     task = tasks[task_id]
     seed_policy = task.get("seed_policy")
     default_seeds = task.get("default_seeds") or []
@@ -1394,29 +3522,237 @@ def run_task(task_id, seed, seeds, pack_name):
 
     policy_ok, policy_code, policy_error = check_seed_policy(task, seed_list)
     if not policy_ok:
-        emit_result(build_error_result(policy_code, policy_error), 2)
+        return build_error_result(policy_code, policy_error), 2
 
     if (seeds is not None or auto_multi) and len(seed_list) > 1:
-        result, exit_code = run_task_multi(task_id, seed_list, pack_name, task)
-        emit_result(result, exit_code)
+        return run_task_multi(task_id, seed_list, pack_name, task, slots, use_cache)
 
     seed_value = seed_list[0] if seed_list else seed
-    result, exit_code = run_task_internal(task_id, seed_value, pack_name)
-    emit_result(result, exit_code)
+    return run_task_internal(task_id, seed_value, pack_name, use_cache=use_cache)
+
+
+def task_history(state_dir, task_ids, limit=HISTORY_RUN_LIMIT, multi=0):
+    # Median wall time and failure rate over each task's most recent single
+    # (multi=0) or multi-seed (multi=1) runs in the run index. Tasks without
+    # indexed runs are omitted.
+    history = {}
+    try:
+        conn = open_run_index(state_dir)
+    except (sqlite3.Error, OSError) as exc:
+        eprint(f"HEADLESSCTL: run index unavailable, no task history ({exc})")
+        return history
+    try:
+        for task_id in sorted(set(task_ids)):
+            rows = conn.execute(
+                "SELECT duration_ms, ok FROM runs WHERE task_id = ? AND multi = ? AND ended_utc IS NOT NULL "
+                "ORDER BY ended_utc DESC, run_id DESC LIMIT ?",
+                (task_id, multi, limit)
+            ).fetchall()
+            if not rows:
+                continue
+            durations = [row["duration_ms"] / 1000.0 for row in rows if row["duration_ms"] is not None]
+            failures = sum(1 for row in rows if not row["ok"])
+            history[task_id] = {
+                "runs": len(rows),
+                "failures": failures,
+                "duration_s": compute_percentile(durations, 50),
+                "failure_rate": failures / len(rows)
+            }
+    finally:
+        conn.close()
+    return history
+
+
+def estimate_task_duration(task_id, history, registry):
+    entry = history.get(task_id) or {}
+    if entry.get("duration_s") is not None:
+        return float(entry["duration_s"]), "history"
+    settings = registry["normalized"].get(task_id) or {}
+    return float(settings.get("timeout_s") or DEFAULT_TIMEOUT_S), "timeout_s"
+
+
+def project_makespan(durations, slots):
+    # Greedy list schedule in the given order: each job goes to the slot that
+    # frees up first, which is what a FIFO worker pool does.
+    finish_times = [0.0] * max(1, slots)
+    for duration in durations:
+        heapq.heapreplace(finish_times, finish_times[0] + duration)
+    return max(finish_times)
+
+
+def parse_batch_item(raw):
+    if isinstance(raw, dict):
+        task_id = raw.get("task_id") or raw.get("task")
+        seed = raw.get("seed")
+        pack = raw.get("pack")
+    else:
+        parts = str(raw).split(":")
+        task_id = parts[0]
+        seed = parts[1] if len(parts) > 1 and parts[1] else None
+        pack = parts[2] if len(parts) > 2 and parts[2] else None
+    if not task_id:
+        return None, "missing_task_id"
+    if seed is not None:
+        if isinstance(seed, bool) or not str(seed).isdigit():
+            return None, "invalid_seed"
+        seed = int(seed)
+    return {"task_id": task_id, "seed": seed, "pack": pack}, None
+
+
+def parse_run_batch_args(args):
+    raw_items = []
+    slots = None
+    no_cache = False
+    idx = 0
+    while idx < len(args):
+        token = args[idx]
+        if token == "--item" and idx + 1 < len(args):
+            raw_items.append(args[idx + 1])
+            idx += 2
+            continue
+        if token == "--slots" and idx + 1 < len(args):
+            raw_slots = args[idx + 1]
+            if not str(raw_slots).isdigit() or int(raw_slots) < 1:
+                return None, None, False, "invalid_slots"
+            slots = int(raw_slots)
+            idx += 2
+            continue
+        if token == "--no-cache":
+            no_cache = True
+            idx += 1
+            continue
+        if token.startswith("--"):
+            return None, None, False, "invalid_arg"
+        # A JSON file (or - for stdin): a list of items or {"items": [...]},
+        # each {"task_id", "seed", "pack"} or "TASK[:SEED[:PACK]]".
+        try:
+            if token == "-":
+                doc = json.load(sys.stdin)
+            else:
+                doc = load_json(token)
+        except (OSError, ValueError):
+            return None, None, False, "invalid_batch_file"
+        if isinstance(doc, dict):
+            doc = doc.get("items")
+        if not isinstance(doc, list):
+            return None, None, False, "invalid_batch_file"
+        raw_items.extend(doc)
+        idx += 1
+    items = []
+    for raw in raw_items:
+        item, err = parse_batch_item(raw)
+        if err:
+            return None, None, False, err
+        items.append(item)
+    if not items:
+        return None, None, False, "missing_items"
+    return items, slots, no_cache, None
+
+
+def run_batch_item(item, batch_started, use_cache=True):
+    started = time.monotonic()
+    try:
+        result, exit_code = run_task_internal(item["task_id"], item["seed"], item["pack"], use_cache=use_cache)
+    except Exception as exc:
+        result, exit_code = build_error_result("exception", str(exc)), 2
+    return result, exit_code, started - batch_started, time.monotonic() - started
+
+
+@api_command
+def run_batch(items, slots=None, on_item=None, use_cache=True):
+    timer = PhaseTimer()
+    tool_root = resolve_tool_root()
+    tri_root = resolve_tri_root()
+    state_dir = resolve_state_dir(tri_root)
+    lock_path = check_build_lock(state_dir)
+    if lock_path:
+        result = build_error_result("build_locked", f"build.lock present: {lock_path}")
+        result["lock_path"] = lock_path
+        return result, 2
+    tasks_path, _ = get_tasks_registry_paths(tool_root)
+    try:
+        tasks_doc, _ = load_tasks_document(tool_root, required=True)
+    except FileNotFoundError:
+        return build_error_result("tasks_missing", f"tasks registry not found: {tasks_path}"), 2
+    tasks = tasks_doc.get("tasks", {})
+    registry = load_registry(tool_root)
+
+    seeds_by_task = {}
+    for item in items:
+        task = tasks.get(item["task_id"])
+        if task is None:
+            return build_error_result("task_not_found", f"task not found: {item['task_id']}"), 2
+        if item["seed"] is None:
+            item["seed"] = (resolve_seed_list(task, None, None) or [None])[0]
+        seeds_by_task.setdefault(item["task_id"], []).append(item["seed"])
+    # Seed policy applies to the set of runs a batch makes for each task.
+    for task_id, task_seeds in seeds_by_task.items():
+        policy_ok, policy_code, policy_error = check_seed_policy(tasks[task_id], task_seeds)
+        if not policy_ok:
+            return build_error_result(policy_code, f"{task_id}: {policy_error}"), 2
+
+    history = task_history(state_dir, seeds_by_task.keys())
+    entries = []
+    for index, item in enumerate(items):
+        estimate_s, source = estimate_task_duration(item["task_id"], history, registry)
+        entries.append(dict(item, index=index, estimate_s=estimate_s, estimate_source=source))
+    # Longest processing time first.
+    order = sorted(range(len(entries)), key=lambda index: (-entries[index]["estimate_s"], index))
+    batch_slots = resolve_seed_slots(slots, len(entries))
+    projected_makespan_s = project_makespan([entries[index]["estimate_s"] for index in order], batch_slots)
+    timer.mark("plan")
+
+    eprint(f"HEADLESSCTL: run_batch items={len(entries)} slots={batch_slots} projected_makespan_s={projected_makespan_s:.1f}")
+    batch_started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=batch_slots) as executor:
+        futures = {executor.submit(run_batch_item, items[index], batch_started, use_cache): index for index in order}
+        for future in as_completed(futures):
+            entry = entries[futures[future]]
+            result, exit_code, started_s, elapsed_s = future.result()
+            entry.update({
+                "run_id": result.get("run_id"),
+                "ok": bool(result.get("ok")),
+                "error_code": result.get("error_code"),
+                "error": result.get("error"),
+                "exit_code": exit_code,
+                "started_offset_s": round(started_s, 3),
+                "elapsed_s": round(elapsed_s, 3)
+            })
+            if on_item is not None:
+                on_item(dict(entry, type="batch_item"))
+    makespan_s = time.monotonic() - batch_started
+    timer.mark("runs")
+
+    failed = [entry for entry in entries if not entry["ok"]]
+    eprint(f"HEADLESSCTL: run_batch summary items={len(entries)} failed={len(failed)} makespan_s={makespan_s:.1f}")
+    return {
+        "type": "batch_summary",
+        "ok": not failed,
+        "error_code": "none" if not failed else "batch_item_failed",
+        "error": None if not failed else f"{len(failed)} of {len(entries)} items failed",
+        "run_id": None,
+        "slots": batch_slots,
+        "items": entries,
+        "run_ids": [entry["run_id"] for entry in entries],
+        "projected_makespan_s": round(projected_makespan_s, 3),
+        "makespan_s": round(makespan_s, 3),
+        "timings": timer.to_dict()
+    }, 0 if not failed else 3
 
 
+@api_command
 def get_metrics(run_id):
     tri_root = resolve_tri_root()
     state_dir = resolve_state_dir(tri_root)
     run_dir = os.path.join(state_dir, "runs", run_id)
     result_path = os.path.join(run_dir, "result.json")
     if not os.path.exists(result_path):
-        emit_result({
+        return {
             "ok": False,
             "error_code": "run_not_found",
             "error": f"run not found: {run_id}",
             "run_id": run_id
-        }, 2)
+        }, 2
     result = load_json(result_path)
     out = {
         "ok": True,
@@ -1434,7 +3770,7 @@ def get_metrics(run_id):
         out["seed_run_ids"] = result.get("seed_run_ids", [])
         out["variance_grades"] = result.get("variance_grades", {})
         out["variance_pass"] = result.get("variance_pass", True)
-    emit_result(out, 0)
+    return out, 0
 
 
 def diff_metrics_internal(run_id_a, run_id_b):
@@ -1530,27 +3866,475 @@ def diff_metrics_internal(run_id_a, run_id_b):
     return out, 0
 
 
+@api_command
 def diff_metrics(run_id_a, run_id_b):
-    result, exit_code = diff_metrics_internal(run_id_a, run_id_b)
-    emit_result(result, exit_code)
+    return diff_metrics_internal(run_id_a, run_id_b)
+
+
+def regularized_beta(a, b, x):
+    # I_x(a, b) by continued fraction (Numerical Recipes betacf).
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    if x > (a + 1.0) / (a + b + 2.0):
+        return 1.0 - regularized_beta(b, a, 1.0 - x)
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log1p(-x))
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 300):
+        m2 = 2 * m
+        for num in (m * (b - m) * x / ((a + m2 - 1.0) * (a + m2)), -(a + m) * (a + b + m) * x / ((a + m2) * (a + m2 + 1.0))):
+            d = 1.0 + num * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + num / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1.0) < 1e-12:
+            break
+    return front * h / a
+
+
+def welch_t_test(mean_a, var_a, n_a, mean_b, var_b, n_b):
+    # Two-sided Welch t-test of mean_b - mean_a; returns (t, df, p).
+    se2_a = var_a / n_a
+    se2_b = var_b / n_b
+    se2 = se2_a + se2_b
+    if se2 <= 0.0:
+        # Both groups constant: any difference is exact.
+        return None, None, 1.0 if mean_a == mean_b else 0.0
+    t = (mean_b - mean_a) / math.sqrt(se2)
+    df = se2 * se2 / (se2_a * se2_a / (n_a - 1) + se2_b * se2_b / (n_b - 1))
+    p = regularized_beta(df / 2.0, 0.5, df / (df + t * t))
+    return t, df, min(1.0, p)
+
+
+@functools.lru_cache(maxsize=None)
+def mann_whitney_counts(n_a, n_b):
+    # Number of orderings giving each U in 0..n_a*n_b (no ties).
+    if n_a == 0 or n_b == 0:
+        return (1,)
+    left = mann_whitney_counts(n_a - 1, n_b)
+    right = mann_whitney_counts(n_a, n_b - 1)
+    counts = [0] * (n_a * n_b + 1)
+    for u, count in enumerate(left):
+        counts[u + n_b] += count
+    for u, count in enumerate(right):
+        counts[u] += count
+    return tuple(counts)
+
+
+def mann_whitney_u(values_a, values_b):
+    # U of b over a (ties count half) with a two-sided p: exact for small
+    # tie-free groups, otherwise normal with tie and continuity correction.
+    n_a = len(values_a)
+    n_b = len(values_b)
+    u = sum(1.0 if y > x else 0.5 if y == x else 0.0 for x in values_a for y in values_b)
+    pooled = values_a + values_b
+    if len(set(pooled)) == len(pooled) and n_a * n_b <= MANN_WHITNEY_EXACT_MAX:
+        counts = mann_whitney_counts(n_a, n_b)
+        tail = sum(counts[:int(min(u, n_a * n_b - u)) + 1])
+        return u, min(1.0, 2.0 * tail / sum(counts)), "exact"
+    total = n_a + n_b
+    ties = sum(count ** 3 - count for count in (pooled.count(value) for value in set(pooled)))
+    variance = n_a * n_b / 12.0 * ((total + 1) - ties / (total * (total - 1)))
+    if variance <= 0.0:
+        return u, 1.0, "normal"
+    z = max(0.0, abs(u - n_a * n_b / 2.0) - 0.5) / math.sqrt(variance)
+    return u, math.erfc(z / math.sqrt(2.0)), "normal"
+
+
+def percentile(sorted_values, q):
+    # Linear interpolation, as numpy.percentile's default.
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def bootstrap_mean_diff(samples_a, samples_b, alpha, resamples, seed):
+    # Percentile CI of mean(b) - mean(a) for every key at once. samples_* are
+    # rows of per-key values (None when a run lacks the key); resampling is
+    # by run, so keys keep their within-run pairing.
+    bounds = (100.0 * alpha / 2.0, 100.0 * (1.0 - alpha / 2.0))
+    key_count = len(samples_a[0])
+    np = lazy_import_numpy()
+    if np is not None:
+        rng = np.random.default_rng(seed)
+
+        def boot_means(rows):
+            values = np.array([[0.0 if value is None else value for value in row] for row in rows], dtype=np.float64)
+            present = np.array([[value is not None for value in row] for row in rows], dtype=np.float64)
+            picks = rng.integers(0, len(rows), size=(resamples, len(rows)))
+            sums = values[picks].sum(axis=1)
+            counts = present[picks].sum(axis=1)
+            return np.divide(sums, counts, out=np.full_like(sums, np.nan), where=counts > 0)
+
+        diffs = boot_means(samples_b) - boot_means(samples_a)
+        lows, highs = np.nanpercentile(diffs, bounds, axis=0)
+        return [(float(low), float(high)) for low, high in zip(lows, highs)], "numpy"
+
+    rng = random.Random(seed)
+    diffs = [[] for _ in range(key_count)]
+    for _ in range(resamples):
+        picks_a = [rng.randrange(len(samples_a)) for _ in samples_a]
+        picks_b = [rng.randrange(len(samples_b)) for _ in samples_b]
+        for key_index in range(key_count):
+            values_a = [samples_a[index][key_index] for index in picks_a if samples_a[index][key_index] is not None]
+            values_b = [samples_b[index][key_index] for index in picks_b if samples_b[index][key_index] is not None]
+            if values_a and values_b:
+                diffs[key_index].append(sum(values_b) / len(values_b) - sum(values_a) / len(values_a))
+    intervals = []
+    for key_diffs in diffs:
+        key_diffs.sort()
+        intervals.append((percentile(key_diffs, bounds[0]), percentile(key_diffs, bounds[1])) if key_diffs else (None, None))
+    return intervals, "python"
+
+
+def load_run_group(state_dir, spec):
+    # "id[,id...]"; a multi-seed parent stands for its seed runs.
+    run_ids = []
+    results = []
+    for run_id in [part.strip() for part in str(spec).split(",") if part.strip()]:
+        result_path = os.path.join(state_dir, "runs", run_id, "result.json")
+        if not os.path.exists(result_path):
+            return None, None, run_id
+        result = load_json(result_path)
+        for child_id in result.get("seed_run_ids") or [run_id]:
+            child_path = os.path.join(state_dir, "runs", child_id, "result.json")
+            if child_id != run_id and not os.path.exists(child_path):
+                return None, None, child_id
+            run_ids.append(child_id)
+            results.append(result if child_id == run_id else load_json(child_path))
+    return run_ids, results, None
+
+
+def parse_diff_runs_args(args):
+    if len(args) < 2:
+        return None, "missing_run_ids"
+    options = {"group_a": args[0], "group_b": args[1], "alpha": DIFF_RUNS_ALPHA, "resamples": DIFF_RUNS_RESAMPLES, "seed": 0, "keys": None}
+    idx = 2
+    while idx < len(args):
+        token = args[idx]
+        value = args[idx + 1] if idx + 1 < len(args) else None
+        try:
+            if token == "--alpha" and value is not None:
+                options["alpha"] = float(value)
+                if not 0.0 < options["alpha"] < 1.0:
+                    return None, "invalid_alpha"
+            elif token == "--resamples" and value is not None:
+                options["resamples"] = int(value)
+                if options["resamples"] < 1:
+                    return None, "invalid_resamples"
+            elif token == "--seed" and value is not None:
+                options["seed"] = int(value)
+            elif token == "--keys" and value is not None:
+                options["keys"] = [key.strip() for key in value.split(",") if key.strip()]
+            else:
+                return None, "invalid_arg"
+        except ValueError:
+            return None, "invalid_arg"
+        idx += 2
+    return options, None
+
+
+@api_command
+def diff_runs(group_a, group_b, alpha=DIFF_RUNS_ALPHA, resamples=DIFF_RUNS_RESAMPLES, seed=0, keys=None):
+    tool_root = resolve_tool_root()
+    state_dir = resolve_state_dir(resolve_tri_root())
+    run_ids_a, results_a, missing = load_run_group(state_dir, group_a)
+    if missing is None:
+        run_ids_b, results_b, missing = load_run_group(state_dir, group_b)
+    if missing is not None:
+        return build_error_result("run_not_found", f"run not found: {missing}"), 2
+    if not results_a or not results_b:
+        return build_error_result("missing_run_ids", "each group needs at least one run"), 2
+
+    task_ids = sorted({result.get("task_id") for result in results_a + results_b if result.get("task_id")})
+    task_id = task_ids[0] if task_ids else None
+    if keys is None:
+        tasks = load_tasks_document(tool_root, required=False)[0].get("tasks", {})
+        keys = list((tasks.get(task_id) or {}).get("metric_keys") or [])
+    if not keys:
+        numeric = set()
+        for result in results_a + results_b:
+            numeric.update(key for key, value in (result.get("metrics_summary") or {}).items() if isinstance(value, (int, float)))
+        keys = sorted(numeric)
+
+    def sample_rows(results):
+        rows = []
+        for result in results:
+            summary = result.get("metrics_summary") or {}
+            rows.append([float(summary[key]) if isinstance(summary.get(key), (int, float)) and math.isfinite(summary[key]) else None for key in keys])
+        return rows
+
+    rows_a = sample_rows(results_a)
+    rows_b = sample_rows(results_b)
+    intervals, backend = bootstrap_mean_diff(rows_a, rows_b, alpha, resamples, seed) if keys else ([], None)
+
+    out_keys = {}
+    significant_keys = []
+    for key_index, key in enumerate(keys):
+        values_a = [row[key_index] for row in rows_a if row[key_index] is not None]
+        values_b = [row[key_index] for row in rows_b if row[key_index] is not None]
+        entry = {"n_a": len(values_a), "n_b": len(values_b), "significant": False, "direction": "none"}
+        out_keys[key] = entry
+        if len(values_a) < 2 or len(values_b) < 2:
+            entry["note"] = "insufficient_samples"
+            continue
+        n_a = len(values_a)
+        n_b = len(values_b)
+        mean_a = sum(values_a) / n_a
+        mean_b = sum(values_b) / n_b
+        var_a = sum((value - mean_a) ** 2 for value in values_a) / (n_a - 1)
+        var_b = sum((value - mean_b) ** 2 for value in values_b) / (n_b - 1)
+        delta = mean_b - mean_a
+        t, df, p_welch = welch_t_test(mean_a, var_a, n_a, mean_b, var_b, n_b)
+        u, p_mw, mw_method = mann_whitney_u(values_a, values_b)
+        pooled_sd = math.sqrt(((n_a - 1) * var_a + (n_b - 1) * var_b) / (n_a + n_b - 2))
+        hedges_g = delta / pooled_sd * (1.0 - 3.0 / (4.0 * (n_a + n_b) - 9.0)) if pooled_sd > 0.0 else None
+        ci_low, ci_high = intervals[key_index]
+        # Both the Welch test and the bootstrap interval must agree.
+        significant = p_welch < alpha and ci_low is not None and (ci_low > 0.0 or ci_high < 0.0)
+        entry.update({
+            "mean_a": mean_a,
+            "mean_b": mean_b,
+            "stdev_a": math.sqrt(var_a),
+            "stdev_b": math.sqrt(var_b),
+            "delta_mean": delta,
+            "rel_delta": delta / abs(mean_a) if mean_a else None,
+            "hedges_g": hedges_g,
+            "cliffs_delta": 2.0 * u / (n_a * n_b) - 1.0,
+            "welch": {"t": t, "df": df, "p": p_welch},
+            "mann_whitney": {"u": u, "p": p_mw, "method": mw_method},
+            "ci": [ci_low, ci_high],
+            "significant": significant,
+            "direction": ("increase" if delta > 0 else "decrease") if significant else "none"
+        })
+        if significant:
+            significant_keys.append(key)
+
+    return {
+        "ok": True,
+        "error_code": "none",
+        "error": None,
+        "run_id": None,
+        "task_id": task_id,
+        "task_ids": task_ids,
+        "groups": {
+            "a": {"run_ids": run_ids_a, "n": len(run_ids_a)},
+            "b": {"run_ids": run_ids_b, "n": len(run_ids_b)}
+        },
+        "alpha": alpha,
+        "bootstrap": {"resamples": resamples, "seed": seed, "confidence": 1.0 - alpha, "backend": backend},
+        "keys": out_keys,
+        "significant_keys": significant_keys
+    }, 0
+
+
+def parse_metrics_history_args(args):
+    if len(args) < 2:
+        return None, "missing_args"
+    options = {"task_id": args[0], "key": args[1], "last": None, "since": None, "multi": False, "output_format": "json", "out_path": None}
+    idx = 2
+    while idx < len(args):
+        token = args[idx]
+        value = args[idx + 1] if idx + 1 < len(args) else None
+        if token == "--multi":
+            options["multi"] = True
+            idx += 1
+            continue
+        if value is None:
+            return None, "invalid_arg"
+        if token == "--last":
+            if not value.isdigit() or int(value) < 1:
+                return None, "invalid_last"
+            options["last"] = int(value)
+        elif token == "--since":
+            options["since"] = value
+        elif token == "--format":
+            options["output_format"] = value
+        elif token == "--out":
+            options["out_path"] = value
+        else:
+            return None, "invalid_arg"
+        idx += 2
+    return options, None
+
+
+def write_metrics_history_csv(path, points):
+    columns = ("run_id", "started_utc", "ended_utc", "ok", "value") + METRIC_STAT_FIELDS
+    with open(path, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(columns)
+        for point in points:
+            writer.writerow(["" if point[column] is None else point[column] for column in columns])
+
+
+def write_metrics_history_npz(path, points):
+    # float64 columns (NaN when missing) plus ended_s, the UTC epoch seconds;
+    # run ids are in the CSV/JSON output. Written with write_npy, so numpy is
+    # only needed to read it.
+    columns = {"ended_s": [], "ok": [], "value": []}
+    columns.update((field, []) for field in METRIC_STAT_FIELDS)
+    for point in points:
+        ended = parse_utc(point["ended_utc"])
+        columns["ended_s"].append(ended.timestamp() if ended else math.nan)
+        columns["ok"].append(math.nan if point["ok"] is None else float(point["ok"]))
+        for name in ("value",) + METRIC_STAT_FIELDS:
+            columns[name].append(math.nan if point[name] is None else point[name])
+    temp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+    try:
+        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, values in columns.items():
+                column_path = f"{temp_path}.{name}.npy"
+                try:
+                    write_npy(column_path, array.array("d", values), "<f8")
+                    archive.write(column_path, f"{name}.npy")
+                finally:
+                    os.remove(column_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+@api_command
+def metrics_history(task_id, key, last=None, since=None, multi=False, output_format="json", out_path=None):
+    # One point per indexed run of task_id (single runs, or multi-seed parents
+    # with multi=True), oldest first. Read from the run index only.
+    tool_root = resolve_tool_root()
+    state_dir = resolve_state_dir(resolve_tri_root())
+    if output_format not in ("json", "csv", "npz"):
+        return build_error_result("invalid_format", f"unknown format: {output_format} (json, csv or npz)"), 2
+    since_utc = None
+    if since:
+        since_dt = parse_utc(since if "T" in since else since + "T00:00:00+00:00")
+        if since_dt is None:
+            return build_error_result("invalid_since", f"invalid --since date: {since}"), 2
+        if since_dt.tzinfo is None:
+            since_dt = since_dt.replace(tzinfo=datetime.timezone.utc)
+        since_utc = since_dt.astimezone(datetime.timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+    query = (
+        f"SELECT r.run_id, r.started_utc, r.ended_utc, r.ok, m.value, {', '.join('m.' + field for field in METRIC_STAT_FIELDS)} "
+        "FROM runs r JOIN run_metrics m ON m.run_id = r.run_id AND m.key = ? "
+        "WHERE r.task_id = ? AND r.multi = ? AND r.ended_utc IS NOT NULL"
+    )
+    params = [key, task_id, 1 if multi else 0]
+    if since_utc:
+        query += " AND r.ended_utc >= ?"
+        params.append(since_utc)
+    query += " ORDER BY r.ended_utc DESC, r.run_id DESC"
+    if last:
+        query += " LIMIT ?"
+        params.append(last)
+    try:
+        conn = open_run_index(state_dir)
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as exc:
+        return build_error_result("index_unavailable", f"run index unavailable: {exc}"), 2
+
+    if not rows:
+        task = load_tasks_document(tool_root, required=False)[0].get("tasks", {}).get(task_id) or {}
+        metric_keys = task.get("metric_keys") or []
+        if metric_keys and key not in metric_keys:
+            return build_error_result("key_not_indexed", f"{key} is not in {task_id} metric_keys; only those are indexed"), 2
+
+    points = []
+    for row in reversed(rows):
+        point = {name: row[name] for name in ("run_id", "started_utc", "ended_utc", "value") + METRIC_STAT_FIELDS}
+        point["ok"] = None if row["ok"] is None else bool(row["ok"])
+        points.append(point)
+
+    values = [point["value"] for point in points if point["value"] is not None]
+    summary = {"count": len(values), "first": None, "last": None, "min": None, "max": None, "mean": None, "slope_per_day": None}
+    if values:
+        summary.update({"first": values[0], "last": values[-1], "min": min(values), "max": max(values), "mean": sum(values) / len(values)})
+    # Least-squares slope of value against run end time.
+    timed = [(parse_utc(point["ended_utc"]), point["value"]) for point in points if point["value"] is not None]
+    timed = [(ended.timestamp() / 86400.0, value) for ended, value in timed if ended]
+    if len(timed) >= 2:
+        mean_t = sum(t for t, _ in timed) / len(timed)
+        mean_v = sum(v for _, v in timed) / len(timed)
+        spread = sum((t - mean_t) ** 2 for t, _ in timed)
+        if spread > 0.0:
+            summary["slope_per_day"] = sum((t - mean_t) * (v - mean_v) for t, v in timed) / spread
+
+    out = {
+        "ok": True,
+        "error_code": "none",
+        "error": None,
+        "run_id": None,
+        "task_id": task_id,
+        "key": key,
+        "multi": multi,
+        "since": since_utc,
+        "last": last,
+        "format": output_format,
+        "summary": summary
+    }
+    if output_format == "json":
+        out["points"] = points
+        return out, 0
+    if not out_path:
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"metrics_history_{task_id}_{key}")
+        out_path = os.path.join(state_dir, "exports", f"{safe_name}.{output_format}")
+    ensure_dir(os.path.dirname(os.path.abspath(out_path)))
+    if output_format == "csv":
+        write_metrics_history_csv(out_path, points)
+    else:
+        write_metrics_history_npz(out_path, points)
+    out["out_path"] = out_path
+    out["points_written"] = len(points)
+    return out, 0
+
+
+def is_valid_abort_on_invariant(value):
+    if value is None or isinstance(value, bool):
+        return True
+    if isinstance(value, list):
+        return all(name in ABORTABLE_INVARIANTS for name in value)
+    return False
 
 
+@api_command
 def contract_check():
     tool_root = resolve_tool_root()
     tasks_path, _ = get_tasks_registry_paths(tool_root)
-    packs_path = os.path.join(tool_root, "Tools", "Headless", "headless_packs.json")
+    packs_path = get_packs_registry_path(tool_root)
 
-    try:
-        tasks_doc, _ = load_tasks_document(tool_root, required=True)
-    except FileNotFoundError:
-        emit_result(build_error_result("tasks_missing", f"tasks registry not found: {tasks_path}"), 2)
+    if not os.path.exists(tasks_path):
+        return build_error_result("tasks_missing", f"tasks registry not found: {tasks_path}"), 2
     if not os.path.exists(packs_path):
-        emit_result(build_error_result("packs_missing", f"packs registry not found: {packs_path}"), 2)
+        return build_error_result("packs_missing", f"packs registry not found: {packs_path}"), 2
+
+    # Loaded before load_tasks_document so registry_cache reports how this
+    # command got the registry (hit/miss/memo), not the second lookup.
+    registry = load_registry(tool_root)
+    load_tasks_document(tool_root, required=True)
+    errors = registry["contract"]["errors"]
+    warnings = registry["contract"]["warnings"]
+    ok = len(errors) == 0
+    out = {
+        "ok": ok,
+        "error_code": "none" if ok else "contract_failed",
+        "error": None if ok else "contract check failed",
+        "run_id": None,
+        "errors": errors,
+        "warnings": warnings,
+        "registry_cache": registry.get("cache")
+    }
+    return out, 0 if ok else 3
 
-    packs_doc = load_json(packs_path)
-    tasks = tasks_doc.get("tasks", {})
-    packs = packs_doc.get("packs", {})
 
+def check_registry_contract(tasks, packs):
     errors = []
     warnings = []
 
@@ -1569,11 +4353,17 @@ def contract_check():
         env = pack.get("env")
         if not isinstance(env, dict):
             errors.append({"id": "pack_env_missing", "pack": pack_name, "message": "pack.env must be an object"})
+        if not is_valid_abort_on_invariant(pack.get("abort_on_invariant")):
+            errors.append({"id": "pack_abort_on_invariant_invalid", "pack": pack_name, "value": pack.get("abort_on_invariant")})
         caps = pack.get("caps")
         if caps is None:
             warnings.append({"id": "pack_caps_missing", "pack": pack_name, "message": "pack.caps missing"})
         elif not isinstance(caps, dict):
             errors.append({"id": "pack_caps_invalid", "pack": pack_name, "message": "pack.caps must be an object"})
+        elif caps.get("on_exceed") is not None and caps.get("on_exceed") not in CAP_ACTIONS:
+            errors.append({"id": "pack_caps_on_exceed_invalid", "pack": pack_name, "value": caps.get("on_exceed")})
+        elif caps.get("on_exceed_events") is not None and caps.get("on_exceed_events") not in EVENT_CAP_ACTIONS:
+            errors.append({"id": "pack_caps_on_exceed_events_invalid", "pack": pack_name, "value": caps.get("on_exceed_events")})
 
     for task_id, task in tasks.items():
         if not isinstance(task, dict):
@@ -1654,6 +4444,9 @@ def contract_check():
                 if bad_seed is not None:
                     errors.append({"id": "task_default_seeds_invalid", "task_id": task_id})
 
+        if not is_valid_abort_on_invariant(task.get("abort_on_invariant")):
+            errors.append({"id": "task_abort_on_invariant_invalid", "task_id": task_id, "value": task.get("abort_on_invariant")})
+
         seed_policy = task.get("seed_policy")
         if seed_policy is not None and seed_policy not in ("ai_polish", "none"):
             errors.append({"id": "task_seed_policy_invalid", "task_id": task_id, "value": seed_policy})
@@ -1675,48 +4468,170 @@ def contract_check():
                     if len(counts) < 2 or max(counts.values()) < 2:
                         errors.append({"id": "task_seed_policy_seeds_pattern_invalid", "task_id": task_id})
 
-    ok = len(errors) == 0
-    out = {
-        "ok": ok,
-        "error_code": "none" if ok else "contract_failed",
-        "error": None if ok else "contract check failed",
-        "run_id": None,
-        "errors": errors,
-        "warnings": warnings
-    }
-    emit_result(out, 0 if ok else 3)
+    return errors, warnings
+
+
+def hash_bundle_files(run_dir, skip, previous):
+    # Content hash per bundled file. Files whose size and mtime match the
+    # previous manifest keep their recorded hash instead of being re-read.
+    files = {}
+    hashed = 0
+    for root, dirs, names in os.walk(run_dir):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, run_dir).replace(os.sep, "/")
+            if skip(rel_path):
+                continue
+            stat = os.stat(path)
+            prior = previous.get(rel_path) or {}
+            if prior.get("size") == stat.st_size and prior.get("mtime_ns") == stat.st_mtime_ns and prior.get("blake2b"):
+                digest = prior["blake2b"]
+            else:
+                digest = hash_file(path)
+                hashed += 1
+            files[rel_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "blake2b": digest}
+    return files, hashed
 
 
-def bundle_artifacts(run_id):
+@api_command
+def bundle_artifacts(run_id, codec_spec=None):
+    timer = PhaseTimer()
     tri_root = resolve_tri_root()
     state_dir = resolve_state_dir(tri_root)
     run_dir = os.path.join(state_dir, "runs", run_id)
     if not os.path.exists(run_dir):
-        emit_result({
+        return {
             "ok": False,
             "error_code": "run_not_found",
             "error": f"run not found: {run_id}",
             "run_id": run_id
-        }, 2)
-    bundle_name = f"bundle_{run_id}.tar.gz"
+        }, 2
+    try:
+        codec = parse_codec_spec(codec_spec or os.environ.get("HEADLESSCTL_BUNDLE_CODEC") or "gzip")
+    except ValueError as exc:
+        return build_error_result("invalid_arg", str(exc), run_id), 2
+    codec = codec or parse_codec_spec("gzip")
+    bundle_prefix = f"bundle_{run_id}.tar"
+    bundle_name = bundle_prefix + CODEC_SUFFIXES[codec["codec"]]
     bundle_path = os.path.join(run_dir, bundle_name)
+    manifest_path = os.path.join(run_dir, BUNDLE_MANIFEST_NAME)
+    def skip(rel_path):
+        return rel_path == BUNDLE_MANIFEST_NAME or rel_path.startswith(bundle_prefix)
     def tar_filter(tarinfo):
-        if tarinfo.name.endswith(bundle_name):
+        rel_path = tarinfo.name.split("/", 1)[1] if "/" in tarinfo.name else ""
+        if skip(rel_path):
             return None
         return tarinfo
-    with tarfile.open(bundle_path, "w:gz") as tar:
-        tar.add(run_dir, arcname=f"run_{run_id}", filter=tar_filter)
+    timer.mark("resolve")
+
+    previous = {}
+    if os.path.exists(manifest_path):
+        try:
+            previous = load_json(manifest_path)
+        except Exception:
+            previous = {}
+    files, hashed = hash_bundle_files(run_dir, skip, previous.get("files") or {})
+    timer.mark("hash")
+
+    digests = {rel_path: entry["blake2b"] for rel_path, entry in files.items()}
+    previous_digests = {rel_path: entry.get("blake2b") for rel_path, entry in (previous.get("files") or {}).items()}
+    reused = (
+        previous.get("bundle_name") == bundle_name
+        and previous.get("codec") == codec
+        and digests == previous_digests
+        and os.path.exists(bundle_path)
+        and os.path.getsize(bundle_path) == previous.get("bundle_bytes")
+    )
+    if not reused:
+        # Written beside the target and renamed in, so a published hardlink
+        # of the previous bundle is never modified in place.
+        temp_path = f"{bundle_path}.tmp-{uuid.uuid4().hex}"
+        try:
+            if codec["codec"] == "gzip":
+                with tarfile.open(temp_path, "w:gz", compresslevel=codec["level"]) as tar:
+                    tar.add(run_dir, arcname=f"run_{run_id}", filter=tar_filter)
+            else:
+                compressor = lazy_import_zstandard().ZstdCompressor(level=codec["level"], threads=codec["threads"])
+                with open(temp_path, "wb") as raw, compressor.stream_writer(raw, closefd=False) as writer:
+                    with tarfile.open(fileobj=writer, mode="w|") as tar:
+                        tar.add(run_dir, arcname=f"run_{run_id}", filter=tar_filter)
+            os.replace(temp_path, bundle_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        for name in os.listdir(run_dir):
+            if name.startswith(bundle_prefix) and name != bundle_name:
+                os.remove(os.path.join(run_dir, name))
+    if hashed or not reused:
+        # Also refreshed on reuse so touched-but-unchanged files are not
+        # hashed again next time.
+        manifest = {
+            "schema_version": SCHEMA_VERSION,
+            "run_id": run_id,
+            "bundle_name": bundle_name,
+            "bundle_bytes": os.path.getsize(bundle_path),
+            "codec": codec,
+            "files": files
+        }
+        write_json_atomic(manifest_path, manifest)
+    timer.mark("archive")
+    if not reused:
+        refresh_run_size(state_dir, run_id)
+    timer.mark("index")
     out = {
         "ok": True,
         "error_code": "none",
         "error": None,
         "run_id": run_id,
-        "bundle_path": bundle_path
+        "bundle_path": bundle_path,
+        "bundle_manifest_path": manifest_path,
+        "reused": reused,
+        "files": len(files),
+        "files_hashed": hashed,
+        "timings": timer.to_dict()
     }
-    emit_result(out, 0)
+    return out, 0
+
+
+def check_jsonl_artifact(name, path):
+    # validate check: a non-empty .jsonl artifact, plain or compressed, whose
+    # first record decodes through open_artifact.
+    check = {"name": name, "ok": False, "path": path}
+    if not path or not artifact_base_path(path).endswith(".jsonl") or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return check
+    try:
+        with open_artifact(path) as handle:
+            check["ok"] = isinstance(json.loads(handle.readline()), dict)
+    except Exception as exc:
+        check["error"] = str(exc)
+    return check
+
+
+def check_metric_store(name, store_path):
+    # validate check: the manifest loads and the first and last keys' series
+    # (so both ends of every column) read back with the recorded lengths.
+    check = {"name": name, "ok": False, "path": store_path}
+    try:
+        manifest = load_json(os.path.join(store_path, "manifest.json"))
+        keys = manifest.get("keys") or []
+        if not keys:
+            check["ok"] = manifest.get("count") == 0
+            return check
+        ok = True
+        for index in sorted({0, len(keys) - 1}):
+            start, stop = manifest["ranges"][index]
+            series = load_metric_series(os.path.dirname(store_path), keys[index], manifest)
+            ok = ok and series is not None and all(len(values) == stop - start for values in series.values())
+        check["ok"] = ok
+    except Exception as exc:
+        check["error"] = str(exc)
+    return check
 
 
+@api_command
 def validate():
+    timer = PhaseTimer()
     tool_root = resolve_tool_root()
     tri_root = resolve_tri_root()
     state_dir = resolve_state_dir(tri_root)
@@ -1724,12 +4639,12 @@ def validate():
     if lock_path:
         result = build_error_result("build_locked", f"build.lock present: {lock_path}")
         result["lock_path"] = lock_path
-        emit_result(result, 2)
+        return result, 2
     tasks_path, _ = get_tasks_registry_paths(tool_root)
     try:
         tasks_doc, _ = load_tasks_document(tool_root, required=True)
     except FileNotFoundError:
-        emit_result(build_error_result("tasks_missing", f"tasks registry not found: {tasks_path}"), 2)
+        return build_error_result("tasks_missing", f"tasks registry not found: {tasks_path}"), 2
 
     tasks = tasks_doc.get("tasks", {})
     validate_tasks = [
@@ -1742,6 +4657,7 @@ def validate():
     ok = True
 
     script_path = os.path.abspath(__file__)
+    timer.mark("registry")
 
     for runner, task_id in validate_tasks:
         task = tasks.get(task_id)
@@ -1754,10 +4670,15 @@ def validate():
             errors.append({"runner": runner, "task_id": task_id, "error": "task_runner_mismatch"})
             continue
 
+        # validate checks the CLI contract, so run_task goes through a child
+        # process and its stdout must be exactly one JSON line.
         cmd = [sys.executable, script_path, "run_task", task_id]
         eprint(f"HEADLESSCTL: validate start runner={runner} task={task_id}")
+        runner_started = time.monotonic()
         proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8", errors="replace")
         stdout, stderr = proc.communicate()
+        run_task_ms = elapsed_ms(runner_started)
+        timer.mark("run_task")
         if stderr:
             eprint(stderr.rstrip())
 
@@ -1824,19 +4745,16 @@ def validate():
         for artifact_run in artifact_runs:
             artifacts = artifact_run.get("artifacts", {}) if artifact_run else {}
             metrics_path = artifacts.get("metrics")
+            metric_store_path = artifacts.get("metric_store")
             invariants_path = artifacts.get("invariants")
             label = artifact_run.get("run_id") or "single"
-            checks.append({
-                "name": f"metrics.jsonl:{label}",
-                "ok": bool(metrics_path) and metrics_path.endswith(".jsonl") and os.path.exists(metrics_path) and os.path.getsize(metrics_path) > 0,
-                "path": metrics_path
-            })
-            checks.append({
-                "name": f"invariants.jsonl:{label}",
-                "ok": bool(invariants_path) and invariants_path.endswith(".jsonl") and os.path.exists(invariants_path) and os.path.getsize(invariants_path) > 0,
-                "path": invariants_path
-            })
+            if metrics_path or not metric_store_path:
+                checks.append(check_jsonl_artifact(f"metrics.jsonl:{label}", metrics_path))
+            else:
+                checks.append(check_metric_store(f"metric_store:{label}", metric_store_path))
+            checks.append(check_jsonl_artifact(f"invariants.jsonl:{label}", invariants_path))
 
+        timer.mark("artifact_checks")
         diff_result = None
         diff_ok = False
         diff_exit = None
@@ -1847,6 +4765,7 @@ def validate():
                 checks.append({"name": "diff_metrics.grades", "ok": False})
             else:
                 checks.append({"name": "diff_metrics.grades", "ok": True})
+        timer.mark("diff_metrics")
 
         metrics_summary = run_result.get("metrics_summary", {}) if run_result else {}
         metric_keys = task.get("validate_metric_keys")
@@ -1888,9 +4807,11 @@ def validate():
             "checks": checks,
             "run_id": run_id,
             "diff_exit_code": diff_exit,
-            "diff_ok": diff_ok
+            "diff_ok": diff_ok,
+            "timings": {"total_ms": elapsed_ms(runner_started), "run_task_ms": run_task_ms}
         }
 
+        timer.mark("metric_checks")
         eprint(f"HEADLESSCTL: validate done runner={runner} ok={runner_ok}")
 
     out = {
@@ -1899,13 +4820,302 @@ def validate():
         "error": None if ok else "headlessctl validate failed",
         "run_id": None,
         "results": results,
-        "errors": errors
+        "errors": errors,
+        "timings": timer.to_dict()
+    }
+    return out, 0 if ok else 3
+
+
+@api_command
+def claim_session_lock_command(ttl=DEFAULT_SESSION_LOCK_TTL_SEC, purpose="nightly"):
+    state_dir = resolve_state_dir(resolve_tri_root())
+    result = claim_session_lock(state_dir, ttl, purpose)
+    acquired = result.get("acquired", False)
+    lock = result.get("lock")
+    return {
+        "ok": acquired,
+        "error_code": "none" if acquired else "locked",
+        "error": None if acquired else "session lock already held",
+        "run_id": lock.get("run_id") if lock else None,
+        "acquired": acquired,
+        "lock_path": result.get("lock_path"),
+        "lock": lock,
+        "warning": result.get("warning"),
+        "ttl_sec": ttl
+    }, 0 if acquired else 3
+
+
+@api_command
+def release_session_lock_command(run_id=None):
+    state_dir = resolve_state_dir(resolve_tri_root())
+    result = release_session_lock(state_dir, run_id)
+    return {
+        "ok": True,
+        "error_code": "none",
+        "error": None,
+        "run_id": result.get("lock", {}).get("run_id") if result.get("lock") else None,
+        "released": result.get("released"),
+        "lock_path": result.get("lock_path"),
+        "lock": result.get("lock")
+    }, 0
+
+
+@api_command
+def show_session_lock_command():
+    state_dir = resolve_state_dir(resolve_tri_root())
+    result = show_session_lock(state_dir)
+    lock = result.get("lock")
+    return {
+        "ok": lock is None,
+        "error_code": "none" if lock is None else "locked",
+        "error": None if lock is None else "session lock present",
+        "run_id": lock.get("run_id") if lock else None,
+        "lock_path": result.get("lock_path"),
+        "lock": lock
+    }, 0
+
+
+@api_command
+def cleanup_locks_command(ttl=DEFAULT_SESSION_LOCK_TTL_SEC):
+    state_dir = resolve_state_dir(resolve_tri_root())
+    reclaimed = cleanup_session_locks(state_dir, ttl)
+    return {
+        "ok": True,
+        "error_code": "none",
+        "error": None,
+        "run_id": None,
+        "reclaimed": reclaimed
+    }, 0
+
+
+@api_command
+def reindex_command():
+    state_dir = resolve_state_dir(resolve_tri_root())
+    started = time.monotonic()
+    conn = open_run_index(state_dir)
+    try:
+        counts = rebuild_run_index(conn, state_dir)
+    finally:
+        conn.close()
+    return {
+        "ok": True,
+        "error_code": "none",
+        "error": None,
+        "run_id": None,
+        "index_path": run_index_path(state_dir),
+        "indexed": counts["indexed"],
+        "without_result": counts["without_result"],
+        "rebuild_ms": elapsed_ms(started)
+    }, 0
+
+
+@api_command
+def cleanup_runs_command(days=None, keep_per_task=None, max_bytes=None):
+    state_dir = resolve_state_dir(resolve_tri_root())
+    removed = cleanup_runs(state_dir, days, keep_per_task, max_bytes)
+    return {
+        "ok": True,
+        "error_code": "none",
+        "error": None,
+        "run_id": None,
+        "removed": removed,
+        "days": days,
+        "keep_per_task": keep_per_task,
+        "max_bytes": max_bytes
+    }, 0
+
+
+def serve_request_context():
+    # Mirrors headlessctl_client.request_context: the cwd and the TRI_/
+    # HEADLESSCTL_ variables a command resolves paths and options from.
+    env = {
+        key: value for key, value in os.environ.items()
+        if (key.startswith("TRI_") or key.startswith("HEADLESSCTL_")) and key not in SERVE_CONTEXT_IGNORED_ENV
     }
-    emit_result(out, 0 if ok else 3)
+    return {"cwd": os.getcwd(), "env": env}
+
+
+def resolve_serve_socket_path(state_dir, override=None):
+    return override or os.environ.get("HEADLESSCTL_SOCKET") or os.path.join(state_dir, SERVE_SOCKET_NAME)
+
+
+def execute_command(argv):
+    # Runs one CLI command in this process and returns (result, exit_code, log)
+    # instead of writing stdout. serve calls it once per request.
+    COMMAND_CONTEXT.sink = []
+    COMMAND_CONTEXT.log = []
+    COMMAND_CONTEXT.started = time.monotonic()
+    try:
+        try:
+            main(argv)
+        except SystemExit:
+            pass
+        except Exception as exc:
+            try:
+                emit_result({
+                    "ok": False,
+                    "error_code": "exception",
+                    "error": str(exc),
+                    "run_id": None
+                }, 2)
+            except SystemExit:
+                pass
+        if COMMAND_CONTEXT.sink:
+            result, exit_code = COMMAND_CONTEXT.sink[-1]
+        else:
+            result, exit_code = build_error_result("no_result", f"command produced no result: {argv}"), 2
+        return result, exit_code, COMMAND_CONTEXT.log
+    finally:
+        COMMAND_CONTEXT.sink = None
+        COMMAND_CONTEXT.log = None
+        COMMAND_CONTEXT.started = None
+
+
+class HeadlessctlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, tool_root, tri_root, state_dir):
+        super().__init__(socket_path, HeadlessctlRequestHandler)
+        self.socket_path = socket_path
+        self.tool_root = tool_root
+        self.tri_root = tri_root
+        self.state_dir = state_dir
+        self.served = 0
+        self.active = 0
+        self.active_changed = threading.Condition()
+
+    def execute(self, argv):
+        with self.active_changed:
+            self.active += 1
+        try:
+            return execute_command(argv)
+        finally:
+            with self.active_changed:
+                self.active -= 1
+                self.served += 1
+                self.active_changed.notify_all()
+
+    def wait_idle(self):
+        with self.active_changed:
+            while self.active:
+                self.active_changed.wait()
+
+    def describe(self):
+        return {
+            "ok": True,
+            "error_code": "none",
+            "error": None,
+            "run_id": None,
+            "pid": os.getpid(),
+            "socket_path": self.socket_path,
+            "tool_root": self.tool_root,
+            "tri_root": self.tri_root,
+            "state_dir": self.state_dir,
+            "served": self.served,
+            "uptime_s": round(time.monotonic() - PROCESS_STARTED, 3),
+            "tool_version": TOOL_VERSION,
+            "schema_version": SCHEMA_VERSION
+        }
+
+
+class HeadlessctlRequestHandler(socketserver.StreamRequestHandler):
+    # One NDJSON request per line: {"id": any, "argv": ["run_task", ...]}.
+    # Each reply is {"id", "exit_code", "result", "log"} where result is the
+    # exact JSON the CLI would print and log holds its stderr lines.
+    def handle(self):
+        for raw in self.rfile:
+            if not raw.strip():
+                continue
+            request_id = None
+            log = []
+            try:
+                request = json.loads(raw)
+                request_id = request.get("id")
+                argv = request.get("argv")
+                if not isinstance(argv, list) or not argv:
+                    raise ValueError("argv must be a non-empty list")
+                argv = [str(token) for token in argv]
+            except Exception as exc:
+                result, exit_code = build_error_result("invalid_request", f"invalid request: {exc}"), 2
+                argv = None
+            if argv and argv[0] == "serve":
+                result, exit_code = build_error_result("invalid_request", "serve cannot be nested"), 2
+            elif argv and argv[0] == "run_batch" and "-" in argv[1:]:
+                result, exit_code = build_error_result("invalid_request", "run_batch - reads stdin; run it locally"), 2
+            elif argv == ["ping"]:
+                result, exit_code = self.server.describe(), 0
+            elif argv == ["shutdown"]:
+                result, exit_code = self.server.describe(), 0
+            elif argv and request.get("context") != serve_request_context():
+                # Commands run with the server's cwd and env; a caller whose
+                # differ must run locally instead.
+                result, exit_code = build_error_result("context_mismatch", "caller cwd/env differ from the headlessctl server's"), 2
+            elif argv:
+                result, exit_code, log = self.server.execute(argv)
+            response = {"id": request_id, "exit_code": exit_code, "result": result, "log": log}
+            self.wfile.write((json.dumps(response, sort_keys=True) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            if argv == ["shutdown"]:
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+
+def serve_socket_alive(socket_path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def serve(args):
+    socket_override = None
+    if len(args) >= 2 and args[0] == "--socket":
+        socket_override = args[1]
+    elif args:
+        emit_result(build_error_result("invalid_arg", "usage: serve [--socket PATH]"), 2)
+    tool_root = resolve_tool_root()
+    tri_root = resolve_tri_root()
+    state_dir = resolve_state_dir(tri_root)
+    socket_path = resolve_serve_socket_path(state_dir, socket_override)
+    ensure_dir(os.path.dirname(os.path.abspath(socket_path)))
+    if os.path.exists(socket_path):
+        if serve_socket_alive(socket_path):
+            result = build_error_result("server_running", f"headlessctl server already listening: {socket_path}")
+            result["socket_path"] = socket_path
+            emit_result(result, 2)
+        os.remove(socket_path)
+    # The socket is created by bind(); under a 077 umask it is owner-only from
+    # the start instead of after the chmod.
+    previous_umask = os.umask(0o077)
+    try:
+        server = HeadlessctlServer(socket_path, tool_root, tri_root, state_dir)
+    finally:
+        os.umask(previous_umask)
+    os.chmod(socket_path, 0o600)
+    RUN_INDEX_POOLING.set()
+    eprint(f"HEADLESSCTL: serve listening socket={socket_path} pid={os.getpid()}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.wait_idle()
+        server.server_close()
+        close_run_index_pool()
+        try:
+            os.remove(socket_path)
+        except OSError:
+            pass
+    result = server.describe()
+    emit_result(result, 0)
 
 
-def main():
-    cmd, args = parse_args(sys.argv[1:])
+def main(argv=None):
+    cmd, args = parse_args(sys.argv[1:] if argv is None else argv)
     if cmd is None:
         emit_result({
             "ok": False,
@@ -1915,7 +5125,7 @@ def main():
         }, 2)
 
     if cmd == "run_task":
-        task_id, seed, seeds, pack, err = parse_run_task_args(args)
+        task_id, seed, seeds, pack, slots, no_cache, err = parse_run_task_args(args)
         if err:
             emit_result({
                 "ok": False,
@@ -1923,7 +5133,18 @@ def main():
                 "error": "invalid run_task args",
                 "run_id": None
             }, 2)
-        run_task(task_id, seed, seeds, pack)
+        emit_command(run_task(task_id, seed, seeds, pack, slots, use_cache=not no_cache))
+
+    if cmd == "run_batch":
+        items, slots, no_cache, err = parse_run_batch_args(args)
+        if err:
+            emit_result({
+                "ok": False,
+                "error_code": err,
+                "error": "invalid run_batch args",
+                "run_id": None
+            }, 2)
+        emit_command(run_batch(items, slots, on_item=emit_stream_record, use_cache=not no_cache))
 
     if cmd == "get_metrics":
         values, err = parse_simple_args(args, 1)
@@ -1934,7 +5155,7 @@ def main():
                 "error": "missing run_id",
                 "run_id": None
             }, 2)
-        get_metrics(values[0])
+        emit_command(get_metrics(values[0]))
 
     if cmd == "diff_metrics":
         values, err = parse_simple_args(args, 2)
@@ -1945,10 +5166,35 @@ def main():
                 "error": "missing run ids",
                 "run_id": None
             }, 2)
-        diff_metrics(values[0], values[1])
+        emit_command(diff_metrics(values[0], values[1]))
+
+    if cmd == "metrics_history":
+        options, err = parse_metrics_history_args(args)
+        if err:
+            emit_result({
+                "ok": False,
+                "error_code": err,
+                "error": "usage: metrics_history <task_id> <key> [--last N] [--since DATE] [--multi] [--format json|csv|npz] [--out PATH]",
+                "run_id": None
+            }, 2)
+        emit_command(metrics_history(**options))
+
+    if cmd == "diff_runs":
+        options, err = parse_diff_runs_args(args)
+        if err:
+            emit_result({
+                "ok": False,
+                "error_code": err,
+                "error": "usage: diff_runs <ids_a> <ids_b> [--alpha A] [--resamples N] [--seed S] [--keys K1,K2]",
+                "run_id": None
+            }, 2)
+        emit_command(diff_runs(**options))
 
     if cmd == "contract_check":
-        contract_check()
+        emit_command(contract_check())
+
+    if cmd == "serve":
+        serve(args)
 
     if cmd == "bundle_artifacts":
         values, err = parse_simple_args(args, 1)
@@ -1959,87 +5205,36 @@ def main():
                 "error": "missing run_id",
                 "run_id": None
             }, 2)
-        bundle_artifacts(values[0])
+        codec_spec = None
+        if "--codec" in values[1:]:
+            index = values.index("--codec", 1)
+            codec_spec = values[index + 1] if index + 1 < len(values) else None
+        emit_command(bundle_artifacts(values[0], codec_spec))
 
     if cmd == "validate":
-        validate()
+        emit_command(validate())
 
     if cmd == "claim_session_lock":
-        tri_root = resolve_tri_root()
-        state_dir = resolve_state_dir(tri_root)
         ttl, purpose, _ = parse_session_lock_args(args)
-        result = claim_session_lock(state_dir, ttl, purpose)
-        acquired = result.get("acquired", False)
-        lock = result.get("lock")
-        emit_result({
-            "ok": acquired,
-            "error_code": "none" if acquired else "locked",
-            "error": None if acquired else "session lock already held",
-            "run_id": lock.get("run_id") if lock else None,
-            "acquired": acquired,
-            "lock_path": result.get("lock_path"),
-            "lock": lock,
-            "warning": result.get("warning"),
-            "ttl_sec": ttl
-        }, 0 if acquired else 3)
+        emit_command(claim_session_lock_command(ttl, purpose))
 
     if cmd == "release_session_lock":
-        tri_root = resolve_tri_root()
-        state_dir = resolve_state_dir(tri_root)
         _, _, run_id = parse_session_lock_args(args)
-        result = release_session_lock(state_dir, run_id)
-        emit_result({
-            "ok": True,
-            "error_code": "none",
-            "error": None,
-            "run_id": result.get("lock", {}).get("run_id") if result.get("lock") else None,
-            "released": result.get("released"),
-            "lock_path": result.get("lock_path"),
-            "lock": result.get("lock")
-        }, 0)
+        emit_command(release_session_lock_command(run_id))
 
     if cmd == "show_session_lock":
-        tri_root = resolve_tri_root()
-        state_dir = resolve_state_dir(tri_root)
-        result = show_session_lock(state_dir)
-        lock = result.get("lock")
-        emit_result({
-            "ok": lock is None,
-            "error_code": "none" if lock is None else "locked",
-            "error": None if lock is None else "session lock present",
-            "run_id": lock.get("run_id") if lock else None,
-            "lock_path": result.get("lock_path"),
-            "lock": lock
-        }, 0)
+        emit_command(show_session_lock_command())
 
     if cmd == "cleanup_locks":
-        tri_root = resolve_tri_root()
-        state_dir = resolve_state_dir(tri_root)
         ttl, _, _ = parse_session_lock_args(args)
-        reclaimed = cleanup_session_locks(state_dir, ttl)
-        emit_result({
-            "ok": True,
-            "error_code": "none",
-            "error": None,
-            "run_id": None,
-            "reclaimed": reclaimed
-        }, 0)
+        emit_command(cleanup_locks_command(ttl))
+
+    if cmd == "reindex":
+        emit_command(reindex_command())
 
     if cmd == "cleanup_runs":
-        tri_root = resolve_tri_root()
-        state_dir = resolve_state_dir(tri_root)
         days, keep_per_task, max_bytes = parse_cleanup_runs_args(args)
-        removed = cleanup_runs(state_dir, days, keep_per_task, max_bytes)
-        emit_result({
-            "ok": True,
-            "error_code": "none",
-            "error": None,
-            "run_id": None,
-            "removed": removed,
-            "days": days,
-            "keep_per_task": keep_per_task,
-            "max_bytes": max_bytes
-        }, 0)
+        emit_command(cleanup_runs_command(days, keep_per_task, max_bytes))
 
     emit_result({
         "ok": False,
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import json
+import os
+import socket
+import sys
+
+SERVE_SOCKET_NAME = "headlessctl.sock"
+LOCAL_COMMANDS = ("serve", "run_batch")
+SERVE_CONTEXT_IGNORED_ENV = ("HEADLESSCTL_USE_SERVER", "HEADLESSCTL_SOCKET", "HEADLESSCTL_NO_SERVER")
+
+
+def resolve_socket_path():
+    # Mirrors headlessctl.resolve_serve_socket_path without importing it; the
+    # TRI_ROOT fallback for the state dir is left to headlessctl itself.
+    override = os.environ.get("HEADLESSCTL_SOCKET")
+    if override:
+        return override
+    state_dir = os.environ.get("TRI_STATE_DIR")
+    if not state_dir:
+        home = os.environ.get("HOME")
+        if not home or not os.access(home, os.W_OK):
+            return None
+        base = os.environ.get("XDG_STATE_HOME", os.path.join(home, ".local", "state"))
+        state_dir = os.path.join(base, "tri-headless")
+    return os.path.join(state_dir, SERVE_SOCKET_NAME)
+
+
+def request_context():
+    # Mirrors headlessctl.serve_request_context; the server refuses requests
+    # whose context differs from its own (error_code context_mismatch).
+    env = {
+        key: value for key, value in os.environ.items()
+        if (key.startswith("TRI_") or key.startswith("HEADLESSCTL_")) and key not in SERVE_CONTEXT_IGNORED_ENV
+    }
+    return {"cwd": os.getcwd(), "env": env}
+
+
+class HeadlessctlClient:
+    # One connection to `headlessctl serve`; call() may be repeated.
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.reader = self.sock.makefile("rb")
+        self.next_id = 0
+
+    def request(self, argv):
+        self.next_id += 1
+        payload = {"id": self.next_id, "argv": [str(token) for token in argv], "context": request_context()}
+        self.sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("headlessctl server closed the connection")
+        response = json.loads(line)
+        if response.get("id") != self.next_id:
+            raise ConnectionError("headlessctl server reply out of order")
+        return response
+
+    def call(self, argv):
+        response = self.request(argv)
+        return response.get("result"), response.get("exit_code")
+
+    def close(self):
+        try:
+            self.reader.close()
+        finally:
+            self.sock.close()
+
+
+def connect(socket_path=None):
+    socket_path = socket_path or resolve_socket_path()
+    if not socket_path or not os.path.exists(socket_path):
+        return None
+    try:
+        return HeadlessctlClient(socket_path)
+    except OSError:
+        return None
+
+
+def exec_local(argv):
+    tool_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "headlessctl.py")
+    os.execv(sys.executable, [sys.executable, tool_path] + argv)
+
+
+def main():
+    argv = sys.argv[1:]
+    # run_batch reads its item file or stdin (-) itself, so it always runs in
+    # the caller's process; the server would read its own stdin.
+    client = connect() if argv and argv[0] not in LOCAL_COMMANDS else None
+    if client is None:
+        exec_local(argv)
+    try:
+        response = client.request(argv)
+    except (OSError, ValueError) as exc:
+        response = {
+            "exit_code": 2,
+            "result": {"ok": False, "error_code": "server_error", "error": f"headlessctl server request failed: {exc}", "run_id": None}
+        }
+    finally:
+        client.close()
+    if (response.get("result") or {}).get("error_code") == "context_mismatch":
+        exec_local(argv)
+    for line in response.get("log") or []:
+        sys.stderr.write(line + "\n")
+    sys.stderr.flush()
+    sys.stdout.write(json.dumps(response.get("result"), sort_keys=True) + "\n")
+    sys.stdout.flush()
+    raise SystemExit(response.get("exit_code", 2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,24 @@
 import argparse
 import json
 import os
+import shutil
 import subprocess
 import sys
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 
+import headlessctl
+import headlessctl_client
+
+# One server connection per thread; a connection carries one request at a time.
+SERVER_CLIENTS = threading.local()
+# Set once the server reports context_mismatch; it won't change for the rest
+# of this process, so every later call goes straight to a subprocess.
+SERVER_MISMATCH = threading.Event()
+GATE_TASKS = ["S2.SPACE4X_CREW_SENSORS_CAUSALITY_MICRO", "S3.SPACE4X_CREW_ENTITY_TRANSFER_MICRO"]
+
 
 def resolve_state_dir():
     state_dir = os.environ.get("TRI_STATE_DIR")
@@ -99,6 +112,51 @@ def prioritize_fast_smoke(task_ids, task_data):
     return fast + rest
 
 
+def task_timeout_s(task):
+    timeout_s = task.get("timeout_s")
+    if isinstance(timeout_s, (int, float)) and timeout_s > 0:
+        return float(timeout_s)
+    return float(headlessctl.DEFAULT_TIMEOUT_S)
+
+
+def runs_multi_seed(task):
+    # Mirrors run_task: ai_polish tasks run their default seeds as one multi run.
+    return task.get("seed_policy") == "ai_polish" and len(task.get("default_seeds") or []) >= 3
+
+
+def plan_task_history(state_dir, task_ids, task_data):
+    multi_ids = [task_id for task_id in task_ids if runs_multi_seed(task_data.get(task_id, {}))]
+    single_ids = [task_id for task_id in task_ids if task_id not in multi_ids]
+    history = headlessctl.task_history(state_dir, single_ids)
+    history.update(headlessctl.task_history(state_dir, multi_ids, multi=1))
+    plan = {}
+    for task_id in task_ids:
+        entry = history.get(task_id) or {}
+        runs = entry.get("runs", 0)
+        failures = entry.get("failures", 0)
+        duration_s = entry.get("duration_s")
+        plan[task_id] = {
+            "runs": runs,
+            "failure_rate": entry.get("failure_rate"),
+            # Laplace-smoothed, so a task with no history counts as a coin flip.
+            "fail_probability": (failures + 1.0) / (runs + 2.0),
+            "estimate_s": duration_s if duration_s is not None else task_timeout_s(task_data.get(task_id, {})),
+            "estimate_source": "history" if duration_s is not None else "timeout_s"
+        }
+    return plan
+
+
+def order_tasks_by_history(task_ids, plan):
+    # Smith's rule on failure probability per second: cheap, often-red tasks
+    # first, which minimizes the expected time until the first failure shows.
+    # Ties keep the registry order.
+    position = {task_id: index for index, task_id in enumerate(task_ids)}
+    def priority(task_id):
+        entry = plan[task_id]
+        return (-entry["fail_probability"] / max(entry["estimate_s"], 0.001), position[task_id])
+    return sorted(task_ids, key=priority)
+
+
 def select_tasks(task_data, tag, task_ids):
     if task_ids:
         missing = [task_id for task_id in task_ids if task_id not in task_data]
@@ -114,7 +172,44 @@ def select_tasks(task_data, tag, task_ids):
     return selected
 
 
-def run_headlessctl(args):
+def headlessctl_mode():
+    mode = os.environ.get("NIGHTLY_HEADLESSCTL", "library")
+    return mode if mode in ("library", "server", "subprocess") else "library"
+
+
+def connect_headlessctl_server():
+    if SERVER_MISMATCH.is_set():
+        return None
+    client = getattr(SERVER_CLIENTS, "client", None)
+    if client is None and headlessctl_mode() == "server" and os.environ.get("HEADLESSCTL_NO_SERVER") != "1":
+        client = headlessctl_client.connect()
+        SERVER_CLIENTS.client = client
+    return client
+
+
+def run_headlessctl(args, call=None):
+    # call runs the same command through the headlessctl library, in this
+    # process; args is the CLI form used by the server and subprocess modes.
+    if call is not None and headlessctl_mode() == "library":
+        try:
+            result = call()
+        except Exception as exc:
+            return {"ok": False, "error_code": "exception", "error": str(exc), "run_id": None}, 2
+        return result, result.exit_code
+    client = connect_headlessctl_server()
+    if client is not None:
+        try:
+            response = client.request(args)
+            if (response.get("result") or {}).get("error_code") == "context_mismatch":
+                SERVER_MISMATCH.set()
+                raise ValueError("server cwd/env differ from nightly's")
+            for line in response.get("log") or []:
+                sys.stderr.write(line + "\n")
+            return response.get("result"), response.get("exit_code")
+        except (OSError, ValueError) as exc:
+            sys.stderr.write(f"NIGHTLY: headlessctl server unavailable, falling back to subprocess ({exc})\n")
+            client.close()
+            SERVER_CLIENTS.client = None
     tool_path = os.path.join(os.path.dirname(__file__), "headlessctl.py")
     proc = subprocess.run(
         [sys.executable, tool_path] + args,
@@ -143,33 +238,183 @@ def run_headlessctl(args):
     return data, proc.returncode
 
 
-def find_previous_run(state_dir, task_id, exclude_run_id):
-    runs_dir = os.path.join(state_dir, "runs")
-    if not os.path.isdir(runs_dir):
-        return None
-    candidates = []
-    for entry in os.listdir(runs_dir):
-        result_path = os.path.join(runs_dir, entry, "result.json")
-        if not os.path.exists(result_path):
-            continue
+def publish_bundle(src_path, dst_path):
+    # Hardlink when the artifacts dir shares a filesystem with the state dir,
+    # otherwise a streaming copy; memory use does not grow with bundle size.
+    # Bundles are replaced by rename when rebuilt, never rewritten in place.
+    try:
+        if os.path.samefile(src_path, dst_path):
+            return "existing"
+    except OSError:
+        pass
+    temp_path = f"{dst_path}.tmp-{os.getpid()}"
+    try:
         try:
-            with open(result_path, "r", encoding="utf-8") as handle:
-                result = json.load(handle)
-        except Exception:
-            continue
-        if result.get("task_id") != task_id:
-            continue
-        run_id = result.get("run_id")
-        if not run_id or run_id == exclude_run_id:
-            continue
-        ended_utc = result.get("ended_utc")
-        if not ended_utc:
+            os.link(src_path, temp_path)
+            method = "hardlink"
+        except OSError:
+            with open(src_path, "rb") as src, open(temp_path, "wb") as dst:
+                if hasattr(os, "sendfile"):
+                    offset = 0
+                    size = os.fstat(src.fileno()).st_size
+                    while offset < size:
+                        sent = os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+                        if sent == 0:
+                            raise OSError(f"bundle copy stopped at {offset}/{size} bytes")
+                        offset += sent
+                else:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            method = "copy"
+        os.replace(temp_path, dst_path)
+        return method
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def find_previous_run(state_dir, task_id, exclude_run_id):
+    return headlessctl.find_latest_run(state_dir, task_id, exclude_run_id)
+
+
+def parse_project_slots(value):
+    slots = {}
+    for item in parse_task_list(value):
+        project, _, raw = item.partition("=")
+        raw = raw.strip()
+        if not project.strip() or not raw.isdigit() or int(raw) < 1:
+            raise ValueError(f"invalid project slot limit: {item}")
+        slots[project.strip()] = int(raw)
+    return slots
+
+
+def start_task(task_id):
+    try:
+        return run_headlessctl(["run_task", task_id], lambda: headlessctl.run_task(task_id))
+    except Exception as exc:
+        return {"ok": False, "error_code": "nightly_exception", "error": str(exc), "run_id": None}, 2
+
+
+def gate_entry(task_id, run_result):
+    return {
+        "task_id": task_id,
+        "run_id": run_result.get("run_id"),
+        "ok": run_result.get("ok", False),
+        "exit_code": run_result.get("exit_code"),
+        "bank": (run_result.get("bank_status") or {}).get("status"),
+        "cached_from": run_result.get("cached_from")
+    }
+
+
+def finish_task(state_dir, artifact_dir, task_id, run_result, timings):
+    # Post-run half of a nightly task: metric evaluation, bundles and the
+    # previous-run comparison. timings carries queue/run times from the caller.
+    post_started = time.monotonic()
+    run_id = run_result.get("run_id")
+    seed_run_ids = run_result.get("seed_run_ids") or []
+    evaluation_runs = seed_run_ids if seed_run_ids else [run_id]
+
+    failures = []
+    command_ms = {"run_task": run_result.get("elapsed_ms"), "get_metrics": 0.0, "bundle_artifacts": 0.0}
+    metrics_summary = run_result.get("metrics_summary", {})
+    for eval_run_id in evaluation_runs:
+        metrics_result, _ = run_headlessctl(["get_metrics", eval_run_id], lambda: headlessctl.get_metrics(eval_run_id))
+        command_ms["get_metrics"] += metrics_result.get("elapsed_ms") or 0.0
+        failures.extend(evaluate_run(run_result, metrics_result))
+        if not metrics_summary:
+            metrics_summary = metrics_result.get("metrics_summary", {})
+
+    unique_run_ids = [run_id] + [rid for rid in seed_run_ids if rid and rid != run_id]
+    bundle_paths = []
+    for bundle_run_id in unique_run_ids:
+        if not bundle_run_id:
             continue
-        candidates.append((ended_utc, result))
-    if not candidates:
-        return None
-    candidates.sort(key=lambda item: item[0])
-    return candidates[-1][1]
+        bundle_result, _ = run_headlessctl(["bundle_artifacts", bundle_run_id], lambda: headlessctl.bundle_artifacts(bundle_run_id))
+        command_ms["bundle_artifacts"] += bundle_result.get("elapsed_ms") or 0.0
+        bundle_path = bundle_result.get("bundle_path")
+        if bundle_path and os.path.exists(bundle_path):
+            target_path = os.path.join(artifact_dir, os.path.basename(bundle_path))
+            if target_path != bundle_path:
+                try:
+                    publish_bundle(bundle_path, target_path)
+                except Exception:
+                    target_path = bundle_path
+            bundle_paths.append(target_path)
+
+    previous_run = find_previous_run(state_dir, task_id, run_id)
+    top_deltas = []
+    previous_run_id = None
+    if previous_run:
+        previous_run_id = previous_run.get("run_id")
+        top_deltas = compute_top_deltas(previous_run.get("metrics_summary", {}), metrics_summary)
+
+    timings = dict(timings)
+    timings["post_ms"] = round((time.monotonic() - post_started) * 1000.0, 3)
+    timings["total_ms"] = round(timings.get("run_ms", 0.0) + timings["post_ms"], 3)
+    timings["command_ms"] = command_ms
+    timings["run_task"] = run_result.get("timings")
+    return {
+        "task_id": task_id,
+        "run_id": run_id,
+        "seed_run_ids": seed_run_ids,
+        "ok": run_result.get("ok", False),
+        "error_code": run_result.get("error_code"),
+        "error": run_result.get("error"),
+        "failures": failures,
+        "previous_run_id": previous_run_id,
+        "top_metric_deltas": top_deltas,
+        "bundle_paths": bundle_paths,
+        "timings": timings
+    }
+
+
+def run_tasks_concurrently(state_dir, artifact_dir, gate_ids, task_ids, task_data, plan, slots, project_slots):
+    # Every gate runs, and no task starts until all gates have finished green;
+    # a failed gate cancels all tasks. A task starts when a global slot and a
+    # slot for its project are free; the post-run half runs on its own pool so
+    # the next simulation can start meanwhile.
+    queue = [(index, task_id, True) for index, task_id in enumerate(gate_ids)]
+    queue.extend((index, task_id, False) for index, task_id in enumerate(task_ids))
+    queued_at = time.monotonic()
+    running = {}
+    active = {}
+    post = []
+    gate_runs = []
+    gate_failed = False
+    with ThreadPoolExecutor(max_workers=slots) as run_pool, ThreadPoolExecutor(max_workers=slots) as post_pool:
+        while True:
+            gates_green = len(gate_runs) == len(gate_ids) and not gate_failed
+            for item in list(queue):
+                if len(running) >= slots or (not item[2] and not gates_green):
+                    break
+                project = task_data.get(item[1], {}).get("project")
+                if active.get(project, 0) >= project_slots.get(project, slots):
+                    continue
+                queue.remove(item)
+                active[project] = active.get(project, 0) + 1
+                running[run_pool.submit(start_task, item[1])] = (item, project, time.monotonic())
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                (index, task_id, is_gate), project, started = running.pop(future)
+                active[project] -= 1
+                run_result, _ = future.result()
+                if is_gate:
+                    entry = gate_entry(task_id, run_result)
+                    gate_runs.append(entry)
+                    if not entry["ok"]:
+                        gate_failed = True
+                    continue
+                timings = {
+                    "projected_ms": round(plan[task_id]["estimate_s"] * 1000.0, 3),
+                    "queue_ms": round((started - queued_at) * 1000.0, 3),
+                    "run_ms": round((time.monotonic() - started) * 1000.0, 3)
+                }
+                post.append((index, post_pool.submit(finish_task, state_dir, artifact_dir, task_id, run_result, timings)))
+        run_entries = [future.result() for _, future in sorted(post, key=lambda item: item[0])]
+    gate_runs.sort(key=lambda entry: gate_ids.index(entry["task_id"]))
+    cancelled = [task_id for _, task_id, is_gate in queue if not is_gate]
+    return gate_runs, run_entries, cancelled
 
 
 def compute_top_deltas(prev_metrics, curr_metrics, limit=5):
@@ -218,8 +463,31 @@ def main():
     parser.add_argument("--tag", default="nightly", help="Task tag to select.")
     parser.add_argument("--tasks", default="", help="Comma-separated task ids to run.")
     parser.add_argument("--gate", action="store_true", help="Run S2/S3 gate tasks before other work.")
-    parser.add_argument("--gate-hours", type=int, default=24, help="Skip gate tasks if last green is newer than hours.")
+    parser.add_argument("--gate-hours", type=int, default=24, help="Ignored; gate runs are reused by input fingerprint (see run_task cached_from).")
+    parser.add_argument(
+        "--order",
+        choices=("history", "registry"),
+        default=os.environ.get("NIGHTLY_ORDER", "history"),
+        help="history: cheapest, most-likely-to-fail tasks first from run history; registry: nightly_order with fast_smoke first."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.environ.get("NIGHTLY_CONCURRENCY", "1")),
+        help="Global slot cap for concurrent run_task calls (gates included)."
+    )
+    parser.add_argument(
+        "--project-slots",
+        default=os.environ.get("NIGHTLY_PROJECT_SLOTS", ""),
+        help="Per-project slot limits, e.g. godgame=2,space4x=3."
+    )
     args = parser.parse_args()
+    try:
+        project_slots = parse_project_slots(args.project_slots)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
 
     state_dir = resolve_state_dir()
     nightly_lock_path = resolve_nightly_lock_path(state_dir)
@@ -253,7 +521,10 @@ def main():
 
     session_lock = None
     try:
-        session_lock, _ = run_headlessctl(["claim_session_lock", "--ttl", "5400", "--purpose", "nightly_runner"])
+        session_lock, _ = run_headlessctl(
+            ["claim_session_lock", "--ttl", "5400", "--purpose", "nightly_runner"],
+            lambda: headlessctl.claim_session_lock_command(5400, "nightly_runner")
+        )
         if not session_lock.get("acquired"):
             summary = {
                 "ok": False,
@@ -292,6 +563,9 @@ def main():
 
         if not task_override:
             selected_tasks = prioritize_fast_smoke(selected_tasks, task_data)
+        schedule_plan = plan_task_history(state_dir, selected_tasks, task_data)
+        if not task_override and args.order == "history":
+            selected_tasks = order_tasks_by_history(selected_tasks, schedule_plan)
 
         if not selected_tasks and not args.gate:
             summary = {
@@ -318,110 +592,44 @@ def main():
             "gate_runs": []
         }
         write_nightly_lock(nightly_lock_path, args.tag, selected_tasks)
-        overall_fail = False
 
-        gate_tasks = ["S2.SPACE4X_CREW_SENSORS_CAUSALITY_MICRO", "S3.SPACE4X_CREW_ENTITY_TRANSFER_MICRO"]
         if args.gate:
-            selected_tasks = [task_id for task_id in selected_tasks if task_id not in gate_tasks]
+            selected_tasks = [task_id for task_id in selected_tasks if task_id not in GATE_TASKS]
             summary["tasks"] = selected_tasks
-            gate_fail = False
-            for task_id in gate_tasks:
-                previous_run = find_previous_run(state_dir, task_id, None)
-                skip_gate = False
-                if previous_run:
-                    ended = previous_run.get("ended_utc")
-                    if ended:
-                        try:
-                            from datetime import datetime, timezone, timedelta
-                            if ended.endswith("Z"):
-                                ended = ended[:-1] + "+00:00"
-                            ended_dt = datetime.fromisoformat(ended)
-                            if datetime.now(timezone.utc) - ended_dt < timedelta(hours=args.gate_hours):
-                                if previous_run.get("exit_code") == 0:
-                                    bank_status = previous_run.get("bank_status") or {}
-                                    if bank_status.get("status") == "PASS":
-                                        skip_gate = True
-                        except Exception:
-                            pass
-                if skip_gate:
-                    summary["gate_runs"].append({
-                        "task_id": task_id,
-                        "skipped": True,
-                        "reason": "recent_green"
-                    })
-                    continue
-                run_result, _ = run_headlessctl(["run_task", task_id])
-                summary["gate_runs"].append({
-                    "task_id": task_id,
-                    "run_id": run_result.get("run_id"),
-                    "ok": run_result.get("ok", False),
-                    "exit_code": run_result.get("exit_code"),
-                    "bank": (run_result.get("bank_status") or {}).get("status")
-                })
-                if not run_result.get("ok", False):
-                    gate_fail = True
-            if gate_fail:
-                summary["ok"] = False
-                summary_path = os.path.join(os.getcwd(), "nightly_summary.json")
-                with open(summary_path, "w", encoding="utf-8") as handle:
-                    json.dump(summary, handle, indent=2, sort_keys=True)
-                sys.exit(1)
-
-        for task_id in selected_tasks:
-            run_result, _ = run_headlessctl(["run_task", task_id])
-            run_id = run_result.get("run_id")
-            seed_run_ids = run_result.get("seed_run_ids") or []
-            evaluation_runs = seed_run_ids if seed_run_ids else [run_id]
-
-            failures = []
-            metrics_summary = run_result.get("metrics_summary", {})
-            for eval_run_id in evaluation_runs:
-                metrics_result, _ = run_headlessctl(["get_metrics", eval_run_id])
-                failures.extend(evaluate_run(run_result, metrics_result))
-                if not metrics_summary:
-                    metrics_summary = metrics_result.get("metrics_summary", {})
-
-            unique_run_ids = [run_id] + [rid for rid in seed_run_ids if rid and rid != run_id]
-            bundle_paths = []
-            for bundle_run_id in unique_run_ids:
-                if not bundle_run_id:
-                    continue
-                bundle_result, _ = run_headlessctl(["bundle_artifacts", bundle_run_id])
-                bundle_path = bundle_result.get("bundle_path")
-                if bundle_path and os.path.exists(bundle_path):
-                    target_path = os.path.join(artifact_dir, os.path.basename(bundle_path))
-                    if target_path != bundle_path:
-                        try:
-                            with open(bundle_path, "rb") as src, open(target_path, "wb") as dst:
-                                dst.write(src.read())
-                        except Exception:
-                            target_path = bundle_path
-                    bundle_paths.append(target_path)
-
-            previous_run = find_previous_run(state_dir, task_id, run_id)
-            top_deltas = []
-            previous_run_id = None
-            if previous_run:
-                previous_run_id = previous_run.get("run_id")
-                top_deltas = compute_top_deltas(previous_run.get("metrics_summary", {}), metrics_summary)
-
-            run_entry = {
-                "task_id": task_id,
-                "run_id": run_id,
-                "seed_run_ids": seed_run_ids,
-                "ok": run_result.get("ok", False),
-                "error_code": run_result.get("error_code"),
-                "error": run_result.get("error"),
-                "failures": failures,
-                "previous_run_id": previous_run_id,
-                "top_metric_deltas": top_deltas,
-                "bundle_paths": bundle_paths
-            }
-            summary["runs"].append(run_entry)
-
-            if failures:
-                overall_fail = True
+        # Gates always go through run_task; a gate whose inputs match an
+        # earlier green run is answered from that run (cached_from).
+        pending_gates = list(GATE_TASKS) if args.gate else []
+
+        # Ignores per-project limits; with one slot this is the serial sum.
+        projected_s = headlessctl.project_makespan([schedule_plan[task_id]["estimate_s"] for task_id in selected_tasks], args.concurrency)
+        summary["schedule"] = {
+            "order": args.order if not task_override else "explicit",
+            "concurrency": args.concurrency,
+            "project_slots": project_slots,
+            "projected_ms": round(projected_s * 1000.0, 3),
+            "tasks": [dict(schedule_plan[task_id], task_id=task_id) for task_id in selected_tasks]
+        }
+        tasks_started = time.monotonic()
+        gate_runs, run_entries, cancelled = run_tasks_concurrently(
+            state_dir, artifact_dir, pending_gates, selected_tasks, task_data, schedule_plan, args.concurrency, project_slots
+        )
+        summary["gate_runs"].extend(gate_runs)
+        summary["runs"].extend(run_entries)
+        if cancelled:
+            summary["cancelled_tasks"] = cancelled
+        if any(not entry.get("ok", False) for entry in gate_runs):
+            summary["ok"] = False
+            summary_path = os.path.join(os.getcwd(), "nightly_summary.json")
+            with open(summary_path, "w", encoding="utf-8") as handle:
+                json.dump(summary, handle, indent=2, sort_keys=True)
+            sys.exit(1)
+        overall_fail = any(entry["failures"] for entry in summary["runs"])
 
+        actual_ms = round((time.monotonic() - tasks_started) * 1000.0, 3)
+        summary["schedule"]["actual_ms"] = actual_ms
+        summary["schedule"]["drift_ms"] = round(actual_ms - summary["schedule"]["projected_ms"], 3)
+        first_failure = next((index for index, entry in enumerate(summary["runs"]) if entry["failures"]), None)
+        summary["schedule"]["first_failure_index"] = first_failure
         summary["ok"] = not overall_fail
         summary_path = os.path.join(os.getcwd(), "nightly_summary.json")
         with open(summary_path, "w", encoding="utf-8") as handle:
@@ -431,7 +639,11 @@ def main():
             sys.exit(1)
     finally:
         if session_lock and session_lock.get("acquired"):
-            run_headlessctl(["release_session_lock", "--run-id", session_lock.get("run_id") or ""])
+            release_run_id = session_lock.get("run_id") or ""
+            run_headlessctl(
+                ["release_session_lock", "--run-id", release_run_id],
+                lambda: headlessctl.release_session_lock_command(release_run_id)
+            )
         clear_nightly_lock(nightly_lock_path)
 
 
@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import headlessctl  # noqa: E402
+
+# Stand-in for a Unity headless player: writes FAKE_TICKS ticks of telemetry
+# (FAKE_EVENTS events of FAKE_PAD_BYTES padding per tick) and touches
+# FAKE_DONE_PATH only if it ran to the end.
+FAKE_PLAYER = """#!/usr/bin/env python3
+import json, os, sys, time
+path = os.environ["PUREDOTS_TELEMETRY_PATH"]
+ticks = int(os.environ.get("FAKE_TICKS", "20"))
+pad = int(os.environ.get("FAKE_PAD_BYTES", "0"))
+events = int(os.environ.get("FAKE_EVENTS", "1" if pad else "0"))
+sleep = float(os.environ.get("FAKE_SLEEP", "0"))
+with open(path, "w") as fh:
+    fh.write(json.dumps({"type": "header", "tick": 0, "seed": 7, "scenario": "fixture"}) + "\\n")
+    for t in range(1, ticks + 1):
+        fh.write(json.dumps({"type": "metric", "tick": t, "key": "m.a", "value": float(t), "unit": "count", "loop": "main"}) + "\\n")
+        fh.write(json.dumps({"type": "metric", "tick": t, "key": "m.b", "value": t * 0.5, "unit": "ticks", "loop": "main"}) + "\\n")
+        for _ in range(events):
+            fh.write(json.dumps({"type": "event", "tick": t, "name": "pad", "data": "x" * pad}) + "\\n")
+        fh.flush()
+        if sleep:
+            time.sleep(sleep)
+done = os.environ.get("FAKE_DONE_PATH")
+if done:
+    open(done, "w").close()
+print("TELEMETRY_OUT:" + path, flush=True)
+sys.exit(int(os.environ.get("FAKE_EXIT", "0")))
+"""
+
+TASK_ID = "T.FIXTURE"
+PACK_NAME = "fixture"
+
+
+def default_tasks():
+    return {
+        TASK_ID: {
+            "project": "space4x",
+            "runner": "space4x_loader",
+            "scenario_path": "space4x/Assets/Scenarios/fixture.json",
+            "tick_budget": 20,
+            "timeout_s": 60,
+            "default_seeds": [7],
+            "default_pack": PACK_NAME,
+            "allow_exit_codes": [0],
+            "metric_keys": ["m.a", "m.b"]
+        }
+    }
+
+
+def default_packs():
+    return {
+        PACK_NAME: {
+            "env": {"PUREDOTS_TELEMETRY_ENABLE": "1"},
+            "caps": {"max_bytes": 10000000, "max_events_per_tick": 64, "on_exceed": "kill"},
+            "artifacts_include": ["telemetry", "stdout", "metrics", "metric_store", "invariants"],
+            "artifacts_exclude": [],
+            "compress_jsonl": False
+        }
+    }
+
+
+class StateDirTestCase(unittest.TestCase):
+    # A throwaway TRI_STATE_DIR with helpers to lay out runs/<id>/.
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp(prefix="headlessctl-test-")
+        self.saved_env = {name: os.environ.get(name) for name in ("TRI_STATE_DIR", "TRI_ROOT", "HEADLESS_REBUILD_TOOL_ROOT")}
+        os.environ["TRI_STATE_DIR"] = self.state_dir
+
+    def tearDown(self):
+        for name, value in self.saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def write_run(self, run_id, result=None, payload_bytes=0):
+        run_dir = os.path.join(self.state_dir, "runs", run_id)
+        os.makedirs(run_dir)
+        if payload_bytes:
+            with open(os.path.join(run_dir, "stdout.log"), "wb") as handle:
+                handle.write(b"x" * payload_bytes)
+        if result is not None:
+            with open(os.path.join(run_dir, "result.json"), "w", encoding="utf-8") as handle:
+                json.dump(dict(result, run_id=run_id), handle)
+        return run_dir
+
+
+class HeadlessTestCase(StateDirTestCase):
+    # A complete Tri checkout in a temp dir: tool root with its own task and
+    # pack registries, a fake space4x player and a scenario, so run_task runs
+    # end to end without Unity.
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp(prefix="headlessctl-tri-")
+        self.tool_root = os.path.join(self.root, "tool")
+        self.tri_root = os.path.join(self.root, "tri")
+        for name in ("godgame", "puredots", "space4x/Assets/Scenarios", "Tools/builds/space4x/Linux_latest"):
+            os.makedirs(os.path.join(self.tri_root, name))
+        os.makedirs(os.path.join(self.tool_root, "Tools", "Headless"))
+        self.binary = os.path.join(self.tri_root, "Tools", "builds", "space4x", "Linux_latest", "Space4X_Headless.x86_64")
+        with open(self.binary, "w", encoding="utf-8") as handle:
+            handle.write(FAKE_PLAYER)
+        os.chmod(self.binary, os.stat(self.binary).st_mode | stat.S_IXUSR)
+        with open(os.path.join(self.tri_root, "space4x", "Assets", "Scenarios", "fixture.json"), "w", encoding="utf-8") as handle:
+            json.dump({"name": "fixture", "seed": 1}, handle)
+        self.write_registry(default_tasks(), default_packs())
+        self.saved_fake_env = {name: os.environ.get(name) for name in os.environ if name.startswith("FAKE_")}
+        os.environ["TRI_ROOT"] = self.tri_root
+        os.environ["HEADLESS_REBUILD_TOOL_ROOT"] = self.tool_root
+
+    def tearDown(self):
+        for name in [name for name in os.environ if name.startswith("FAKE_")]:
+            os.environ.pop(name)
+        os.environ.update({name: value for name, value in self.saved_fake_env.items() if value is not None})
+        super().tearDown()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write_registry(self, tasks=None, packs=None):
+        headless_dir = os.path.join(self.tool_root, "Tools", "Headless")
+        for name, key, doc in (("headless_tasks.json", "tasks", tasks), ("headless_packs.json", "packs", packs)):
+            if doc is None:
+                continue
+            path = os.path.join(headless_dir, name)
+            previous = os.stat(path) if os.path.exists(path) else None
+            with open(path, "w", encoding="utf-8") as handle:
+                json.dump({"schema_version": 1, key: doc}, handle, indent=2, sort_keys=True)
+            if previous is not None:
+                # Coarse filesystem clocks could leave the mtime unchanged.
+                os.utime(path, ns=(previous.st_atime_ns, previous.st_mtime_ns + 1000000))
@@ -0,0 +1,54 @@
+import gzip
+import os
+import unittest
+
+from fixtures import PACK_NAME, TASK_ID, HeadlessTestCase, default_packs, headlessctl
+
+
+class CheckJsonlArtifactTests(HeadlessTestCase):
+    def run_compressed(self, spec):
+        packs = default_packs()
+        packs[PACK_NAME]["compress_jsonl"] = spec
+        self.write_registry(packs=packs)
+        result = headlessctl.run_task(TASK_ID, use_cache=False)
+        self.assertTrue(result.ok, result.get("error"))
+        return result["artifacts"]
+
+    def test_gzip_artifacts_pass(self):
+        artifacts = self.run_compressed("gzip")
+        for key in ("metrics", "invariants"):
+            self.assertTrue(artifacts[key].endswith(".jsonl.gz"), artifacts[key])
+            check = headlessctl.check_jsonl_artifact(f"{key}.jsonl:single", artifacts[key])
+            self.assertTrue(check["ok"], check)
+
+    @unittest.skipIf(headlessctl.lazy_import_zstandard() is None, "zstandard not installed")
+    def test_zstd_artifacts_pass(self):
+        artifacts = self.run_compressed("zstd")
+        self.assertTrue(artifacts["metrics"].endswith(".jsonl.zst"), artifacts["metrics"])
+        self.assertTrue(headlessctl.check_jsonl_artifact("metrics.jsonl:single", artifacts["metrics"])["ok"])
+
+    def test_corrupt_gzip_fails(self):
+        metrics_path = self.run_compressed("gzip")["metrics"]
+        with open(metrics_path, "r+b") as handle:
+            handle.seek(10)
+            handle.write(b"\xff" * 16)
+        check = headlessctl.check_jsonl_artifact("metrics.jsonl:single", metrics_path)
+        self.assertFalse(check["ok"])
+        self.assertIn("error", check)
+
+    def test_empty_stream_fails(self):
+        path = os.path.join(self.root, "metrics.jsonl.gz")
+        with gzip.open(path, "wt", encoding="utf-8"):
+            pass
+        self.assertFalse(headlessctl.check_jsonl_artifact("metrics.jsonl:single", path)["ok"])
+
+    def test_missing_or_wrong_name_fails(self):
+        self.assertFalse(headlessctl.check_jsonl_artifact("metrics.jsonl:single", None)["ok"])
+        path = os.path.join(self.root, "metrics.json")
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write('{"tick": 1}\n')
+        self.assertFalse(headlessctl.check_jsonl_artifact("metrics.jsonl:single", path)["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
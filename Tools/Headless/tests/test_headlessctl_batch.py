@@ -0,0 +1,37 @@
+import unittest
+
+from fixtures import headlessctl
+
+
+class ProjectMakespanTests(unittest.TestCase):
+    def test_list_schedule(self):
+        self.assertEqual(headlessctl.project_makespan([3.0, 3.0, 2.0, 2.0, 2.0], 2), 7.0)
+        self.assertEqual(headlessctl.project_makespan([3.0, 3.0, 2.0, 2.0, 2.0], 1), 12.0)
+        self.assertEqual(headlessctl.project_makespan([5.0, 1.0, 1.0], 3), 5.0)
+
+    def test_degenerate(self):
+        self.assertEqual(headlessctl.project_makespan([], 4), 0.0)
+        self.assertEqual(headlessctl.project_makespan([2.0, 3.0], 0), 5.0)
+
+
+class ParseBatchItemTests(unittest.TestCase):
+    def test_strings(self):
+        self.assertEqual(headlessctl.parse_batch_item("T"), ({"task_id": "T", "seed": None, "pack": None}, None))
+        self.assertEqual(headlessctl.parse_batch_item("T:7"), ({"task_id": "T", "seed": 7, "pack": None}, None))
+        self.assertEqual(headlessctl.parse_batch_item("T:7:ci"), ({"task_id": "T", "seed": 7, "pack": "ci"}, None))
+        self.assertEqual(headlessctl.parse_batch_item("T::ci"), ({"task_id": "T", "seed": None, "pack": "ci"}, None))
+
+    def test_dicts(self):
+        self.assertEqual(headlessctl.parse_batch_item({"task": "T", "seed": 3}), ({"task_id": "T", "seed": 3, "pack": None}, None))
+        self.assertEqual(headlessctl.parse_batch_item({"task_id": "T", "seed": "4", "pack": "ci"}), ({"task_id": "T", "seed": 4, "pack": "ci"}, None))
+
+    def test_errors(self):
+        self.assertEqual(headlessctl.parse_batch_item(""), (None, "missing_task_id"))
+        self.assertEqual(headlessctl.parse_batch_item({"seed": 1}), (None, "missing_task_id"))
+        self.assertEqual(headlessctl.parse_batch_item("T:x"), (None, "invalid_seed"))
+        self.assertEqual(headlessctl.parse_batch_item("T:-1"), (None, "invalid_seed"))
+        self.assertEqual(headlessctl.parse_batch_item({"task_id": "T", "seed": True}), (None, "invalid_seed"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import json
+import os
+import unittest
+
+from fixtures import PACK_NAME, TASK_ID, HeadlessTestCase, StateDirTestCase, default_packs, headlessctl
+
+
+def blob_files(blob_dir):
+    return sorted(name for _, _, names in os.walk(blob_dir) for name in names)
+
+
+class TemplateBlobTests(StateDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.scenario = os.path.join(self.state_dir, "scenarios", "fixture.json")
+        os.makedirs(os.path.join(os.path.dirname(self.scenario), "Templates"))
+        for name, body in (("fixture.json", "{}"), ("Templates/ships.json", '{"ships": 1}'), ("Templates/crew.json", '{"crew": 2}')):
+            with open(os.path.join(os.path.dirname(self.scenario), name), "w", encoding="utf-8") as handle:
+                handle.write(body)
+        self.blob_dir = os.path.join(self.state_dir, headlessctl.BLOB_STORE_DIRNAME)
+        self.run_dir = self.write_run("r1")
+
+    def test_links_are_recorded_before_ingest(self):
+        headlessctl.copy_scenario_templates(self.scenario, self.run_dir, self.blob_dir)
+        manifest = headlessctl.load_json(os.path.join(self.run_dir, headlessctl.BLOB_MANIFEST_NAME))
+        self.assertEqual(sorted(manifest), ["Templates/crew.json", "Templates/ships.json"])
+        for digest in manifest.values():
+            self.assertEqual(os.stat(headlessctl.blob_path(self.blob_dir, digest)).st_nlink, 2)
+        # The run dies here: ingest_run_dir never runs.
+        headlessctl.remove_run_dir(self.state_dir, self.run_dir)
+        self.assertEqual(blob_files(self.blob_dir), [])
+
+    def test_shared_template_outlives_one_run(self):
+        other_dir = self.write_run("r2")
+        headlessctl.copy_scenario_templates(self.scenario, self.run_dir, self.blob_dir)
+        headlessctl.copy_scenario_templates(self.scenario, other_dir, self.blob_dir)
+        headlessctl.remove_run_dir(self.state_dir, self.run_dir)
+        self.assertEqual(len(blob_files(self.blob_dir)), 2)
+        headlessctl.remove_run_dir(self.state_dir, other_dir)
+        self.assertEqual(blob_files(self.blob_dir), [])
+
+    def test_ingest_keeps_recorded_links(self):
+        headlessctl.copy_scenario_templates(self.scenario, self.run_dir, self.blob_dir)
+        with open(os.path.join(self.run_dir, "stdout.log"), "w", encoding="utf-8") as handle:
+            handle.write("log\n")
+        headlessctl.ingest_run_dir(self.blob_dir, self.run_dir)
+        manifest = headlessctl.load_json(os.path.join(self.run_dir, headlessctl.BLOB_MANIFEST_NAME))
+        self.assertEqual(sorted(manifest), ["Templates/crew.json", "Templates/ships.json", "stdout.log"])
+        headlessctl.remove_run_dir(self.state_dir, self.run_dir)
+        self.assertEqual(blob_files(self.blob_dir), [])
+
+
+class RunBlobTests(HeadlessTestCase):
+    def test_removed_run_releases_every_blob(self):
+        templates_dir = os.path.join(self.tri_root, "space4x", "Assets", "Scenarios", "Templates")
+        os.makedirs(templates_dir)
+        with open(os.path.join(templates_dir, "ships.json"), "w", encoding="utf-8") as handle:
+            json.dump({"ships": 3}, handle)
+        packs = default_packs()
+        packs[PACK_NAME]["blob_store"] = True
+        self.write_registry(packs=packs)
+        result = headlessctl.run_task(TASK_ID, use_cache=False)
+        self.assertTrue(result.ok, result.get("error"))
+        run_dir = os.path.join(self.state_dir, "runs", result["run_id"])
+        manifest = headlessctl.load_json(os.path.join(run_dir, headlessctl.BLOB_MANIFEST_NAME))
+        self.assertIn("Templates/ships.json", manifest)
+        blob_dir = os.path.join(self.state_dir, headlessctl.BLOB_STORE_DIRNAME)
+        self.assertTrue(blob_files(blob_dir))
+        headlessctl.remove_run_dir(self.state_dir, run_dir)
+        self.assertEqual(blob_files(blob_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import os
+import unittest
+
+from fixtures import PACK_NAME, TASK_ID, HeadlessTestCase, default_packs, headlessctl
+
+
+class ShippedPackTests(unittest.TestCase):
+    def test_shipped_packs_kill_on_max_bytes(self):
+        packs_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "headless_packs.json")
+        with open(packs_path, "r", encoding="utf-8") as handle:
+            packs = json.load(handle)["packs"]
+        for pack_name, pack in packs.items():
+            caps = pack.get("caps") or {}
+            if caps.get("max_bytes"):
+                self.assertEqual(caps.get("on_exceed"), "kill", pack_name)
+                self.assertIn(caps.get("on_exceed_events", "warn"), headlessctl.EVENT_CAP_ACTIONS, pack_name)
+
+
+class LiveCapTests(HeadlessTestCase):
+    def set_caps(self, **caps):
+        packs = default_packs()
+        packs[PACK_NAME]["caps"] = caps
+        self.write_registry(packs=packs)
+
+    def test_max_bytes_kills_writer(self):
+        # Unbounded, the writer would produce ~200 MB over ~100 s.
+        self.set_caps(max_bytes=200000, on_exceed="kill")
+        done_path = os.path.join(self.root, "writer_finished")
+        os.environ.update({"FAKE_TICKS": "100000", "FAKE_PAD_BYTES": "2000", "FAKE_SLEEP": "0.001", "FAKE_DONE_PATH": done_path})
+        result = headlessctl.run_task(TASK_ID, use_cache=False)
+        self.assertFalse(result.ok)
+        self.assertEqual(result["error_code"], "telemetry_cap_exceeded")
+        self.assertEqual(result["telemetry_cap"]["cap"], "max_bytes")
+        self.assertEqual(result["telemetry_cap"]["action"], "kill")
+        self.assertFalse(os.path.exists(done_path))
+        telemetry_path = os.path.join(self.state_dir, "runs", result["run_id"], "telemetry.ndjson")
+        self.assertLess(os.path.getsize(telemetry_path), 20000000)
+
+    def test_under_cap_runs_clean(self):
+        self.set_caps(max_bytes=10000000, on_exceed="kill")
+        result = headlessctl.run_task(TASK_ID, use_cache=False)
+        self.assertTrue(result.ok, result.get("error"))
+        self.assertIsNone(result["telemetry_cap"])
+        self.assertEqual(result["metrics_summary"]["telemetry.truncated"], 0)
+
+    def test_events_per_tick_warns_by_default(self):
+        self.set_caps(max_bytes=10000000, max_events_per_tick=2, on_exceed="kill")
+        os.environ["FAKE_EVENTS"] = "3"
+        result = headlessctl.run_task(TASK_ID, use_cache=False)
+        self.assertTrue(result.ok, result.get("error"))
+        self.assertEqual((result["telemetry_cap"]["cap"], result["telemetry_cap"]["action"]), ("max_events_per_tick", "warn"))
+        self.assertEqual(result["metrics_summary"]["telemetry.truncated"], 0)
+        self.assertEqual(result["metrics_stats"]["m.a"]["count"], 20)
+
+    def test_events_per_tick_kill(self):
+        self.set_caps(max_bytes=10000000, max_events_per_tick=2, on_exceed_events="kill")
+        os.environ.update({"FAKE_EVENTS": "3", "FAKE_TICKS": "100000", "FAKE_SLEEP": "0.001"})
+        result = headlessctl.run_task(TASK_ID, use_cache=False)
+        self.assertEqual(result["error_code"], "telemetry_cap_exceeded")
+        self.assertEqual(result["telemetry_cap"]["cap"], "max_events_per_tick")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import unittest
+
+from fixtures import PACK_NAME, TASK_ID, HeadlessTestCase, default_packs, default_tasks, headlessctl
+
+
+class RunReuseTests(HeadlessTestCase):
+    def setUp(self):
+        super().setUp()
+        self.library = os.path.join(os.path.dirname(self.binary), "UnityPlayer.so")
+        with open(self.library, "wb") as handle:
+            handle.write(b"player-v1")
+        self.saved_launch_env = {name: os.environ.get(name) for name in ("PUREDOTS_TELEMETRY_LEVEL", "TRI_FEATURE_FLAGS")}
+        for name in self.saved_launch_env:
+            os.environ.pop(name, None)
+        self.first = headlessctl.run_task(TASK_ID)
+        self.assertTrue(self.first.ok, self.first.get("error"))
+        self.assertIsNone(self.first.get("cached_from"))
+
+    def tearDown(self):
+        for name, value in self.saved_launch_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        super().tearDown()
+
+    def rewrite_library(self, content, bump_mtime=True):
+        previous = os.stat(self.library)
+        with open(self.library, "wb") as handle:
+            handle.write(content)
+        mtime_ns = previous.st_mtime_ns + (1000000000 if bump_mtime else 0)
+        os.utime(self.library, ns=(previous.st_atime_ns, mtime_ns))
+
+    def assert_reused(self, result):
+        self.assertTrue(result.ok, result.get("error"))
+        self.assertEqual(result["cached_from"], self.first["run_id"])
+        self.assertEqual(result["input_fingerprint"], self.first["input_fingerprint"])
+
+    def assert_fresh(self, result):
+        self.assertTrue(result.ok, result.get("error"))
+        self.assertIsNone(result.get("cached_from"))
+        self.assertNotEqual(result["run_id"], self.first["run_id"])
+
+    def test_same_inputs_reuse_run(self):
+        self.assert_reused(headlessctl.run_task(TASK_ID))
+
+    def test_touched_build_file_is_rehashed_not_missed(self):
+        self.rewrite_library(b"player-v1")
+        self.assert_reused(headlessctl.run_task(TASK_ID))
+
+    def test_changed_build_file_misses(self):
+        # Same size, new mtime: the hash cache entry is stale and rehashed.
+        self.rewrite_library(b"player-v2")
+        self.assert_fresh(headlessctl.run_task(TASK_ID))
+
+    def test_resized_build_file_misses(self):
+        # Size alone invalidates the hash cache entry, even at the old mtime.
+        self.rewrite_library(b"player-v1-patched", bump_mtime=False)
+        self.assert_fresh(headlessctl.run_task(TASK_ID))
+
+    def test_changed_pack_misses(self):
+        packs = default_packs()
+        packs[PACK_NAME]["env"]["PUREDOTS_TELEMETRY_LEVEL"] = "full"
+        self.write_registry(packs=packs)
+        self.assert_fresh(headlessctl.run_task(TASK_ID))
+
+    def test_changed_task_misses(self):
+        tasks = default_tasks()
+        tasks[TASK_ID]["tick_budget"] = 40
+        self.write_registry(tasks=tasks)
+        self.assert_fresh(headlessctl.run_task(TASK_ID))
+
+    def test_other_seed_misses(self):
+        self.assert_fresh(headlessctl.run_task(TASK_ID, seed=8))
+
+    def test_ambient_launch_env_misses(self):
+        os.environ["TRI_FEATURE_FLAGS"] = "fast_path"
+        self.assert_fresh(headlessctl.run_task(TASK_ID))
+
+    def test_unrelated_env_reuses(self):
+        os.environ["FAKE_UNRELATED"] = "1"
+        self.assert_reused(headlessctl.run_task(TASK_ID))
+
+    def test_no_cache_runs_fresh(self):
+        result = headlessctl.run_task(TASK_ID, use_cache=False)
+        self.assert_fresh(result)
+        self.assertEqual(result["input_fingerprint"], self.first["input_fingerprint"])
+
+    def test_repeated_seed_reuses_only_first_occurrence(self):
+        result = headlessctl.run_task(TASK_ID, seeds=[7, 7])
+        self.assertTrue(result.ok, result.get("error"))
+        seed_runs = result["seed_runs"]
+        self.assertEqual(seed_runs[0]["cached_from"], self.first["run_id"])
+        self.assertIsNone(seed_runs[1]["cached_from"])
+        self.assertNotIn(seed_runs[1]["run_id"], (self.first["run_id"], seed_runs[0]["run_id"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
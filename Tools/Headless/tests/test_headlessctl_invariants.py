@@ -0,0 +1,29 @@
+import json
+import shutil
+import tempfile
+import unittest
+
+from fixtures import headlessctl
+
+
+class InvariantAbortTests(unittest.TestCase):
+    def setUp(self):
+        self.run_dir = tempfile.mkdtemp(prefix="headlessctl-invariants-")
+
+    def tearDown(self):
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    def test_abort_record_is_strict_json(self):
+        scanner = headlessctl.TelemetryScanner(self.run_dir, abort_invariants=["telemetry.no_nan_inf"], keep_events=False, keep_metrics_jsonl=False)
+        scanner.feed('{"type": "metric", "tick": 1, "key": "m.a", "value": 1.0}\n')
+        scanner.feed('{"type": "event", "tick": 2, "name": "probe", "data": {"speed": NaN, "range": [1.5, -Infinity], "hull": 1e400}}\n')
+        scanner.close_outputs()
+        self.assertTrue(scanner.violation_event.is_set())
+        violation = scanner.violation
+        self.assertEqual((violation["name"], violation["tick"]), ("telemetry.no_nan_inf", 2))
+        self.assertEqual(violation["record"]["data"], {"speed": None, "range": [1.5, None], "hull": None})
+        self.assertEqual(json.loads(json.dumps(violation, allow_nan=False)), violation)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from fixtures import TASK_ID, HeadlessTestCase, headlessctl
+
+
+class MetricColumnsTests(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="headlessctl-store-")
+        self.telemetry_path = os.path.join(self.work_dir, "telemetry.ndjson")
+        with open(self.telemetry_path, "w", encoding="utf-8") as handle:
+            for tick in range(3000):
+                handle.write(json.dumps({"type": "metric", "tick": tick, "key": "m.a", "value": tick * 0.5, "loop": "main"}) + "\n")
+                if tick % 3 == 0:
+                    handle.write(json.dumps({"type": "metric", "tick": tick, "key": "m.b", "value": -tick, "loop": "sim" if tick % 2 else "main"}) + "\n")
+                if tick == 2500:
+                    handle.write(json.dumps({"type": "metric", "tick": tick, "key": "m.late", "value": 1.0, "loop": "late"}) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def scan(self, name, shards):
+        run_dir = os.path.join(self.work_dir, name)
+        os.makedirs(run_dir)
+        headlessctl.scan_telemetry(self.telemetry_path, run_dir, {}, shards=shards)
+        return run_dir
+
+    def series(self, run_dir, key):
+        series = headlessctl.load_metric_series(run_dir, key)
+        return {name: list(values) for name, values in series.items()}
+
+    def test_spooled_columns_round_trip(self):
+        with mock.patch.object(headlessctl, "METRIC_COLUMN_FLUSH_SAMPLES", 100):
+            run_dir = self.scan("spooled", 1)
+        manifest = headlessctl.load_metric_store(run_dir)
+        self.assertEqual(manifest["count"], 3000 + 1000 + 1)
+        self.assertFalse(os.path.exists(os.path.join(run_dir, headlessctl.METRIC_STORE_DIRNAME, ".spool")))
+        series = self.series(run_dir, "m.a")
+        self.assertEqual(series["tick"], list(range(3000)))
+        self.assertEqual(series["value"], [tick * 0.5 for tick in range(3000)])
+        loops = manifest["loops"]
+        b = self.series(run_dir, "m.b")
+        self.assertEqual(b["value"], [float(-tick) for tick in range(0, 3000, 3)])
+        self.assertEqual([loops[i] for i in b["loop"]], ["sim" if tick % 2 else "main" for tick in range(0, 3000, 3)])
+        keys = headlessctl.read_npy(os.path.join(run_dir, headlessctl.METRIC_STORE_DIRNAME, "key.npy"), "i")
+        self.assertEqual(list(keys), [0] * 3000 + [1] * 1000 + [2])
+
+    def test_extend_remaps_loops(self):
+        with mock.patch.object(headlessctl, "METRIC_COLUMN_FLUSH_SAMPLES", 4):
+            first = headlessctl.MetricColumns(os.path.join(self.work_dir, "first"))
+            second = headlessctl.MetricColumns(os.path.join(self.work_dir, "second"))
+            for tick in range(10):
+                first.append(tick, "m.a", tick, "main")
+                second.append(tick + 10, "m.b", tick, "sim")
+                second.append(tick + 10, "m.a", tick + 10, "main" if tick % 2 else "sim")
+            second.append(20, "m.a", "text", "main")
+            first.extend(second)
+            first.write(os.path.join(self.work_dir, "run", headlessctl.METRIC_STORE_DIRNAME))
+        run_dir = os.path.join(self.work_dir, "run")
+        manifest = headlessctl.load_metric_store(run_dir)
+        self.assertEqual((manifest["keys"], manifest["loops"], manifest["skipped_non_numeric"]), (["m.a", "m.b"], ["main", "sim"], 1))
+        series = self.series(run_dir, "m.a")
+        self.assertEqual(series["tick"], list(range(20)))
+        self.assertEqual([manifest["loops"][i] for i in series["loop"]], ["main"] * 10 + ["main" if tick % 2 else "sim" for tick in range(10)])
+        self.assertEqual(self.series(run_dir, "m.b")["loop"], [1] * 10)
+
+    def test_sharded_store_matches_single_pass(self):
+        single_dir = self.scan("single", 1)
+        with mock.patch.object(headlessctl, "METRIC_COLUMN_FLUSH_SAMPLES", 100):
+            sharded_dir = self.scan("sharded", 3)
+        single = headlessctl.load_metric_store(single_dir)
+        sharded = headlessctl.load_metric_store(sharded_dir)
+        self.assertEqual((single["keys"], single["ranges"], single["count"]), (sharded["keys"], sharded["ranges"], sharded["count"]))
+        for key in single["keys"]:
+            single_series = self.series(single_dir, key)
+            sharded_series = self.series(sharded_dir, key)
+            self.assertEqual(single_series["tick"], sharded_series["tick"], key)
+            self.assertEqual(single_series["value"], sharded_series["value"], key)
+            self.assertEqual([single["loops"][i] for i in single_series["loop"]], [sharded["loops"][i] for i in sharded_series["loop"]], key)
+
+
+class CheckMetricStoreTests(HeadlessTestCase):
+    def setUp(self):
+        super().setUp()
+        result = headlessctl.run_task(TASK_ID, use_cache=False)
+        self.assertTrue(result.ok, result.get("error"))
+        self.store_path = result["artifacts"]["metric_store"]
+
+    def test_readable_store_passes(self):
+        check = headlessctl.check_metric_store("metric_store:single", self.store_path)
+        self.assertEqual((check["name"], check["ok"], check["path"]), ("metric_store:single", True, self.store_path))
+
+    def test_truncated_column_fails(self):
+        value_path = os.path.join(self.store_path, "value.npy")
+        with open(value_path, "r+b") as handle:
+            handle.truncate(os.path.getsize(value_path) - 8)
+        self.assertFalse(headlessctl.check_metric_store("metric_store:single", self.store_path)["ok"])
+
+    def test_missing_manifest_fails(self):
+        os.remove(os.path.join(self.store_path, "manifest.json"))
+        check = headlessctl.check_metric_store("metric_store:single", self.store_path)
+        self.assertFalse(check["ok"])
+        self.assertIn("error", check)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fixtures import TASK_ID, HeadlessTestCase, default_tasks, headlessctl
+
+
+class SeedExceptionTests(HeadlessTestCase):
+    def test_raising_seed_cancels_the_rest(self):
+        calls = []
+        lock = threading.Lock()
+
+        def fake_run_task_internal(task_id, seed, pack_name, cancel_event=None, use_cache=True):
+            with lock:
+                calls.append(seed)
+            if seed == 1:
+                raise RuntimeError("boom")
+            cancelled = cancel_event.wait(5.0)
+            return headlessctl.build_error_result("cancelled" if cancelled else "none", None), 1
+
+        started = time.monotonic()
+        with mock.patch.object(headlessctl, "run_task_internal", fake_run_task_internal):
+            result, exit_code = headlessctl.run_task_multi(TASK_ID, [1, 2, 3, 4], None, default_tasks()[TASK_ID], slots=2)
+        self.assertLess(time.monotonic() - started, 4.0)
+        self.assertEqual((result["error_code"], exit_code), ("exception", 2))
+        self.assertIn("seed 1: boom", result["error"])
+        self.assertLess(len(calls), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import datetime
+import os
+import time
+import unittest
+
+from fixtures import StateDirTestCase, headlessctl
+
+
+def utc_ago(seconds):
+    moment = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=seconds)
+    return moment.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+
+class RunIndexTests(StateDirTestCase):
+    def index_rows(self, conn):
+        return {row["run_id"]: dict(row) for row in conn.execute("SELECT run_id, task_id, started_utc, ended_utc, ok, size_bytes FROM runs")}
+
+    def test_rebuild_from_runs_dir(self):
+        done_dir = self.write_run("done", {"task_id": "T.A", "ok": True, "ended_utc": "2026-01-02T00:00:00Z"}, payload_bytes=100)
+        partial_dir = self.write_run("partial", payload_bytes=50)
+        conn = headlessctl.open_run_index(self.state_dir)
+        try:
+            rows = self.index_rows(conn)
+            self.assertEqual(set(rows), {"done", "partial"})
+            self.assertEqual((rows["done"]["task_id"], rows["done"]["ok"]), ("T.A", 1))
+            self.assertEqual((rows["partial"]["task_id"], rows["partial"]["ended_utc"]), (None, None))
+            self.assertIsNotNone(rows["partial"]["started_utc"])
+            expected_total = headlessctl.run_dir_size(done_dir) + headlessctl.run_dir_size(partial_dir)
+            self.assertEqual(headlessctl.ledger_total(conn), expected_total)
+
+            conn.execute("DELETE FROM runs")
+            stats = headlessctl.rebuild_run_index(conn, self.state_dir)
+            self.assertEqual(stats, {"indexed": 2, "without_result": 1})
+            self.assertEqual(set(self.index_rows(conn)), {"done", "partial"})
+            self.assertEqual(headlessctl.ledger_total(conn), expected_total)
+        finally:
+            conn.close()
+
+    def test_old_schema_is_rebuilt(self):
+        self.write_run("done", {"task_id": "T.A", "ok": False})
+        conn = headlessctl.open_run_index(self.state_dir)
+        with conn:
+            conn.execute("UPDATE meta SET value = '1' WHERE key = 'schema_version'")
+            conn.execute("DELETE FROM runs")
+        conn.close()
+        conn = headlessctl.open_run_index(self.state_dir)
+        try:
+            self.assertEqual(set(self.index_rows(conn)), {"done"})
+            version = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()[0]
+            self.assertEqual(version, str(headlessctl.RUN_INDEX_SCHEMA_VERSION))
+        finally:
+            conn.close()
+
+
+class CleanupInFlightTests(StateDirTestCase):
+    def setUp(self):
+        super().setUp()
+        for index in range(3):
+            run_dir = self.write_run(f"r{index}")
+            headlessctl.write_run_result(self.state_dir, run_dir, {"run_id": f"r{index}", "task_id": "T.A", "ended_utc": f"2026-01-0{index + 1}T00:00:00Z"})
+
+    def start_run(self, run_id, started_utc=None):
+        self.write_run(run_id, payload_bytes=10)
+        headlessctl.index_run_started(self.state_dir, run_id, "T.A", "fixture")
+        if started_utc:
+            conn = headlessctl.open_run_index(self.state_dir)
+            try:
+                with conn:
+                    conn.execute("UPDATE runs SET started_utc = ? WHERE run_id = ?", (started_utc, run_id))
+            finally:
+                conn.close()
+
+    def remaining(self):
+        return sorted(os.listdir(os.path.join(self.state_dir, "runs")))
+
+    def test_running_run_survives_keep_per_task(self):
+        self.start_run("live")
+        removed = headlessctl.cleanup_runs(self.state_dir, None, 1, None)
+        self.assertEqual(sorted(removed), ["r0", "r1"])
+        self.assertEqual(self.remaining(), ["live", "r2"])
+
+    def test_running_run_survives_days_and_max_bytes(self):
+        self.start_run("live")
+        removed = headlessctl.cleanup_runs(self.state_dir, 0, None, 0)
+        self.assertEqual(sorted(removed), ["r0", "r1", "r2"])
+        self.assertEqual(self.remaining(), ["live"])
+
+    def test_finished_run_replaces_its_placeholder(self):
+        self.start_run("live")
+        headlessctl.write_run_result(self.state_dir, os.path.join(self.state_dir, "runs", "live"), {"run_id": "live", "task_id": "T.A", "ended_utc": "2026-01-04T00:00:00Z"})
+        removed = headlessctl.cleanup_runs(self.state_dir, None, 1, None)
+        self.assertEqual(sorted(removed), ["r0", "r1", "r2"])
+
+    def test_stale_placeholder_ages_by_start(self):
+        self.start_run("dead", "2025-12-31T00:00:00Z")
+        removed = headlessctl.cleanup_runs(self.state_dir, None, 2, None)
+        self.assertEqual(sorted(removed), ["dead", "r0"])
+
+    def test_stale_placeholder_expires(self):
+        self.start_run("dead", utc_ago(headlessctl.RUN_IN_FLIGHT_GRACE_SEC + 60))
+        removed = headlessctl.cleanup_runs(self.state_dir, 0, None, None)
+        self.assertIn("dead", removed)
+
+    def test_unindexed_dir_is_not_listed(self):
+        # cleanup reads only the index; reindex picks up stray dirs.
+        self.write_run("stray", payload_bytes=10)
+        old = time.time() - headlessctl.RUN_IN_FLIGHT_GRACE_SEC - 60
+        os.utime(os.path.join(self.state_dir, "runs", "stray"), (old, old))
+        headlessctl.cleanup_runs(self.state_dir, 0, None, None)
+        self.assertIn("stray", self.remaining())
+        headlessctl.reindex_command()
+        self.assertIn("stray", headlessctl.cleanup_runs(self.state_dir, 0, None, None))
+
+    def test_scan_fallback_skips_fresh_dirs(self):
+        self.write_run("fresh", payload_bytes=10)
+        removed = headlessctl.cleanup_runs_scan(self.state_dir, None, 0, None)
+        self.assertEqual(sorted(removed), ["r0", "r1", "r2"])
+        self.assertEqual(self.remaining(), ["fresh"])
+
+
+if __name__ == "__main__":
+    unittest.main()
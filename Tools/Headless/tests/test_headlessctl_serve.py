@@ -0,0 +1,55 @@
+import os
+import unittest
+
+from fixtures import StateDirTestCase, headlessctl
+
+
+class RunIndexPoolTests(StateDirTestCase):
+    def setUp(self):
+        super().setUp()
+        headlessctl.RUN_INDEX_POOLING.set()
+        self.addCleanup(headlessctl.close_run_index_pool)
+
+    def test_closed_connection_is_reused(self):
+        conn = headlessctl.open_run_index(self.state_dir)
+        conn.close()
+        again = headlessctl.open_run_index(self.state_dir)
+        self.assertIs(again, conn)
+        self.assertEqual(again.execute("SELECT COUNT(*) FROM runs").fetchone()[0], 0)
+        again.close()
+
+    def test_open_transaction_is_rolled_back(self):
+        self.write_run("r1", {"task_id": "T", "ok": True, "ended_utc": "2026-01-01T00:00:00Z"})
+        conn = headlessctl.open_run_index(self.state_dir)
+        conn.execute("DELETE FROM runs")
+        conn.close()
+        again = headlessctl.open_run_index(self.state_dir)
+        self.assertFalse(again.in_transaction)
+        self.assertEqual(again.execute("SELECT run_id FROM runs").fetchall()[0]["run_id"], "r1")
+        again.close()
+
+    def test_replaced_index_reconnects(self):
+        conn = headlessctl.open_run_index(self.state_dir)
+        conn.close()
+        for suffix in ("", "-wal", "-shm"):
+            path = headlessctl.run_index_path(self.state_dir) + suffix
+            if os.path.exists(path):
+                os.remove(path)
+        self.write_run("r2", {"task_id": "T", "ok": True, "ended_utc": "2026-01-01T00:00:00Z"})
+        again = headlessctl.open_run_index(self.state_dir)
+        self.assertIsNot(again, conn)
+        self.assertEqual(again.execute("SELECT run_id FROM runs").fetchall()[0]["run_id"], "r2")
+        again.close()
+
+    def test_closes_normally_without_serve(self):
+        headlessctl.close_run_index_pool()
+        conn = headlessctl.open_run_index(self.state_dir)
+        conn.close()
+        self.assertEqual(headlessctl.RUN_INDEX_POOL, {})
+        other = headlessctl.open_run_index(self.state_dir)
+        self.assertIsNot(other, conn)
+        other.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
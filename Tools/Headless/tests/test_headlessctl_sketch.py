@@ -0,0 +1,100 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from fixtures import PACK_NAME, TASK_ID, HeadlessTestCase, default_packs, headlessctl
+
+
+class MetricSketchTests(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.values = [rng.lognormvariate(0.0, 2.0) for _ in range(5000)] + [0.0, -3.5, -0.25]
+
+    def test_quantiles_within_relative_error(self):
+        sketch = headlessctl.MetricSketch()
+        for value in self.values:
+            sketch.add(value)
+        ordered = sorted(self.values)
+        for name, q in headlessctl.SKETCH_QUANTILES:
+            exact = ordered[int(round(q * (len(ordered) - 1)))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), abs(exact) * 0.011 + 1e-9, name)
+        self.assertEqual((sketch.count, sketch.min, sketch.max), (len(self.values), min(self.values), max(self.values)))
+
+    def test_merge_matches_single_pass(self):
+        whole = headlessctl.MetricSketch()
+        left = headlessctl.MetricSketch()
+        right = headlessctl.MetricSketch()
+        for index, value in enumerate(self.values):
+            whole.add(value)
+            (left if index < 1700 else right).add(value)
+        left.merge(headlessctl.MetricSketch.from_dict(json.loads(json.dumps(right.to_dict()))))
+        self.assertEqual(left.quantiles(), whole.quantiles())
+        self.assertEqual((left.positive, left.negative, left.zero), (whole.positive, whole.negative, whole.zero))
+        self.assertAlmostEqual(left.mean, whole.mean, places=9)
+        self.assertAlmostEqual(left.stdev(), whole.stdev(), places=9)
+
+    def test_bins_stay_bounded(self):
+        sketch = headlessctl.MetricSketch(max_bins=32)
+        for exponent in range(-200, 200):
+            sketch.add(10.0 ** (exponent / 10.0))
+        self.assertLessEqual(len(sketch.positive), 32)
+        self.assertLessEqual(abs(sketch.quantile(1.0) - sketch.max), sketch.max * 0.011)
+
+    def test_non_finite_only_reaches_moments(self):
+        sketch = headlessctl.MetricSketch()
+        for value in (1.0, float("inf"), 2.0):
+            sketch.add(value)
+        self.assertEqual((sketch.count, sketch.min, sketch.max), (3, 1.0, 2.0))
+        self.assertEqual(sum(sketch.positive.values()), 2)
+
+
+class ScannerSketchTests(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="headlessctl-sketch-")
+        self.telemetry_path = os.path.join(self.work_dir, "telemetry.ndjson")
+        rng = random.Random(3)
+        with open(self.telemetry_path, "w", encoding="utf-8") as handle:
+            for tick in range(4000):
+                handle.write(json.dumps({"type": "metric", "tick": tick, "key": "m.a", "value": rng.uniform(0.0, 100.0)}) + "\n")
+                handle.write(json.dumps({"type": "metric", "tick": tick, "key": "m.b", "value": tick % 7}) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def scan(self, shards):
+        run_dir = os.path.join(self.work_dir, f"run{shards}")
+        os.makedirs(run_dir)
+        return headlessctl.scan_telemetry(self.telemetry_path, run_dir, {}, shards=shards), run_dir
+
+    def test_sharded_scan_merges_shard_sketches(self):
+        single, single_dir = self.scan(1)
+        sharded, sharded_dir = self.scan(3)
+        for key in ("m.a", "m.b"):
+            for field in ("count", "min", "max", "p50", "p90", "p95", "p99", "last"):
+                self.assertEqual(single["metrics_stats"][key][field], sharded["metrics_stats"][key][field], f"{key}.{field}")
+            self.assertAlmostEqual(single["metrics_stats"][key]["mean"], sharded["metrics_stats"][key]["mean"], places=9)
+        sidecars = [headlessctl.load_metric_sketches(os.path.join(path, headlessctl.METRIC_STORE_DIRNAME)) for path in (single_dir, sharded_dir)]
+        self.assertEqual(sidecars[0]["m.b"]["positive"], sidecars[1]["m.b"]["positive"])
+        self.assertEqual(sidecars[0]["m.a"]["count"], 4000)
+
+
+class SeedSketchMergeTests(HeadlessTestCase):
+    def test_merge_reads_sidecar_from_run_dir(self):
+        packs = default_packs()
+        packs[PACK_NAME]["artifacts_include"] = ["stdout"]
+        self.write_registry(packs=packs)
+        result = headlessctl.run_task(TASK_ID, seeds=[1, 2], use_cache=False)
+        self.assertTrue(result.ok, result.get("error"))
+        self.assertNotIn("metrics_sketches", result)
+        samples = result["metrics_stats"]["m.a"]["samples"]
+        self.assertEqual(samples["count"], 40)
+        self.assertIsNotNone(samples["p99"])
+        parent_sidecar = headlessctl.load_metric_sketches(os.path.join(self.state_dir, "runs", result["run_id"], headlessctl.METRIC_STORE_DIRNAME))
+        self.assertEqual(parent_sidecar["m.a"]["count"], 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
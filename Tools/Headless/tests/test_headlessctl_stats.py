@@ -0,0 +1,162 @@
+import math
+import unittest
+from unittest import mock
+
+from fixtures import StateDirTestCase, headlessctl
+
+
+def t_two_sided_p(t, df):
+    return headlessctl.regularized_beta(df / 2.0, 0.5, df / (df + t * t))
+
+
+class RegularizedBetaTests(unittest.TestCase):
+    def test_closed_forms(self):
+        # I_x(a, 1) = x^a and I_x(1, b) = 1 - (1 - x)^b.
+        self.assertAlmostEqual(headlessctl.regularized_beta(3.0, 1.0, 0.4), 0.4 ** 3, places=12)
+        self.assertAlmostEqual(headlessctl.regularized_beta(1.0, 4.0, 0.3), 1.0 - 0.7 ** 4, places=12)
+        self.assertAlmostEqual(headlessctl.regularized_beta(2.0, 3.0, 0.5), 0.6875, places=12)
+
+    def test_bounds(self):
+        self.assertEqual(headlessctl.regularized_beta(2.0, 2.0, 0.0), 0.0)
+        self.assertEqual(headlessctl.regularized_beta(2.0, 2.0, 1.0), 1.0)
+
+
+class StudentTTests(unittest.TestCase):
+    def test_tabulated_critical_values(self):
+        # Two-sided 5% and 1% critical values from a standard t table.
+        for t, df, p in ((12.706, 1, 0.05), (4.303, 2, 0.05), (2.228, 10, 0.05), (2.042, 30, 0.05), (3.169, 10, 0.01)):
+            self.assertAlmostEqual(t_two_sided_p(t, df), p, places=4, msg=f"t={t} df={df}")
+
+    def test_exact_small_df(self):
+        # df=1 is Cauchy; df=2 has a closed-form CDF.
+        self.assertAlmostEqual(t_two_sided_p(2.0, 1), 1.0 - 2.0 / math.pi * math.atan(2.0), places=10)
+        self.assertAlmostEqual(t_two_sided_p(2.0, 2), 1.0 - 2.0 / math.sqrt(6.0), places=10)
+
+    def test_welch_matches_reference(self):
+        # R: t.test(c(2, 4, 6, 8, 10), 1:5) gives t=1.8974, df=5.8824, p=0.1075.
+        t, df, p = headlessctl.welch_t_test(3.0, 2.5, 5, 6.0, 10.0, 5)
+        self.assertAlmostEqual(t, 1.897367, places=5)
+        self.assertAlmostEqual(df, 5.882353, places=5)
+        self.assertAlmostEqual(p, 0.107531, places=5)
+
+    def test_welch_zero_variance(self):
+        self.assertEqual(headlessctl.welch_t_test(4.0, 0.0, 3, 4.0, 0.0, 3), (None, None, 1.0))
+        self.assertEqual(headlessctl.welch_t_test(4.0, 0.0, 3, 5.0, 0.0, 3), (None, None, 0.0))
+
+
+class MannWhitneyTests(unittest.TestCase):
+    def test_counts(self):
+        self.assertEqual(headlessctl.mann_whitney_counts(2, 2), (1, 1, 2, 1, 1))
+        counts = headlessctl.mann_whitney_counts(4, 3)
+        self.assertEqual(sum(counts), math.comb(7, 3))
+        self.assertEqual(counts, tuple(reversed(counts)))
+
+    def test_exact_small_groups(self):
+        self.assertEqual(headlessctl.mann_whitney_u([1.0, 2.0], [3.0, 4.0]), (4.0, 2.0 / 6.0, "exact"))
+        self.assertEqual(headlessctl.mann_whitney_u([1.0, 2.0, 3.0], [4.0, 5.0, 6.0]), (9.0, 0.1, "exact"))
+        u, p, method = headlessctl.mann_whitney_u([4.0, 5.0, 6.0], [1.0, 2.0, 3.0])
+        self.assertEqual((u, method), (0.0, "exact"))
+        self.assertAlmostEqual(p, 0.1)
+        # Complete separation of 8 vs 8: p = 2 / C(16, 8).
+        u, p, method = headlessctl.mann_whitney_u([float(value) for value in range(8)], [float(value) for value in range(8, 16)])
+        self.assertEqual((u, method), (64.0, "exact"))
+        self.assertAlmostEqual(p, 2.0 / math.comb(16, 8), places=12)
+
+    def test_ties(self):
+        # U counts ties as half; the tie-corrected variance is
+        # 9/12 * (7 - 24/30) = 4.65, so z = (3.5 - 0.5) / sqrt(4.65).
+        u, p, method = headlessctl.mann_whitney_u([1.0, 2.0, 2.0], [2.0, 3.0, 4.0])
+        self.assertEqual((u, method), (8.0, "normal"))
+        self.assertAlmostEqual(p, math.erfc(3.0 / math.sqrt(4.65) / math.sqrt(2.0)), places=12)
+        self.assertAlmostEqual(p, 0.16416, places=5)
+
+    def test_all_tied(self):
+        self.assertEqual(headlessctl.mann_whitney_u([1.0, 1.0], [1.0, 1.0]), (2.0, 1.0, "normal"))
+
+
+class PercentileTests(unittest.TestCase):
+    def test_linear_interpolation(self):
+        values = [1.0, 2.0, 3.0, 4.0]
+        self.assertEqual(headlessctl.percentile(values, 0), 1.0)
+        self.assertEqual(headlessctl.percentile(values, 100), 4.0)
+        self.assertAlmostEqual(headlessctl.percentile(values, 50), 2.5)
+        self.assertAlmostEqual(headlessctl.percentile(values, 25), 1.75)
+
+
+class BootstrapTests(unittest.TestCase):
+    # Rows are runs, columns keys; None marks a run without the key.
+    SAMPLES_A = [[float(value), 1.0] for value in range(1, 11)]
+    SAMPLES_B = [[float(value) + 2.0, 1.0 if value % 2 else None] for value in range(1, 11)]
+
+    def check_backend(self, backend):
+        intervals, used = headlessctl.bootstrap_mean_diff(self.SAMPLES_A, self.SAMPLES_B, 0.05, 4000, 11)
+        self.assertEqual(used, backend)
+        low, high = intervals[0]
+        # mean(b) - mean(a) is 2; the run means have a standard error of ~1.3.
+        self.assertLess(low, 2.0)
+        self.assertGreater(high, 2.0)
+        self.assertAlmostEqual(low, 2.0 - 1.96 * math.sqrt(2 * 8.25 / 10), delta=0.4)
+        self.assertAlmostEqual(high, 2.0 + 1.96 * math.sqrt(2 * 8.25 / 10), delta=0.4)
+        self.assertEqual(intervals[1], (0.0, 0.0))
+        return intervals
+
+    def test_python_backend(self):
+        with mock.patch.object(headlessctl, "lazy_import_numpy", return_value=None):
+            self.check_backend("python")
+
+    @unittest.skipUnless(headlessctl.lazy_import_numpy(), "numpy not installed")
+    def test_numpy_backend_matches_python(self):
+        numpy_intervals = self.check_backend("numpy")
+        with mock.patch.object(headlessctl, "lazy_import_numpy", return_value=None):
+            python_intervals, _ = headlessctl.bootstrap_mean_diff(self.SAMPLES_A, self.SAMPLES_B, 0.05, 4000, 11)
+        for (numpy_low, numpy_high), (python_low, python_high) in zip(numpy_intervals, python_intervals):
+            self.assertAlmostEqual(numpy_low, python_low, delta=0.25)
+            self.assertAlmostEqual(numpy_high, python_high, delta=0.25)
+
+    @unittest.skipUnless(headlessctl.lazy_import_numpy(), "numpy not installed")
+    def test_numpy_constant_groups(self):
+        intervals, backend = headlessctl.bootstrap_mean_diff([[5.0]] * 3, [[7.0]] * 3, 0.05, 200, 1)
+        self.assertEqual((intervals, backend), ([(2.0, 2.0)], "numpy"))
+
+
+class DiffRunsTests(StateDirTestCase):
+    def write_group(self, prefix, values):
+        run_ids = []
+        for index, value in enumerate(values):
+            run_id = f"{prefix}{index}"
+            self.write_run(run_id, {"task_id": "T.DIFF", "metrics_summary": {"m": value}})
+            run_ids.append(run_id)
+        return ",".join(run_ids)
+
+    def test_insufficient_samples(self):
+        group_a = self.write_group("a", [1.0])
+        group_b = self.write_group("b", [2.0, 3.0])
+        result = headlessctl.diff_runs(group_a, group_b, resamples=50)
+        self.assertTrue(result.ok)
+        entry = result["keys"]["m"]
+        self.assertEqual(entry["note"], "insufficient_samples")
+        self.assertEqual((entry["n_a"], entry["n_b"], entry["significant"]), (1, 2, False))
+        self.assertNotIn("welch", entry)
+
+    def test_zero_variance(self):
+        group_a = self.write_group("a", [5.0, 5.0, 5.0])
+        group_same = self.write_group("s", [5.0, 5.0, 5.0])
+        group_up = self.write_group("u", [7.0, 7.0, 7.0])
+
+        same = headlessctl.diff_runs(group_a, group_same, resamples=50)["keys"]["m"]
+        self.assertEqual(same["welch"], {"t": None, "df": None, "p": 1.0})
+        self.assertIsNone(same["hedges_g"])
+        self.assertEqual((same["significant"], same["direction"]), (False, "none"))
+
+        up = headlessctl.diff_runs(group_a, group_up, resamples=50)["keys"]["m"]
+        self.assertEqual(up["welch"]["p"], 0.0)
+        self.assertEqual(up["ci"], [2.0, 2.0])
+        self.assertEqual((up["significant"], up["direction"]), (True, "increase"))
+
+    def test_missing_run(self):
+        result = headlessctl.diff_runs("nope", "nope")
+        self.assertEqual((result.ok, result["error_code"], result.exit_code), (False, "run_not_found", 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
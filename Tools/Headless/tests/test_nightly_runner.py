@@ -0,0 +1,144 @@
+import os
+import subprocess
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fixtures import headlessctl  # noqa: F401  (puts Tools/Headless on sys.path)
+
+import nightly_runner  # noqa: E402
+
+
+class RunTasksConcurrentlyTests(unittest.TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.log = []
+        self.durations = {}
+        self.failing = set()
+        self.hooks = {}
+        patches = [
+            mock.patch.object(nightly_runner, "start_task", self.fake_start_task),
+            mock.patch.object(nightly_runner, "finish_task", self.fake_finish_task)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def record(self, event, task_id):
+        with self.lock:
+            self.log.append((event, task_id))
+
+    def fake_start_task(self, task_id):
+        self.record("start", task_id)
+        hook = self.hooks.get(task_id)
+        if hook:
+            hook()
+        time.sleep(self.durations.get(task_id, 0.0))
+        self.record("end", task_id)
+        return {"ok": task_id not in self.failing, "run_id": f"run-{task_id}", "exit_code": 0}, 0
+
+    def fake_finish_task(self, state_dir, artifact_dir, task_id, run_result, timings):
+        return {"task_id": task_id, "run_id": run_result["run_id"], "timings": timings}
+
+    def run_all(self, gate_ids, task_ids, projects, slots=4, project_slots=None):
+        task_data = {task_id: {"project": projects.get(task_id, "space4x")} for task_id in gate_ids + task_ids}
+        plan = {task_id: {"estimate_s": 1.0} for task_id in task_ids}
+        return nightly_runner.run_tasks_concurrently("state", "artifacts", gate_ids, task_ids, task_data, plan, slots, project_slots or {})
+
+    def test_gates_finish_before_tasks_start(self):
+        self.durations.update({"G1": 0.05, "G2": 0.15})
+        gate_runs, run_entries, cancelled = self.run_all(["G1", "G2"], ["T1", "T2", "T3"], {})
+        last_gate_end = max(self.log.index(("end", gate)) for gate in ("G1", "G2"))
+        first_task_start = min(self.log.index(("start", task)) for task in ("T1", "T2", "T3"))
+        self.assertLess(last_gate_end, first_task_start)
+        self.assertEqual([entry["task_id"] for entry in gate_runs], ["G1", "G2"])
+        self.assertEqual(len(run_entries), 3)
+        self.assertEqual(cancelled, [])
+
+    def test_red_gate_cancels_every_task(self):
+        self.failing.add("G2")
+        self.durations["G1"] = 0.05
+        gate_runs, run_entries, cancelled = self.run_all(["G1", "G2"], ["T1", "T2", "T3"], {})
+        self.assertEqual([(entry["task_id"], entry["ok"]) for entry in gate_runs], [("G1", True), ("G2", False)])
+        self.assertEqual(run_entries, [])
+        self.assertEqual(cancelled, ["T1", "T2", "T3"])
+        self.assertFalse([task_id for event, task_id in self.log if task_id.startswith("T")])
+
+    def test_project_at_limit_does_not_block_other_projects(self):
+        other_started = threading.Event()
+        seen = {}
+        self.hooks["B1"] = other_started.set
+        self.hooks["A1"] = lambda: seen.setdefault("other_started", other_started.wait(5.0))
+        projects = {"A1": "godgame", "A2": "godgame", "B1": "space4x"}
+        _, run_entries, cancelled = self.run_all([], ["A1", "A2", "B1"], projects, slots=2, project_slots={"godgame": 1})
+        self.assertTrue(seen["other_started"])
+        self.assertLess(self.log.index(("start", "B1")), self.log.index(("start", "A2")))
+        self.assertLess(self.log.index(("end", "A1")), self.log.index(("start", "A2")))
+        self.assertEqual([entry["task_id"] for entry in run_entries], ["A1", "A2", "B1"])
+        self.assertEqual(cancelled, [])
+
+    def test_run_entries_keep_queue_order(self):
+        task_ids = ["T1", "T2", "T3", "T4"]
+        self.durations.update({"T1": 0.2, "T2": 0.15, "T3": 0.1, "T4": 0.0})
+        _, run_entries, _ = self.run_all([], task_ids, {})
+        finished = [task_id for event, task_id in self.log if event == "end"]
+        self.assertEqual(finished, ["T4", "T3", "T2", "T1"])
+        self.assertEqual([entry["task_id"] for entry in run_entries], task_ids)
+        self.assertEqual([entry["run_id"] for entry in run_entries], [f"run-{task_id}" for task_id in task_ids])
+
+
+class ServerFallbackTests(unittest.TestCase):
+    class MismatchClient:
+        def __init__(self):
+            self.requests = 0
+            self.closed = False
+
+        def request(self, args):
+            self.requests += 1
+            return {"exit_code": 2, "result": {"ok": False, "error_code": "context_mismatch"}, "log": []}
+
+        def close(self):
+            self.closed = True
+
+    def setUp(self):
+        self.clients = []
+        self.saved_env = {name: os.environ.get(name) for name in ("NIGHTLY_HEADLESSCTL", "HEADLESSCTL_NO_SERVER")}
+        os.environ["NIGHTLY_HEADLESSCTL"] = "server"
+        os.environ.pop("HEADLESSCTL_NO_SERVER", None)
+        nightly_runner.SERVER_MISMATCH.clear()
+        nightly_runner.SERVER_CLIENTS.client = None
+        completed = subprocess.CompletedProcess([], 0, stdout='{"ok": true, "run_id": null}\n')
+        connect_patch = mock.patch.object(nightly_runner.headlessctl_client, "connect", self.connect)
+        run_patch = mock.patch.object(nightly_runner.subprocess, "run", return_value=completed)
+        connect_patch.start()
+        self.subprocess_run = run_patch.start()
+        self.addCleanup(connect_patch.stop)
+        self.addCleanup(run_patch.stop)
+
+    def tearDown(self):
+        nightly_runner.SERVER_MISMATCH.clear()
+        nightly_runner.SERVER_CLIENTS.client = None
+        for name, value in self.saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    def connect(self):
+        client = self.MismatchClient()
+        self.clients.append(client)
+        return client
+
+    def test_context_mismatch_is_remembered(self):
+        for _ in range(3):
+            result, exit_code = nightly_runner.run_headlessctl(["list_tasks"])
+            self.assertEqual((result["ok"], exit_code), (True, 0))
+        self.assertEqual(len(self.clients), 1)
+        self.assertEqual(self.clients[0].requests, 1)
+        self.assertTrue(self.clients[0].closed)
+        self.assertEqual(self.subprocess_run.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()